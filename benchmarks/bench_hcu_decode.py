@@ -0,0 +1,40 @@
+"""Compares the legacy strip + json.loads + validate_python decode path with MessageDecoder.
+
+Run with `poetry run python -m benchmarks.bench_hcu_decode`.
+"""
+import json
+import time
+
+from msu_manager.hcu.messages import MessageDecoder, validate_python_message
+
+PAYLOADS = {
+    'HEARTBEAT': b'{"command": "HEARTBEAT", "version": "0.0.3"}\n',
+    'SHUTDOWN': b'{"command": "SHUTDOWN"}',
+    'LOG (distinct values)': [f'{{"command": "LOG", "key": "temperature", "value": "{i / 10}"}}'.encode() for i in range(1000)],
+}
+
+
+def legacy_decode(data: bytes):
+    return validate_python_message(json.loads(data.strip()))
+
+
+def measure(decode, payloads, iterations: int) -> float:
+    if isinstance(payloads, bytes):
+        payloads = [payloads]
+    n = len(payloads)
+    start = time.perf_counter()
+    for i in range(iterations):
+        decode(payloads[i % n])
+    return iterations / (time.perf_counter() - start)
+
+
+def main(iterations: int = 200_000):
+    print(f'{"payload":<24}{"legacy dgram/s":>16}{"decoder dgram/s":>18}{"speedup":>10}')
+    for name, payloads in PAYLOADS.items():
+        legacy = measure(legacy_decode, payloads, iterations)
+        decoder = measure(MessageDecoder().decode, payloads, iterations)
+        print(f'{name:<24}{legacy:>16,.0f}{decoder:>18,.0f}{decoder / legacy:>9.1f}x')
+
+
+if __name__ == '__main__':
+    main()
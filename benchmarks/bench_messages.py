@@ -0,0 +1,37 @@
+"""Microbenchmarks for the message validation helpers in msu_manager.hcu.messages and the binary
+wire format in msu_manager.hcu.binary (decoding the same messages).
+
+Run with `poetry run python -m benchmarks.bench_messages`.
+"""
+import json
+import timeit
+from typing import Dict
+
+from msu_manager.hcu.binary import decode_binary, encode_binary
+from msu_manager.hcu.messages import (validate_json_message,
+                                      validate_python_message)
+
+from .common import PAYLOADS
+
+
+def run_message_benchmarks(number: int = 50_000, repeat: int = 5) -> Dict:
+    results = {}
+    for name in ('HEARTBEAT', 'LOG', 'SHUTDOWN'):
+        raw = PAYLOADS[name](1)
+        as_dict = json.loads(raw)
+        binary = encode_binary(validate_json_message(raw))
+        for helper, func, arg in (('validate_json_message', validate_json_message, raw),
+                                  ('validate_python_message', validate_python_message, as_dict),
+                                  ('decode_binary', decode_binary, binary)):
+            best = min(timeit.repeat(lambda: func(arg), number=number, repeat=repeat))
+            results[f'{helper}[{name}]'] = {'ns_per_call': best / number * 1e9, 'calls_s': number / best}
+    return results
+
+
+def main():
+    for name, result in run_message_benchmarks().items():
+        print(f'{name:<40}{result["ns_per_call"]:>10.0f} ns{result["calls_s"]:>14,.0f} /s')
+
+
+if __name__ == '__main__':
+    main()
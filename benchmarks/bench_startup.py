@@ -0,0 +1,50 @@
+"""Compares import time and RSS of the FastAPI entry point with the lean agent entry point.
+
+Run with `poetry run python -m benchmarks.bench_startup`.
+"""
+import json
+import subprocess
+import sys
+from typing import Dict
+
+_PROBE = '''
+import json, sys, time
+start = time.perf_counter()
+import {module}
+elapsed = time.perf_counter() - start
+rss = next(int(l.split()[1]) for l in open('/proc/self/status') if l.startswith('VmRSS:'))
+print(json.dumps({{'import_ms': elapsed * 1000, 'rss_kb': rss, 'http_stack_loaded': 'fastapi' in sys.modules}}))
+'''
+
+ENTRY_POINTS = {
+    'fastapi (msu_manager.main)': 'msu_manager.main',
+    'agent (msu_manager.agent)': 'msu_manager.agent',
+}
+
+
+def measure(module: str, repeat: int = 5) -> Dict:
+    """Best of `repeat` fresh interpreters, so the measurement includes all transitive imports."""
+    runs = []
+    for _ in range(repeat):
+        out = subprocess.run([sys.executable, '-c', _PROBE.format(module=module)], capture_output=True, text=True, check=True,
+                             env={'SETTINGS_FILE': '/nonexistent.yaml', 'PATH': ''})
+        runs.append(json.loads(out.stdout.strip().splitlines()[-1]))
+    return {
+        'import_ms': min(r['import_ms'] for r in runs),
+        'rss_kb': min(r['rss_kb'] for r in runs),
+        'http_stack_loaded': runs[0]['http_stack_loaded'],
+    }
+
+
+def run_startup_benchmarks(repeat: int = 5) -> Dict:
+    return {name: measure(module, repeat) for name, module in ENTRY_POINTS.items()}
+
+
+def main():
+    print(f'{"entry point":<30}{"import ms":>12}{"RSS MiB":>10}  fastapi loaded')
+    for name, result in run_startup_benchmarks().items():
+        print(f'{name:<30}{result["import_ms"]:>12.0f}{result["rss_kb"] / 1024:>10.1f}  {result["http_stack_loaded"]}')
+
+
+if __name__ == '__main__':
+    main()
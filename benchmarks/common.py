@@ -0,0 +1,60 @@
+import os
+import random
+import resource
+from typing import Dict, List, Sequence
+
+PAYLOADS = {
+    'HEARTBEAT': lambda i: b'{"command": "HEARTBEAT", "version": "0.0.3"}',
+    'LOG': lambda i: f'{{"command": "LOG", "key": "temperature", "value": "{20 + (i % 100) / 10}"}}'.encode(),
+    'SHUTDOWN': lambda i: b'{"command": "SHUTDOWN"}',
+    'RESUME': lambda i: b'{"command": "RESUME"}',
+    'MALFORMED': lambda i: b'{"command": "HEARTBEAT", "version": ' if i % 2 else b'{"command": "REBOOT"}',
+}
+
+DEFAULT_MIX = {'HEARTBEAT': 50, 'LOG': 40, 'SHUTDOWN': 2, 'RESUME': 2, 'MALFORMED': 6}
+
+
+def parse_mix(spec: str) -> Dict[str, int]:
+    """Parses e.g. `HEARTBEAT=50,LOG=40,MALFORMED=10`."""
+    mix = {}
+    for part in spec.split(','):
+        name, weight = part.split('=')
+        name = name.strip().upper()
+        if name not in PAYLOADS:
+            raise ValueError(f'Unknown message type {name}, expected one of {", ".join(PAYLOADS)}')
+        mix[name] = int(weight)
+    return mix
+
+
+def generate_payloads(mix: Dict[str, int], count: int, seed: int = 42) -> List[bytes]:
+    rng = random.Random(seed)
+    names = rng.choices(list(mix), weights=list(mix.values()), k=count)
+    return [PAYLOADS[name](i) for i, name in enumerate(names)]
+
+
+def percentile(samples: Sequence[float], p: float) -> float:
+    if not samples:
+        return float('nan')
+    ordered = sorted(samples)
+    index = min(len(ordered) - 1, max(0, round(p / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+
+def latency_summary(samples_s: Sequence[float]) -> Dict[str, float]:
+    return {
+        'p50_us': percentile(samples_s, 50) * 1e6,
+        'p99_us': percentile(samples_s, 99) * 1e6,
+        'max_us': max(samples_s) * 1e6 if samples_s else float('nan'),
+    }
+
+
+def rss_kb() -> int:
+    """Current resident set size (falls back to peak RSS where /proc is unavailable)."""
+    try:
+        with open(f'/proc/{os.getpid()}/status') as f:
+            for line in f:
+                if line.startswith('VmRSS:'):
+                    return int(line.split()[1])
+    except OSError:
+        pass
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
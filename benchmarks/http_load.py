@@ -0,0 +1,116 @@
+"""Sends HCU commands to POST /hcu-controller/command of a real uvicorn server on loopback, or with
+`--batch-size` as NDJSON batches to POST /hcu-controller/commands.
+
+Run with `poetry run python -m benchmarks.http_load --count 5000 --concurrency 8 [--batch-size 100]`.
+"""
+import argparse
+import asyncio
+import json
+import logging
+import os
+import socket
+import tempfile
+import time
+from typing import Dict, List
+
+import httpx
+import uvicorn
+
+from .common import (DEFAULT_MIX, generate_payloads, latency_summary,
+                     parse_mix, rss_kb)
+
+_SETTINGS = '''
+log_level: ERROR
+hcu_controller:
+  enabled: true
+  udp_bind_address: 127.0.0.1
+  udp_listen_port: 0
+  shutdown_delay_s: 3600
+  shutdown_command: ['true']
+'''
+
+
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+async def run_http_load(count: int = 5_000, mix: Dict[str, int] = DEFAULT_MIX, concurrency: int = 8, batch_size: int = 0) -> Dict:
+    payloads = generate_payloads(mix, count)
+    if batch_size:
+        path, content_type = '/hcu-controller/commands', 'application/x-ndjson'
+        payloads = [b'\n'.join(payloads[i:i + batch_size]) for i in range(0, count, batch_size)]
+    else:
+        path, content_type = '/hcu-controller/command', 'application/json'
+
+    with tempfile.NamedTemporaryFile('w', suffix='.yaml', delete=False) as settings:
+        settings.write(_SETTINGS)
+    os.environ['SETTINGS_FILE'] = settings.name
+    from msu_manager.main import app
+
+    port = _free_port()
+    server = uvicorn.Server(uvicorn.Config(app, host='127.0.0.1', port=port, log_level='warning', access_log=False))
+    server_task = asyncio.create_task(server.serve())
+    while not server.started:
+        await asyncio.sleep(0.01)
+
+    latencies: List[float] = []
+    statuses: Dict[int, int] = {}
+    item_results: Dict[str, int] = {}
+    queue = asyncio.Queue()
+    for payload in payloads:
+        queue.put_nowait(payload)
+
+    async def worker(client: httpx.AsyncClient):
+        while not queue.empty():
+            payload = queue.get_nowait()
+            start = time.perf_counter()
+            response = await client.post(path, content=payload, headers={'Content-Type': content_type})
+            latencies.append(time.perf_counter() - start)
+            statuses[response.status_code] = statuses.get(response.status_code, 0) + 1
+            if batch_size and response.status_code == 200:
+                for result in response.json()['results']:
+                    item_results[result['status']] = item_results.get(result['status'], 0) + 1
+
+    rss_before = rss_kb()
+    async with httpx.AsyncClient(base_url=f'http://127.0.0.1:{port}', limits=httpx.Limits(max_keepalive_connections=concurrency)) as client:
+        start = time.perf_counter()
+        await asyncio.gather(*(worker(client) for _ in range(concurrency)))
+        elapsed = time.perf_counter() - start
+    rss_after = rss_kb()
+
+    server.should_exit = True
+    await server_task
+    os.unlink(settings.name)
+
+    result = {
+        'requests': len(payloads),
+        'concurrency': concurrency,
+        'status_codes': {str(k): v for k, v in sorted(statuses.items())},
+        'elapsed_s': elapsed,
+        'throughput_req_s': len(payloads) / elapsed,
+        'throughput_msg_s': count / elapsed,
+        'request_latency': latency_summary(latencies),
+        'rss_growth_kb': rss_after - rss_before,
+    }
+    if batch_size:
+        result['batch_size'] = batch_size
+        result['item_results'] = item_results
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--count', type=int, default=5_000)
+    parser.add_argument('--mix', type=parse_mix, default=DEFAULT_MIX)
+    parser.add_argument('--concurrency', type=int, default=8)
+    parser.add_argument('--batch-size', type=int, default=0, help='commands per request to the batch endpoint (0 = single command endpoint)')
+    args = parser.parse_args()
+
+    logging.getLogger().setLevel(logging.ERROR)
+    print(json.dumps(asyncio.run(run_http_load(args.count, args.mix, args.concurrency, args.batch_size)), indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,129 @@
+"""Runs the full benchmark suite and stores the results as JSON for comparison between releases.
+
+    poetry run python -m benchmarks.run --output bench-1.0.0.json
+    poetry run python -m benchmarks.run --output bench-new.json --compare bench-1.0.0.json
+"""
+import argparse
+import asyncio
+import json
+import logging
+import platform
+import subprocess
+import sys
+import time
+import tomllib
+from pathlib import Path
+from typing import Dict, Iterator, Tuple
+
+from msu_manager.hcu import SourceLimiter
+
+from .bench_messages import run_message_benchmarks
+from .bench_startup import run_startup_benchmarks
+from .common import DEFAULT_MIX, parse_mix
+from .http_load import run_http_load
+from .udp_load import run_udp_load
+from .udp_scaling import run_udp_scaling
+
+# Metrics where a larger value is better; all other numeric leaves are lower-is-better
+_HIGHER_IS_BETTER = ('throughput', 'calls_s', 'speedup')
+# Leaves that are informational only
+_IGNORED = ('sent', 'received', 'dispatched', 'requests', 'concurrency', 'elapsed_s', 'status_codes', 'queue_dropped', 'socket_dropped', 'http_stack_loaded',
+            'workers', 'cpu_count', 'throttled', 'batch_size', 'item_results')
+
+
+def _version() -> str:
+    pyproject = Path(__file__).parent.parent / 'pyproject.toml'
+    with open(pyproject, 'rb') as f:
+        return tomllib.load(f)['tool']['poetry']['version']
+
+
+def _git_revision() -> str:
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return 'unknown'
+
+
+def _leaves(results: Dict, prefix: str = '') -> Iterator[Tuple[str, float]]:
+    for key, value in results.items():
+        if key in _IGNORED:
+            continue
+        path = f'{prefix}.{key}' if prefix else key
+        if isinstance(value, dict):
+            yield from _leaves(value, path)
+        elif isinstance(value, (int, float)):
+            yield path, value
+
+
+def compare(baseline: Dict, current: Dict, threshold: float) -> bool:
+    """Prints relative changes and returns False if any metric regressed by more than `threshold`."""
+    old = dict(_leaves(baseline['results']))
+    ok = True
+    print(f'Comparing against {baseline["version"]} ({baseline["git_revision"]})')
+    for path, value in _leaves(current['results']):
+        if path not in old or not old[path]:
+            continue
+        change = (value - old[path]) / abs(old[path])
+        higher_is_better = any(marker in path for marker in _HIGHER_IS_BETTER)
+        regression = -change if higher_is_better else change
+        # RSS growth and maximum latencies are too noisy for relative comparisons
+        noisy = 'rss' in path or path.endswith('max_us')
+        flag = 'REGRESSION' if regression > threshold and not noisy else ''
+        ok &= not flag
+        print(f'{path:<60}{old[path]:>14.1f}{value:>14.1f}{change:>+9.1%}  {flag}')
+    return ok
+
+
+async def run_all(args) -> Dict:
+    results = {
+        'startup': run_startup_benchmarks(),
+        'messages': run_message_benchmarks(),
+        'udp': await run_udp_load(args.udp_count, args.mix),
+        # A single looping HCU; the rate limiter should keep the event loop responsive
+        'udp_flood': await run_udp_load(args.udp_count, {'SHUTDOWN': 1}, limiter=SourceLimiter()),
+        'http': await run_http_load(args.http_count, args.mix, args.concurrency),
+        'http_batch': await run_http_load(args.http_count, args.mix, args.concurrency, args.http_batch_size),
+    }
+    if args.udp_workers:
+        results['udp_scaling'] = await run_udp_scaling(args.udp_count, args.mix, args.udp_workers)
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--output', type=Path, help='write results to this JSON file')
+    parser.add_argument('--compare', type=Path, help='baseline JSON file to compare against')
+    parser.add_argument('--threshold', type=float, default=0.15, help='relative change that counts as regression')
+    parser.add_argument('--mix', type=parse_mix, default=DEFAULT_MIX)
+    parser.add_argument('--udp-count', type=int, default=50_000)
+    parser.add_argument('--http-count', type=int, default=5_000)
+    parser.add_argument('--concurrency', type=int, default=8)
+    parser.add_argument('--http-batch-size', type=int, default=100)
+    parser.add_argument('--udp-workers', type=lambda value: [int(n) for n in value.split(',')],
+                        help='also run the multi-process ingest scaling test for these worker counts, e.g. 1,2,4')
+    args = parser.parse_args()
+
+    logging.getLogger().setLevel(logging.ERROR)
+    report = {
+        'version': _version(),
+        'git_revision': _git_revision(),
+        'timestamp': time.time(),
+        'python': sys.version.split()[0],
+        'platform': platform.platform(),
+        'machine': platform.machine(),
+        'mix': args.mix,
+        'results': asyncio.run(run_all(args)),
+    }
+
+    if args.output:
+        args.output.write_text(json.dumps(report, indent=2))
+        print(f'Results written to {args.output}')
+    else:
+        print(json.dumps(report, indent=2))
+
+    if args.compare and not compare(json.loads(args.compare.read_text()), report, args.threshold):
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,134 @@
+"""Replays a mix of HCU datagrams against a real HcuProtocol endpoint on loopback.
+
+Run with `poetry run python -m benchmarks.udp_load --count 100000 --mix HEARTBEAT=50,LOG=50`.
+`--limit` enables the per-source rate limiter, e.g. `--mix SHUTDOWN=1 --limit` for a looping HCU.
+Event loop lag is sampled during the run as a stand-in for the latency other tasks (uplink monitor,
+HTTP API) would see.
+"""
+import argparse
+import asyncio
+import json
+import logging
+import socket
+import threading
+import time
+from typing import Dict, List
+
+from msu_manager.hcu import HcuController, HcuProtocol, SourceLimiter
+from msu_manager.telemetry import TelemetryStore
+
+from .common import (DEFAULT_MIX, generate_payloads, latency_summary,
+                     parse_mix, rss_kb)
+
+
+class _TimedController(HcuController):
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.handling_s: List[float] = []
+
+    async def process_command(self, command, addr=None):
+        start = time.perf_counter()
+        await super().process_command(command, addr)
+        self.handling_s.append(time.perf_counter() - start)
+
+
+class _TimedProtocol(HcuProtocol):
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.received = 0
+        self.callback_s: List[float] = []
+
+    def datagram_received(self, data, addr):
+        start = time.perf_counter()
+        super().datagram_received(data, addr)
+        self.callback_s.append(time.perf_counter() - start)
+        self.received += 1
+
+
+def _send(payloads: List[bytes], addr, rate: float) -> None:
+    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    interval = 1 / rate if rate else 0
+    next_send = time.perf_counter()
+    for payload in payloads:
+        if interval:
+            next_send += interval
+            delay = next_send - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+        sock.sendto(payload, addr)
+    sock.close()
+
+
+async def _sample_loop_lag(samples: List[float], interval_s: float = 0.005) -> None:
+    loop = asyncio.get_running_loop()
+    while True:
+        start = loop.time()
+        await asyncio.sleep(interval_s)
+        samples.append(loop.time() - start - interval_s)
+
+
+async def run_udp_load(count: int = 50_000, mix: Dict[str, int] = DEFAULT_MIX, rate: float = 0, queue_size: int = 4096,
+                       limiter: SourceLimiter = None) -> Dict:
+    payloads = generate_payloads(mix, count)
+    loop = asyncio.get_running_loop()
+    # Shutdowns are delayed far beyond the run, so the command is never executed
+    controller = _TimedController(['true'], 3600, TelemetryStore())
+    transport, protocol = await loop.create_datagram_endpoint(
+        lambda: _TimedProtocol(controller=controller, queue_size=queue_size, limiter=limiter), local_addr=('127.0.0.1', 0)
+    )
+    transport.get_extra_info('socket').setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, 4 * 1024 * 1024)
+    addr = transport.get_extra_info('sockname')
+
+    rss_before = rss_kb()
+    loop_lag_s: List[float] = []
+    lag_sampler = asyncio.create_task(_sample_loop_lag(loop_lag_s))
+    start = time.perf_counter()
+    sender = threading.Thread(target=_send, args=(payloads, addr, rate))
+    sender.start()
+    while sender.is_alive():
+        await asyncio.sleep(0.01)
+
+    # Wait until the socket and the ingest queue are drained
+    last_received = -1
+    while protocol.received != last_received or protocol.dispatcher.stats().depth > 0:
+        last_received = protocol.received
+        await asyncio.sleep(0.05)
+    elapsed = time.perf_counter() - start - 0.05
+    rss_after = rss_kb()
+    lag_sampler.cancel()
+
+    stats = protocol.dispatcher.stats()
+    transport.close()
+    await controller._cancel_shutdown()
+
+    return {
+        'sent': count,
+        'received': protocol.received,
+        'socket_dropped': count - protocol.received,
+        'dispatched': stats.dispatched,
+        'queue_dropped': stats.dropped,
+        'elapsed_s': elapsed,
+        'throughput_dgram_s': protocol.received / elapsed,
+        'callback_latency': latency_summary(protocol.callback_s),
+        'handling_latency': latency_summary(controller.handling_s),
+        'loop_lag': latency_summary(loop_lag_s),
+        'throttled': dict(limiter.dropped) if limiter else {},
+        'rss_growth_kb': rss_after - rss_before,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--count', type=int, default=50_000)
+    parser.add_argument('--mix', type=parse_mix, default=DEFAULT_MIX)
+    parser.add_argument('--rate', type=float, default=0, help='datagrams per second (0 = as fast as possible)')
+    parser.add_argument('--limit', action='store_true', help='enable the per-source rate limiter with default settings')
+    args = parser.parse_args()
+
+    logging.getLogger().setLevel(logging.ERROR)
+    limiter = SourceLimiter() if args.limit else None
+    print(json.dumps(asyncio.run(run_udp_load(args.count, args.mix, args.rate, limiter=limiter)), indent=2))
+
+
+if __name__ == '__main__':
+    main()
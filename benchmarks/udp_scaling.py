@@ -0,0 +1,114 @@
+"""Measures how multi-process ingest (`ingest_workers`) scales with the number of workers.
+
+Several sender processes replay the mix from distinct source ports (SO_REUSEPORT distributes by
+source address), and the owner's dispatcher throughput is measured for each worker count.
+Scaling is bounded by the number of free cores, since senders run on the same machine.
+
+Run with `poetry run python -m benchmarks.udp_scaling --workers 1,2,4 --senders 8`.
+"""
+import argparse
+import asyncio
+import json
+import logging
+import multiprocessing
+import time
+from typing import Dict, List
+
+from pydantic import ValidationError
+
+from msu_manager.hcu import HcuController, IngestWorkerPool
+from msu_manager.hcu.messages import MessageDecoder
+from msu_manager.hcu.workers import reuse_port_socket
+from msu_manager.telemetry import TelemetryStore
+
+from .common import DEFAULT_MIX, generate_payloads, parse_mix
+from .udp_load import _send
+
+
+def _send_after(barrier, payloads: List[bytes], addr) -> None:
+    barrier.wait()
+    _send(payloads, addr, 0)
+
+
+def _free_port() -> int:
+    sock = reuse_port_socket('127.0.0.1', 0)
+    port = sock.getsockname()[1]
+    sock.close()
+    return port
+
+
+async def _run_once(workers: int, payloads: List[bytes], valid: int, senders: int, queue_size: int) -> Dict:
+    # Shutdowns are delayed far beyond the run, so the command is never executed
+    controller = HcuController(['true'], 3600, TelemetryStore())
+    port = _free_port()
+    pool = IngestWorkerPool(controller, workers, '127.0.0.1', port, queue_size=queue_size, log_level='CRITICAL')
+    await pool.start()
+
+    context = multiprocessing.get_context('spawn')
+    chunks = [payloads[i::senders] for i in range(senders)]
+    # Senders start together once their interpreters are up, so spawn time is not measured
+    barrier = context.Barrier(senders + 1)
+    processes = [context.Process(target=_send_after, args=(barrier, chunk, ('127.0.0.1', port))) for chunk in chunks]
+    for process in processes:
+        process.start()
+    await asyncio.to_thread(barrier.wait)
+    start = time.perf_counter()
+    while any(process.is_alive() for process in processes):
+        await asyncio.sleep(0.01)
+
+    # Wait until workers, the IPC channel and the ingest queue are drained
+    last_dispatched = -1
+    while pool.dispatcher.stats().dispatched != last_dispatched or pool.dispatcher.stats().depth > 0:
+        last_dispatched = pool.dispatcher.stats().dispatched
+        await asyncio.sleep(0.1)
+    elapsed = time.perf_counter() - start - 0.1
+
+    stats = pool.dispatcher.stats()
+    await pool.close()
+    await controller._cancel_shutdown()
+    return {
+        'workers': workers,
+        'dispatched': stats.dispatched,
+        'socket_dropped': valid - stats.dispatched - stats.dropped,
+        'queue_dropped': stats.dropped,
+        'elapsed_s': elapsed,
+        'throughput_dgram_s': stats.dispatched / elapsed,
+    }
+
+
+async def run_udp_scaling(count: int = 200_000, mix: Dict[str, int] = DEFAULT_MIX, workers: List[int] = (1, 2, 4),
+                          senders: int = 8, queue_size: int = 65536) -> Dict:
+    payloads = generate_payloads(mix, count)
+    decoder = MessageDecoder()
+    valid = 0
+    for payload in payloads:
+        try:
+            decoder.decode(payload)
+            valid += 1
+        except ValidationError:
+            pass
+    results = {}
+    baseline = None
+    for n in workers:
+        result = await _run_once(n, payloads, valid, senders, queue_size)
+        baseline = baseline or result['throughput_dgram_s']
+        result['speedup'] = result['throughput_dgram_s'] / baseline
+        results[f'workers_{n}'] = result
+    results['cpu_count'] = multiprocessing.cpu_count()
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--count', type=int, default=200_000)
+    parser.add_argument('--mix', type=parse_mix, default=DEFAULT_MIX)
+    parser.add_argument('--workers', type=lambda value: [int(n) for n in value.split(',')], default=[1, 2, 4])
+    parser.add_argument('--senders', type=int, default=8)
+    args = parser.parse_args()
+
+    logging.getLogger().setLevel(logging.ERROR)
+    print(json.dumps(asyncio.run(run_udp_scaling(args.count, args.mix, args.workers, args.senders)), indent=2))
+
+
+if __name__ == '__main__':
+    main()
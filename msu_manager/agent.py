@@ -0,0 +1,63 @@
+"""Lean entry point: runs the HCU listener, uplink monitor and telemetry on a bare asyncio loop.
+
+FastAPI and uvicorn are only imported if `http_api.enabled` is set, in which case this behaves
+like `fastapi run msu_manager/main.py`. Run with `python -m msu_manager.agent`.
+"""
+import asyncio
+import logging
+import signal
+from types import SimpleNamespace
+
+from .config import MsuManagerConfig
+from .logs import configure_logging, stop_logging
+from .runtime import start_services, stop_services
+
+logger = logging.getLogger(__name__)
+
+
+def _flush_logs_and_terminate(signum, frame) -> None:
+    stop_logging()
+    signal.signal(signum, signal.SIG_DFL)
+    signal.raise_signal(signum)
+
+
+async def run(CONFIG: MsuManagerConfig) -> None:
+    if CONFIG.http_api.enabled:
+        import uvicorn
+
+        from .main import app
+        server = uvicorn.Server(uvicorn.Config(app, host=CONFIG.http_api.host, port=CONFIG.http_api.port, log_config=None))
+        # uvicorn re-raises SIGTERM with this handler after its graceful shutdown. Dying from the
+        # default action right away would lose the log records still queued for the listener.
+        signal.signal(signal.SIGTERM, _flush_logs_and_terminate)
+        await server.serve()
+        return
+
+    state = SimpleNamespace()
+    await start_services(state, CONFIG)
+    logger.info('Running without HTTP API')
+
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGTERM, signal.SIGINT):
+        loop.add_signal_handler(sig, stop.set)
+    await stop.wait()
+
+    logger.info('Shutting down')
+    await stop_services(state)
+
+
+def main() -> None:
+    configure_logging(logging.INFO)
+    CONFIG = MsuManagerConfig()
+    logger.info('Effective configuration: %s', CONFIG.model_dump_json(indent=2))
+    configure_logging(CONFIG.log_level.value, CONFIG.log_rate_limit_window_s)
+    try:
+        asyncio.run(run(CONFIG))
+    except KeyboardInterrupt:
+        # uvicorn re-raises SIGINT after its graceful shutdown
+        pass
+
+
+if __name__ == '__main__':
+    main()
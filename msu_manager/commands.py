@@ -0,0 +1,259 @@
+"""Runs external commands (shutdown, modem restore, ping) for all components.
+
+Commands get a timeout after which their process group is sent SIGTERM and, if it does not exit
+within a grace period, SIGKILL. Output is captured while the command runs into ring buffers that
+keep only the last `capture_bytes` of each stream. A semaphore caps how many commands run at once.
+
+Optionally, commands starting with `sudo` are handed to a long-lived helper process instead, which
+is started once with root privileges (e.g. `sudo -n python -m msu_manager.commands`) and runs
+them without going through sudo and PAM each time. The helper speaks newline-delimited JSON on
+stdin/stdout, see `serve_helper()`.
+"""
+import asyncio
+import json
+import logging
+import os
+import signal
+import sys
+import time
+from typing import Dict, List, Optional
+
+from pydantic import BaseModel
+
+from .metrics import REGISTRY
+
+logger = logging.getLogger(__name__)
+
+SUBPROCESS_SPAWN = REGISTRY.histogram('msu_subprocess_spawn_seconds', 'Time to fork/exec a subprocess', ['program'])
+SUBPROCESS_RUNTIME = REGISTRY.histogram('msu_subprocess_runtime_seconds', 'Time from spawn until a subprocess exited', ['program'])
+SUBPROCESS_EXITS = REGISTRY.counter('msu_subprocess_exits_total', 'Subprocess exits', ['program', 'code'])
+SUBPROCESS_TIMEOUTS = REGISTRY.counter('msu_subprocess_timeouts_total', 'Subprocesses killed after exceeding their timeout', ['program'])
+SUBPROCESS_RUNNING = REGISTRY.gauge('msu_subprocess_running', 'Subprocesses currently running')
+SUBPROCESS_WAITING = REGISTRY.gauge('msu_subprocess_waiting', 'Commands waiting for a free slot')
+
+
+class CommandResult(BaseModel):
+    returncode: int | None
+    stdout: str = ''
+    stderr: str = ''
+    timed_out: bool = False
+    duration_s: float = 0
+
+
+class _RingBuffer:
+    """Keeps the last `max_bytes` written to it."""
+    __slots__ = ('_buffer', '_max_bytes', '_dropped')
+
+    def __init__(self, max_bytes: int):
+        self._buffer = bytearray()
+        self._max_bytes = max_bytes
+        self._dropped = 0
+
+    def write(self, data: bytes) -> None:
+        self._buffer += data
+        excess = len(self._buffer) - self._max_bytes
+        if excess > 0:
+            del self._buffer[:excess]
+            self._dropped += excess
+
+    def text(self) -> str:
+        text = self._buffer.decode(errors='replace')
+        return f'[{self._dropped} bytes truncated]\n{text}' if self._dropped else text
+
+
+async def _capture(stream: asyncio.StreamReader, buffer: _RingBuffer) -> None:
+    while chunk := await stream.read(4096):
+        buffer.write(chunk)
+
+
+def _signal_group(proc: asyncio.subprocess.Process, sig: int) -> None:
+    try:
+        os.killpg(proc.pid, sig)
+    except (ProcessLookupError, PermissionError):
+        # Group already gone, or only partially ours (e.g. children of sudo running as root)
+        try:
+            proc.send_signal(sig)
+        except ProcessLookupError:
+            pass
+
+
+class CommandHelper:
+    """Client side of the pre-forked helper. The helper is (re)started on first use."""
+
+    def __init__(self, command: List[str], capture_bytes: int = 64 * 1024):
+        self.command = command
+        self._capture_bytes = capture_bytes
+        self._proc: asyncio.subprocess.Process = None
+        self._reader: asyncio.Task = None
+        self._pending: Dict[int, asyncio.Future] = {}
+        self._next_id = 0
+        self._lock = asyncio.Lock()
+
+    async def _ensure_started(self) -> None:
+        async with self._lock:
+            if self._proc is not None and self._proc.returncode is None:
+                return
+            logger.info('Starting command helper: %s', ' '.join(self.command))
+            # Escaped output of both streams has to fit into one line
+            self._proc = await asyncio.create_subprocess_exec(*self.command, stdin=asyncio.subprocess.PIPE, stdout=asyncio.subprocess.PIPE,
+                                                              limit=16 * self._capture_bytes + 4096)
+            self._reader = asyncio.create_task(self._read_responses(self._proc))
+
+    async def _read_responses(self, proc: asyncio.subprocess.Process) -> None:
+        try:
+            while line := await proc.stdout.readline():
+                response = json.loads(line)
+                future = self._pending.pop(response.pop('id'), None)
+                if future is not None and not future.done():
+                    future.set_result(CommandResult(**response))
+        except (ValueError, asyncio.LimitOverrunError):
+            logger.error('Invalid response from command helper', exc_info=True)
+            proc.kill()
+        finally:
+            await proc.wait()
+            if self._pending:
+                logger.error('Command helper exited with code %s, failing %s pending commands', proc.returncode, len(self._pending))
+            for future in self._pending.values():
+                if not future.done():
+                    future.set_exception(RuntimeError(f'Command helper exited with code {proc.returncode}'))
+            self._pending.clear()
+
+    async def run(self, command: List[str], env: Dict[str, str] = None, timeout_s: float = None) -> CommandResult:
+        await self._ensure_started()
+        self._next_id += 1
+        request_id = self._next_id
+        future = self._pending[request_id] = asyncio.get_running_loop().create_future()
+        request = {'id': request_id, 'argv': command, 'env': env or {}, 'timeout_s': timeout_s}
+        self._proc.stdin.write(json.dumps(request).encode() + b'\n')
+        await self._proc.stdin.drain()
+        # The helper enforces the timeout itself; this only guards against a helper that hangs
+        return await asyncio.wait_for(future, timeout_s + 30 if timeout_s else None)
+
+    async def close(self) -> None:
+        if self._proc is not None and self._proc.returncode is None:
+            self._proc.stdin.close()
+            try:
+                await asyncio.wait_for(self._proc.wait(), 5)
+            except asyncio.TimeoutError:
+                self._proc.kill()
+        if self._reader is not None:
+            await asyncio.gather(self._reader, return_exceptions=True)
+
+
+class CommandRunner:
+    def __init__(self, max_concurrency: int = 4, timeout_s: float = 300, kill_grace_s: float = 5, capture_bytes: int = 64 * 1024,
+                 helper: CommandHelper = None):
+        self.timeout_s = timeout_s
+        self.kill_grace_s = kill_grace_s
+        self.capture_bytes = capture_bytes
+        self.helper = helper
+        self._slots = asyncio.Semaphore(max_concurrency)
+
+    async def run(self, command: List[str], env: Dict[str, str] = None, timeout_s: Optional[float] = None) -> CommandResult:
+        """Runs `command` with `env` added to the current environment. `timeout_s` defaults to the
+        runner's timeout; a command that timed out has `timed_out` set and the returncode of the kill."""
+        timeout_s = timeout_s or self.timeout_s
+        SUBPROCESS_WAITING.inc()
+        try:
+            await self._slots.acquire()
+        finally:
+            SUBPROCESS_WAITING.dec()
+
+        SUBPROCESS_RUNNING.inc()
+        try:
+            if self.helper is not None and len(command) > 1 and command[0] == 'sudo' and not command[1].startswith('-'):
+                result = await self.helper.run(command[1:], env, timeout_s)
+                program = os.path.basename(command[1])
+                SUBPROCESS_RUNTIME.labels(program).observe(result.duration_s)
+            else:
+                result = await self._execute(command, env, timeout_s)
+                program = os.path.basename(command[0])
+        finally:
+            SUBPROCESS_RUNNING.dec()
+            self._slots.release()
+
+        SUBPROCESS_EXITS.labels(program, result.returncode).inc()
+        if result.timed_out:
+            SUBPROCESS_TIMEOUTS.labels(program).inc()
+            logger.error('%s did not finish within %s seconds and was killed', ' '.join(command), timeout_s)
+        return result
+
+    async def _execute(self, command: List[str], env: Optional[Dict[str, str]], timeout_s: float) -> CommandResult:
+        program = os.path.basename(command[0])
+        start = time.perf_counter()
+        proc = await asyncio.create_subprocess_exec(
+            *command,
+            stdout=asyncio.subprocess.PIPE,
+            stderr=asyncio.subprocess.PIPE,
+            env={**os.environ, **env} if env else None,
+            # Own process group, so that a timeout also reaches children the command spawned
+            start_new_session=True,
+        )
+        spawned = time.perf_counter()
+        SUBPROCESS_SPAWN.labels(program).observe(spawned - start)
+
+        stdout, stderr = _RingBuffer(self.capture_bytes), _RingBuffer(self.capture_bytes)
+        readers = [asyncio.create_task(_capture(proc.stdout, stdout)), asyncio.create_task(_capture(proc.stderr, stderr))]
+        timed_out = False
+        try:
+            try:
+                returncode = await asyncio.wait_for(proc.wait(), timeout_s)
+            except asyncio.TimeoutError:
+                timed_out = True
+                returncode = await self._terminate(proc)
+        except asyncio.CancelledError:
+            _signal_group(proc, signal.SIGKILL)
+            for reader in readers:
+                reader.cancel()
+            raise
+
+        # Children that outlive the command may keep the pipes open, don't wait for them
+        _, pending = await asyncio.wait(readers, timeout=1)
+        for reader in pending:
+            reader.cancel()
+
+        duration_s = time.perf_counter() - spawned
+        SUBPROCESS_RUNTIME.labels(program).observe(duration_s)
+        return CommandResult(returncode=returncode, stdout=stdout.text(), stderr=stderr.text(), timed_out=timed_out, duration_s=duration_s)
+
+    async def _terminate(self, proc: asyncio.subprocess.Process) -> int:
+        _signal_group(proc, signal.SIGTERM)
+        try:
+            return await asyncio.wait_for(proc.wait(), self.kill_grace_s)
+        except asyncio.TimeoutError:
+            logger.warning('Process %s ignored SIGTERM, sending SIGKILL', proc.pid)
+            _signal_group(proc, signal.SIGKILL)
+            return await proc.wait()
+
+
+async def serve_helper(runner: CommandRunner) -> None:
+    """Helper side: reads one JSON request per line from stdin and answers on stdout, in completion order.
+    Request: {"id", "argv", "env", "timeout_s"}, response: {"id", **CommandResult}. Exits on EOF."""
+    loop = asyncio.get_running_loop()
+    reader = asyncio.StreamReader()
+    await loop.connect_read_pipe(lambda: asyncio.StreamReaderProtocol(reader), sys.stdin)
+    tasks = set()
+
+    async def handle(request: Dict) -> None:
+        try:
+            result = await runner.run(request['argv'], request.get('env'), request.get('timeout_s'))
+        except OSError as e:
+            result = CommandResult(returncode=127, stderr=str(e))
+        sys.stdout.buffer.write(json.dumps({'id': request['id'], **result.model_dump()}).encode() + b'\n')
+        sys.stdout.buffer.flush()
+
+    while line := await reader.readline():
+        task = asyncio.create_task(handle(json.loads(line)))
+        tasks.add(task)
+        task.add_done_callback(tasks.discard)
+    if tasks:
+        await asyncio.wait(tasks)
+
+
+def main() -> None:
+    logging.basicConfig(level=logging.WARNING, stream=sys.stderr)
+    asyncio.run(serve_helper(CommandRunner()))
+
+
+if __name__ == '__main__':
+    main()
@@ -1,8 +1,9 @@
 import os
 from enum import Enum
-from typing import List, Literal
+from typing import Dict, List, Literal
 
-from pydantic import BaseModel, Field
+from pydantic import (BaseModel, Field, SecretStr, field_validator,
+                      model_validator)
 from pydantic_settings import (BaseSettings, SettingsConfigDict,
                                YamlConfigSettingsSource)
 
@@ -15,37 +16,209 @@ class LogLevel(str, Enum):
     DEBUG = 'DEBUG'
 
 
+class ProbeMethod(str, Enum):
+    AUTO = 'auto'
+    ICMP = 'icmp'
+    TCP = 'tcp'
+    UDP = 'udp'
+    PING = 'ping'
+
+
+class QuorumPolicy(str, Enum):
+    ANY = 'any'
+    MAJORITY = 'majority'
+    ALL = 'all'
+
+
+class LinkEvents(str, Enum):
+    NETLINK = 'netlink'
+    NONE = 'none'
+
+
 class UplinkMonitorConfig(BaseModel):
     enabled: Literal[True]
     restore_connection_cmd: List[str]
     wwan_device: str
     wwan_usb_id: str
     wwan_apn: str
-    check_connection_target: str
+    check_connection_target: List[str]
+    check_connection_quorum: QuorumPolicy = QuorumPolicy.ANY
     check_connection_device: str = None
+    check_connection_method: ProbeMethod = ProbeMethod.AUTO
+    check_connection_port: int | None = None
+    check_connection_count: int = 3
+    check_connection_timeout_s: float = 1.0
     check_interval_s: int = 10
+    link_events: LinkEvents = LinkEvents.NONE
+    stable_check_interval_s: int = 60
+    restore_connection_timeout_s: float = 300
+    min_check_interval_s: int = 2
+    check_interval_growth: float = 1.5
+    restore_backoff_s: float = 30
+    restore_backoff_max_s: float = 900
+    restore_circuit_threshold: int = 5
+    restore_circuit_open_s: float = 1800
+    probe_budget_kb_per_day: float = 0
+
+    @field_validator('check_connection_target', mode='before')
+    @classmethod
+    def _single_target_as_list(cls, value):
+        if isinstance(value, str):
+            return [value]
+        return value
 
 
 class UplinkMonitorConfigDisabled(BaseModel):
     enabled: Literal[False] = False
 
 
+class SensorConfig(BaseModel):
+    name: str
+    path: str
+    scale: float = 0.001
+
+
+class ThermalAction(str, Enum):
+    SHUTDOWN = 'shutdown'
+    LOG = 'log'
+
+
+class ThermalRuleConfig(BaseModel):
+    sensor: str
+    above: float | None = None
+    below: float | None = None
+    for_s: float = 0
+    action: ThermalAction = ThermalAction.SHUTDOWN
+
+    @model_validator(mode='after')
+    def _has_threshold(self):
+        if self.above is None and self.below is None:
+            raise ValueError(f'Rule for {self.sensor} needs a threshold (above and/or below)')
+        return self
+
+
+class ThermalMonitorConfig(BaseModel):
+    enabled: Literal[True]
+    sysfs_root: str = '/sys'
+    discover: bool = True
+    sensors: List[SensorConfig] = []
+    sample_interval_s: float = 5
+    max_keys: int = 64
+    rules: List[ThermalRuleConfig] = []
+
+
+class ThermalMonitorConfigDisabled(BaseModel):
+    enabled: Literal[False] = False
+
+
+class OverflowPolicy(str, Enum):
+    DROP_OLDEST = 'drop-oldest'
+    DROP_NEWEST = 'drop-newest'
+    COALESCE = 'coalesce'
+
+
 class HcuControllerConfig(BaseModel):
     enabled: Literal[True]
     udp_bind_address: str = '0.0.0.0'
     udp_listen_port: int = 8001
     shutdown_delay_s: int = 180
     shutdown_command: List[str]
+    shutdown_timeout_s: float = 60
+    ingest_queue_size: int = 256
+    ingest_overflow_policy: OverflowPolicy = OverflowPolicy.DROP_OLDEST
+    ingest_rate_limit_per_s: float = 50
+    ingest_rate_limit_burst: int = 100
+    ingest_dedup_window_s: float = 1.0
+    gateway_mode: bool = False
+    heartbeat_timeout_s: int = 60
+    gateway_max_units: int = 1024
+    gateway_unit_retention_s: int = 86400
+    ingest_workers: int = 1
+    http_batch_max_commands: int = 10000
+    http_batch_max_bytes: int = 4194304
 
 
 class HcuControllerConfigDisabled(BaseModel):
     enabled: Literal[False] = False
 
 
+class TelemetryPersistenceConfig(BaseModel):
+    enabled: Literal[True]
+    directory: str
+    segment_size_kb: int = 1024
+    segment_max_age_s: int = 86400
+    compact_after_s: int = 7 * 86400
+    compact_step_s: int = 300
+    max_disk_mb: int = 64
+    flush_interval_s: float = 5
+
+
+class TelemetryPersistenceConfigDisabled(BaseModel):
+    enabled: Literal[False] = False
+
+
+class TelemetryUploadConfig(BaseModel):
+    enabled: Literal[True]
+    url: str
+    # Secret, so credentials like an Authorization header stay out of the logged configuration
+    headers: Dict[str, SecretStr] = {}
+    spool_directory: str = '/var/lib/msu-manager/spool'
+    spool_max_disk_mb: int = 16
+    batch_max_records: int = 1000
+    batch_max_age_s: float = 300
+    timeout_s: float = 30
+
+
+class TelemetryUploadConfigDisabled(BaseModel):
+    enabled: Literal[False] = False
+
+
+class TelemetryConfig(BaseModel):
+    memory_budget_kb: int = 1024
+    max_keys: int = 64
+    max_keys_per_unit: int = 16
+    bucket_s: int = 60
+    persistence: TelemetryPersistenceConfig | TelemetryPersistenceConfigDisabled = Field(discriminator='enabled', default=TelemetryPersistenceConfigDisabled())
+    upload: TelemetryUploadConfig | TelemetryUploadConfigDisabled = Field(discriminator='enabled', default=TelemetryUploadConfigDisabled())
+
+
+class HttpApiConfig(BaseModel):
+    enabled: bool = True
+    host: str = '0.0.0.0'
+    port: int = 8000
+
+
+class CommandsConfig(BaseModel):
+    max_concurrency: int = 4
+    default_timeout_s: float = 300
+    kill_grace_s: float = 5
+    capture_bytes: int = 65536
+    helper_command: List[str] | None = None
+
+
+class EventsConfig(BaseModel):
+    queue_size: int = 256
+
+
+class DiagnosticsConfig(BaseModel):
+    loop_lag_interval_s: float = 0.5
+    slow_callback_s: float = 0.1
+    slow_callback_history: int = 32
+    profiler_enabled: bool = False
+    profiler_max_duration_s: float = 60
+
+
 class MsuManagerConfig(BaseSettings):
     log_level: LogLevel = LogLevel.INFO
+    log_rate_limit_window_s: int = 60
     hcu_controller: HcuControllerConfig | HcuControllerConfigDisabled = Field(discriminator='enabled', default=HcuControllerConfigDisabled())
     uplink_monitor: UplinkMonitorConfig | UplinkMonitorConfigDisabled = Field(discriminator='enabled', default=UplinkMonitorConfigDisabled())
+    thermal_monitor: ThermalMonitorConfig | ThermalMonitorConfigDisabled = Field(discriminator='enabled', default=ThermalMonitorConfigDisabled())
+    telemetry: TelemetryConfig = TelemetryConfig()
+    http_api: HttpApiConfig = HttpApiConfig()
+    commands: CommandsConfig = CommandsConfig()
+    events: EventsConfig = EventsConfig()
+    diagnostics: DiagnosticsConfig = DiagnosticsConfig()
 
 
     model_config = SettingsConfigDict(env_nested_delimiter='__')
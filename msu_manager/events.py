@@ -0,0 +1,133 @@
+"""Typed state-change events from the HCU controllers and the uplink monitor, fanned out to subscribers.
+
+Every subscriber gets its own bounded queue. Publishing never waits: a subscriber whose queue is
+full is dropped (its stream ends), so a slow client cannot hold up UDP ingestion or the monitor.
+"""
+import asyncio
+import logging
+import time
+from collections import deque
+from enum import Enum
+from typing import Any, Deque, Dict, Iterable, Optional, Set
+
+from pydantic import BaseModel
+
+from .metrics import REGISTRY
+
+logger = logging.getLogger(__name__)
+
+EVENTS_PUBLISHED = REGISTRY.counter('msu_events_published_total', 'Events published to at least one subscriber', ['type'])
+EVENT_SUBSCRIBERS = REGISTRY.gauge('msu_event_subscribers', 'Connected event stream subscribers')
+EVENT_SUBSCRIBERS_DROPPED = REGISTRY.counter('msu_event_subscribers_dropped_total', 'Subscribers dropped because they fell behind')
+
+
+class EventType(str, Enum):
+    SHUTDOWN_SCHEDULED = 'shutdown-scheduled'
+    SHUTDOWN_CANCELLED = 'shutdown-cancelled'
+    SHUTDOWN_EXECUTING = 'shutdown-executing'
+    HEARTBEAT_VERSION = 'heartbeat-version'
+    UNIT_ONLINE = 'unit-online'
+    UNIT_OFFLINE = 'unit-offline'
+    UPLINK_STATE = 'uplink-state'
+    UPLINK_RESTORE = 'uplink-restore'
+    THERMAL_ALERT = 'thermal-alert'
+    TELEMETRY = 'telemetry'
+
+
+class Event(BaseModel):
+    seq: int
+    ts: float
+    type: EventType
+    data: Dict[str, Any]
+
+
+class Subscription:
+    __slots__ = ('types', 'maxsize', 'closed', '_queue', '_ready')
+
+    def __init__(self, types: Optional[Set[EventType]], maxsize: int):
+        self.types = types
+        self.maxsize = maxsize
+        self.closed = False
+        self._queue: Deque[Event] = deque()
+        self._ready = asyncio.Event()
+
+    def _offer(self, event: Event) -> bool:
+        if len(self._queue) >= self.maxsize:
+            return False
+        self._queue.append(event)
+        self._ready.set()
+        return True
+
+    def _close(self) -> None:
+        self.closed = True
+        self._ready.set()
+
+    async def get(self) -> Optional[Event]:
+        """Returns the next event, or None once the subscription was closed."""
+        while not self._queue:
+            if self.closed:
+                return None
+            self._ready.clear()
+            await self._ready.wait()
+        return self._queue.popleft()
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self) -> Event:
+        event = await self.get()
+        if event is None:
+            raise StopAsyncIteration
+        return event
+
+
+class EventBus:
+    def __init__(self, queue_size: int = 256):
+        self.queue_size = queue_size
+        self._subscribers: Set[Subscription] = set()
+        self._seq = 0
+        self.closed = False
+        self._published = {t: EVENTS_PUBLISHED.labels(t.value) for t in EventType}
+
+    def subscribe(self, types: Iterable[EventType] = None) -> Subscription:
+        subscription = Subscription(set(types) if types else None, self.queue_size)
+        if self.closed:
+            subscription._close()
+            return subscription
+        self._subscribers.add(subscription)
+        EVENT_SUBSCRIBERS.set(len(self._subscribers))
+        return subscription
+
+    def unsubscribe(self, subscription: Subscription) -> None:
+        self._subscribers.discard(subscription)
+        subscription._close()
+        EVENT_SUBSCRIBERS.set(len(self._subscribers))
+
+    def close(self) -> None:
+        """Ends all streams, e.g. on shutdown. Later subscriptions end right away."""
+        self.closed = True
+        for subscription in list(self._subscribers):
+            self.unsubscribe(subscription)
+
+    def publish(self, type: EventType, **data: Any) -> None:
+        if not self._subscribers:
+            return
+        self._seq += 1
+        event = None
+        for subscription in list(self._subscribers):
+            if subscription.types is not None and type not in subscription.types:
+                continue
+            if event is None:
+                event = Event(seq=self._seq, ts=time.time(), type=type, data=data)
+            if not subscription._offer(event):
+                logger.warning('Event subscriber fell %s events behind, dropping it', subscription.maxsize)
+                EVENT_SUBSCRIBERS_DROPPED.inc()
+                # End its stream right away instead of sending the backlog first
+                subscription._queue.clear()
+                self.unsubscribe(subscription)
+        if event is not None:
+            self._published[type].inc()
+
+
+def format_sse(event: Event) -> bytes:
+    return f'id: {event.seq}\nevent: {event.type.value}\ndata: {event.model_dump_json()}\n\n'.encode()
@@ -1,3 +1,6 @@
 from .protocol import HcuProtocol
 from .controller import HcuController
+from .gateway import GatewayController
+from .workers import IngestWorkerPool
+from .ratelimit import SourceLimiter
 from .messages import HcuMessage
\ No newline at end of file
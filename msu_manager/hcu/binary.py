@@ -0,0 +1,138 @@
+"""Compact fixed-layout alternative to the JSON messages, for HCUs that would rather not format JSON.
+
+All integers are little endian. Every datagram starts with two bytes:
+
+    byte 0  magic (high nibble 0xB) | format version (low nibble), currently 0xB1
+    byte 1  command type (low nibble) | flags (high nibble)
+
+followed by the fields below, in this order. `str8` is a length byte followed by that many bytes
+of UTF-8, `str16` the same with a 16 bit length.
+
+    FLAG_UNIT_ID                  unit_id: str8
+    HEARTBEAT                     version: str8 (empty = not reported)
+    LOG                           key: str8, then value: float64 if FLAG_NUMERIC, else str16
+
+A JSON datagram can never start with a byte >= 0x80, so both formats share one port.
+"""
+import math
+import struct
+from typing import Tuple
+
+from .messages import (CommandType, HcuMessage, HeartbeatCommand, LogCommand,
+                       ResumeCommand, ShutdownCommand)
+
+MAGIC = 0xB0
+VERSION = 1
+
+FLAG_UNIT_ID = 0x10
+FLAG_NUMERIC = 0x20
+
+_HEADER = struct.Struct('<BB')
+_U8 = struct.Struct('<B')
+_U16 = struct.Struct('<H')
+_F64 = struct.Struct('<d')
+
+_TYPE_CODES = {
+    CommandType.SHUTDOWN: 1,
+    CommandType.RESUME: 2,
+    CommandType.HEARTBEAT: 3,
+    CommandType.LOG: 4,
+}
+
+
+class BinaryFormatError(ValueError):
+    pass
+
+
+def is_binary(data: bytes) -> bool:
+    return len(data) > 0 and data[0] & 0xF0 == MAGIC
+
+
+def _read_str(data: bytes, offset: int, length_format: struct.Struct) -> Tuple[str, int]:
+    (length,) = length_format.unpack_from(data, offset)
+    start = offset + length_format.size
+    end = start + length
+    if end > len(data):
+        raise BinaryFormatError(f'String at offset {offset} runs past the end of the datagram')
+    return data[start:end].decode(), end
+
+
+# Validating a dict with the model's core validator is cheaper than __init__ or model_construct()
+_validate_shutdown = ShutdownCommand.__pydantic_validator__.validate_python
+_validate_resume = ResumeCommand.__pydantic_validator__.validate_python
+_validate_heartbeat = HeartbeatCommand.__pydantic_validator__.validate_python
+_validate_log = LogCommand.__pydantic_validator__.validate_python
+
+
+def decode_binary(data: bytes) -> HcuMessage:
+    """Raises BinaryFormatError on truncated, unknown or otherwise malformed datagrams. Fields are
+    unpacked in place with struct; only the strings themselves are copied out of the datagram."""
+    try:
+        magic, type_byte = _HEADER.unpack_from(data)
+        if magic & 0x0F != VERSION:
+            raise BinaryFormatError(f'Unsupported binary format version {magic & 0x0F}')
+        offset = _HEADER.size
+
+        unit_id = None
+        if type_byte & FLAG_UNIT_ID:
+            unit_id, offset = _read_str(data, offset, _U8)
+
+        match type_byte & 0x0F:
+            case 1:
+                message = _validate_shutdown({'command': CommandType.SHUTDOWN, 'unit_id': unit_id})
+            case 2:
+                message = _validate_resume({'command': CommandType.RESUME, 'unit_id': unit_id})
+            case 3:
+                version, offset = _read_str(data, offset, _U8)
+                message = _validate_heartbeat({'command': CommandType.HEARTBEAT, 'version': version or None, 'unit_id': unit_id})
+            case 4:
+                key, offset = _read_str(data, offset, _U8)
+                if type_byte & FLAG_NUMERIC:
+                    (value,) = _F64.unpack_from(data, offset)
+                    offset += _F64.size
+                else:
+                    value, offset = _read_str(data, offset, _U16)
+                message = _validate_log({'command': CommandType.LOG, 'key': key, 'value': value, 'unit_id': unit_id})
+            case code:
+                raise BinaryFormatError(f'Unknown command type {code}')
+    except (struct.error, UnicodeDecodeError) as e:
+        raise BinaryFormatError(str(e)) from e
+
+    if offset != len(data):
+        raise BinaryFormatError(f'{len(data) - offset} unexpected trailing bytes')
+    return message
+
+
+def _str(value: str, length_format: struct.Struct) -> bytes:
+    encoded = value.encode()
+    return length_format.pack(len(encoded)) + encoded
+
+
+def encode_binary(message: HcuMessage) -> bytes:
+    """Encodes a message, e.g. for tests or an HCU simulator. LOG values that are floats, or strings
+    that round-trip through float(), are sent as float64."""
+    type_byte = _TYPE_CODES[message.command]
+    parts = []
+    if message.unit_id is not None:
+        type_byte |= FLAG_UNIT_ID
+        parts.append(_str(message.unit_id, _U8))
+
+    match message:
+        case HeartbeatCommand():
+            parts.append(_str(message.version or '', _U8))
+        case LogCommand():
+            parts.append(_str(message.key, _U8))
+            value = message.value
+            if isinstance(value, str):
+                try:
+                    numeric = float(value)
+                    value = numeric if math.isfinite(numeric) and repr(numeric) == value else value
+                except ValueError:
+                    pass
+            if isinstance(value, float):
+                type_byte |= FLAG_NUMERIC
+                parts.append(_F64.pack(value))
+            else:
+                parts.append(_str(value, _U16))
+
+    return _HEADER.pack(MAGIC | VERSION, type_byte) + b''.join(parts)
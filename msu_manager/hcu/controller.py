@@ -1,38 +1,69 @@
 import asyncio
 import logging
-from typing import List
+import time
+from typing import List, Optional, Tuple
 
-from .messages import (HeartbeatCommand, LogCommand, HcuMessage,
+from ..commands import CommandRunner
+from ..events import EventBus, EventType
+from ..metrics import REGISTRY
+from ..telemetry import TelemetryStore
+from .messages import (CommandType, HeartbeatCommand, LogCommand, HcuMessage,
                        ResumeCommand, ShutdownCommand)
 
 logger = logging.getLogger(__name__)
 
+COMMANDS_PROCESSED = REGISTRY.counter('msu_hcu_commands_processed_total', 'Commands processed by the HcuController', ['command'])
+COMMAND_LATENCY = REGISTRY.histogram('msu_hcu_command_seconds', 'Time spent handling a command', ['command'])
+_COMMANDS_PROCESSED = {t: COMMANDS_PROCESSED.labels(t.value) for t in CommandType}
+_COMMAND_LATENCY = {t: COMMAND_LATENCY.labels(t.value) for t in CommandType}
+
 
 class HcuController:
-    def __init__(self, shutdown_command: List[str], shutdown_delay_s: int):
+    def __init__(self, shutdown_command: List[str], shutdown_delay_s: int, telemetry: TelemetryStore = None,
+                 runner: CommandRunner = None, shutdown_timeout_s: float = 60, events: EventBus = None):
         self.shutdown_command = shutdown_command
         self.shutdown_delay_s = shutdown_delay_s
+        self.shutdown_timeout_s = shutdown_timeout_s
+        self._runner = runner or CommandRunner()
+        self._telemetry = telemetry
+        self._events = events or EventBus()
         self._shutdown_task = None
+        self.version = None
+
+    async def process_command(self, command: HcuMessage, addr: Optional[Tuple[str, int]] = None):
+        start = time.perf_counter()
+        try:
+            await self._process_command(command)
+        finally:
+            _COMMAND_LATENCY[command.command].observe(time.perf_counter() - start)
+            _COMMANDS_PROCESSED[command.command].inc()
 
-    async def process_command(self, command: HcuMessage):
-        logger.info(f'Processing {type(command).__name__}')
+    async def _process_command(self, command: HcuMessage):
+        logger.debug('Processing %s', type(command).__name__)
         match command:
             case ShutdownCommand():
                 await self.handle_shutdown()
             case ResumeCommand():
                 await self.handle_resume()
             case HeartbeatCommand():
-                pass
+                if command.version != self.version:
+                    logger.info('HCU reports version %s', command.version)
+                    self._events.publish(EventType.HEARTBEAT_VERSION, version=command.version, previous=self.version)
+                    self.version = command.version
             case LogCommand():
-                logger.info(f'LOG - {command.key}: {command.value}')
+                logger.info('LOG - %s: %s', command.key, command.value)
+                if self._telemetry is not None:
+                    self._telemetry.add(command.key, command.value)
+                self._events.publish(EventType.TELEMETRY, key=command.key, value=command.value)
                 
     async def handle_shutdown(self):
         if self._shutdown_task is not None:
             logger.warning('Shutdown already scheduled, ignoring duplicate request.')
             return
         
-        logger.info(f'Scheduling shutdown in {self.shutdown_delay_s} seconds.')
+        logger.info('Scheduling shutdown in %s seconds.', self.shutdown_delay_s)
         self._shutdown_task = asyncio.create_task(self._delayed_shutdown())
+        self._events.publish(EventType.SHUTDOWN_SCHEDULED, delay_s=self.shutdown_delay_s, shutdown_at=time.time() + self.shutdown_delay_s)
 
     async def handle_resume(self):
         if self._shutdown_task is None:
@@ -42,6 +73,7 @@ class HcuController:
         logger.info('Cancelling scheduled shutdown.')
         await self._cancel_shutdown()
         logger.info('Scheduled shutdown cancelled successfully.')
+        self._events.publish(EventType.SHUTDOWN_CANCELLED)
 
     async def _cancel_shutdown(self):
         if self._shutdown_task is not None:
@@ -57,14 +89,11 @@ class HcuController:
         await asyncio.sleep(self.shutdown_delay_s)
         
         logger.info('Executing shutdown now.')
-        proc = await asyncio.create_subprocess_exec(*self.shutdown_command, stdout=asyncio.subprocess.PIPE, stderr=asyncio.subprocess.PIPE)
-        stdout, stderr = await proc.communicate()
+        self._events.publish(EventType.SHUTDOWN_EXECUTING)
+        result = await self._runner.run(self.shutdown_command, timeout_s=self.shutdown_timeout_s)
 
         # This is probably never reached if shutdown is successful
-        if proc.returncode != 0:
-            logger.error(f'Shutdown command failed with exit code {proc.returncode}')
-            if stdout:
-                logger.error(f'[stdout]\n{stdout.decode()}')
-            if stderr:
-                logger.error(f'[stderr]\n{stderr.decode()}')
+        if result.returncode != 0:
+            logger.error('Shutdown command failed with exit code %s\n[stdout]\n%s\n[stderr]\n%s',
+                         result.returncode, result.stdout, result.stderr)
             await self._cancel_shutdown()
\ No newline at end of file
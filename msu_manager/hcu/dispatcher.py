@@ -0,0 +1,133 @@
+import asyncio
+import logging
+from collections import deque
+from typing import Deque, Optional, Tuple
+
+from pydantic import BaseModel
+
+from ..config import OverflowPolicy
+from ..metrics import REGISTRY
+from .controller import HcuController
+from .messages import HcuMessage, ResumeCommand, ShutdownCommand
+
+logger = logging.getLogger(__name__)
+
+QUEUE_DROPPED = REGISTRY.counter('msu_hcu_ingest_dropped_total', 'Commands dropped because the ingest queue was full')
+
+
+class DispatcherStats(BaseModel):
+    depth: int
+    max_depth: int
+    capacity: int
+    enqueued: int
+    dispatched: int
+    dropped: int
+    coalesced: int
+
+
+Source = Optional[Tuple[str, int]]
+
+
+def _is_power_command(command: HcuMessage) -> bool:
+    return isinstance(command, (ShutdownCommand, ResumeCommand))
+
+
+def _same_sender(a: Source, b: Source) -> bool:
+    return (a[0] if a else None) == (b[0] if b else None)
+
+
+class CommandDispatcher:
+    """Bounded FIFO between the UDP callback and the controller. A single worker drains it in
+    order, so commands are never reordered and a burst cannot spawn unbounded tasks."""
+
+    def __init__(self, controller: HcuController, max_size: int = 256, overflow_policy: OverflowPolicy = OverflowPolicy.DROP_OLDEST, batch_size: int = 32):
+        self._controller = controller
+        self._queue: Deque[Tuple[HcuMessage, Source]] = deque()
+        self._max_size = max_size
+        self._overflow_policy = overflow_policy
+        self._batch_size = batch_size
+        self._wakeup = asyncio.Event()
+        self._worker: asyncio.Task = None
+
+        self._max_depth = 0
+        self._enqueued = 0
+        self._dispatched = 0
+        self._dropped = 0
+        self._coalesced = 0
+
+    def start(self) -> None:
+        if self._worker is None:
+            self._worker = asyncio.create_task(self._run())
+
+    def close(self) -> None:
+        if self._worker is not None:
+            self._worker.cancel()
+            self._worker = None
+
+    def put(self, command: HcuMessage, addr: Source = None) -> bool:
+        """Enqueue without blocking. Returns False if the command itself was dropped."""
+        if len(self._queue) >= self._max_size and not self._make_room(command, addr):
+            self._count_drop()
+            return False
+
+        self._queue.append((command, addr))
+        self._enqueued += 1
+        if len(self._queue) > self._max_depth:
+            self._max_depth = len(self._queue)
+        self._wakeup.set()
+        return True
+
+    def _count_drop(self) -> None:
+        self._dropped += 1
+        QUEUE_DROPPED.inc()
+
+    def _make_room(self, command: HcuMessage, addr: Source) -> bool:
+        match self._overflow_policy:
+            case OverflowPolicy.DROP_NEWEST:
+                return False
+            case OverflowPolicy.DROP_OLDEST:
+                self._queue.popleft()
+                self._count_drop()
+                return True
+            case OverflowPolicy.COALESCE:
+                if _is_power_command(command):
+                    # Only the latest SHUTDOWN/RESUME of each sender matters
+                    before = len(self._queue)
+                    self._queue = deque(e for e in self._queue if not (_is_power_command(e[0]) and _same_sender(e[1], addr)))
+                    self._coalesced += before - len(self._queue)
+                    if len(self._queue) < self._max_size:
+                        return True
+                for i, (queued, _) in enumerate(self._queue):
+                    if not _is_power_command(queued):
+                        del self._queue[i]
+                        self._count_drop()
+                        return True
+                return False
+
+    def stats(self) -> DispatcherStats:
+        return DispatcherStats(
+            depth=len(self._queue),
+            max_depth=self._max_depth,
+            capacity=self._max_size,
+            enqueued=self._enqueued,
+            dispatched=self._dispatched,
+            dropped=self._dropped,
+            coalesced=self._coalesced,
+        )
+
+    async def _run(self) -> None:
+        while True:
+            await self._wakeup.wait()
+            self._wakeup.clear()
+            while self._queue:
+                for _ in range(self._batch_size):
+                    if not self._queue:
+                        break
+                    command, addr = self._queue.popleft()
+                    try:
+                        await self._controller.process_command(command, addr)
+                    except Exception:
+                        logger.error('Failed to process %s', type(command).__name__, exc_info=True)
+                    self._dispatched += 1
+                # Give other callbacks a chance between batches
+                await asyncio.sleep(0)
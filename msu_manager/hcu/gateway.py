@@ -0,0 +1,211 @@
+import asyncio
+import logging
+import time
+from collections import OrderedDict
+from typing import Dict, List, Optional, Set, Tuple
+
+from pydantic import BaseModel
+
+from ..commands import CommandRunner
+from ..events import EventBus, EventType
+from ..telemetry import TelemetryStore
+from .controller import _COMMAND_LATENCY, _COMMANDS_PROCESSED
+from .messages import (HcuMessage, HeartbeatCommand, LogCommand,
+                       ResumeCommand, ShutdownCommand)
+from .timing_wheel import TimerHandle, TimingWheel
+
+logger = logging.getLogger(__name__)
+
+
+class UnitState(BaseModel):
+    unit: str
+    address: str | None
+    version: str | None
+    last_seen: float
+    online: bool
+    shutdown_at: float | None
+
+
+class _Unit:
+    __slots__ = ('unit', 'address', 'version', 'last_seen', 'online', 'liveness_timer', 'shutdown_timer', 'shutdown_at')
+
+    def __init__(self, unit: str):
+        self.unit = unit
+        self.address: Optional[str] = None
+        self.version: Optional[str] = None
+        self.last_seen = 0.0
+        self.online = False
+        self.liveness_timer: Optional[TimerHandle] = None
+        self.shutdown_timer: Optional[TimerHandle] = None
+        self.shutdown_at: Optional[float] = None
+
+    def state(self) -> UnitState:
+        return UnitState(unit=self.unit, address=self.address, version=self.version, last_seen=self.last_seen,
+                         online=self.online, shutdown_at=self.shutdown_at)
+
+
+class GatewayController:
+    """Tracks many HCUs behind one listener. Units are keyed by `unit_id` if the message carries one,
+    otherwise by source address. Heartbeat timeouts and delayed shutdowns of all units share one
+    timing wheel instead of one sleeping task per unit. `shutdown_command` may contain `{unit}` and
+    `{address}` placeholders. Units that stay offline for `unit_retention_s` are forgotten; beyond
+    `max_units`, the longest offline unit is forgotten first and new units are ignored if none is offline."""
+
+    def __init__(self, shutdown_command: List[str], shutdown_delay_s: int, heartbeat_timeout_s: float = 60,
+                 telemetry: TelemetryStore = None, tick_s: float = 1.0, wheel_size: int = 512,
+                 runner: CommandRunner = None, shutdown_timeout_s: float = 60, events: EventBus = None,
+                 max_units: int = 1024, unit_retention_s: float = 86400):
+        self.shutdown_command = shutdown_command
+        self.shutdown_delay_s = shutdown_delay_s
+        self.heartbeat_timeout_s = heartbeat_timeout_s
+        self.max_units = max_units
+        self.unit_retention_s = unit_retention_s
+        self.shutdown_timeout_s = shutdown_timeout_s
+        self._runner = runner or CommandRunner()
+        self._telemetry = telemetry
+        self._events = events or EventBus()
+        self._units: Dict[str, _Unit] = {}
+        # Offline units in the order they went offline, i.e. eviction candidates
+        self._offline: OrderedDict[str, _Unit] = OrderedDict()
+        self._wheel = TimingWheel(tick_s, wheel_size)
+        self._wheel_task: asyncio.Task = None
+        self._shutdown_tasks: Set[asyncio.Task] = set()
+
+    def start(self) -> None:
+        if self._wheel_task is None:
+            self._wheel_task = asyncio.create_task(self._wheel.run())
+
+    async def close(self) -> None:
+        if self._wheel_task is not None:
+            self._wheel_task.cancel()
+            self._wheel_task = None
+        # A shutdown command that already started is let finish (it is bounded by shutdown_timeout_s),
+        # it may well be what stops this service
+        if self._shutdown_tasks:
+            await asyncio.gather(*self._shutdown_tasks, return_exceptions=True)
+
+    def units(self) -> List[UnitState]:
+        return [unit.state() for unit in self._units.values()]
+
+    def unit(self, unit_id: str) -> Optional[UnitState]:
+        unit = self._units.get(unit_id)
+        return unit.state() if unit else None
+
+    async def process_command(self, command: HcuMessage, addr: Optional[Tuple[str, int]] = None):
+        start = time.perf_counter()
+        try:
+            self._process_command(command, addr)
+        finally:
+            _COMMAND_LATENCY[command.command].observe(time.perf_counter() - start)
+            _COMMANDS_PROCESSED[command.command].inc()
+
+    def _process_command(self, command: HcuMessage, addr: Optional[Tuple[str, int]]):
+        address = addr[0] if addr else None
+        key = command.unit_id or address
+        if key is None:
+            logger.warning('Ignoring %s without unit_id or source address', type(command).__name__)
+            return
+
+        unit = self._units.get(key)
+        if unit is None:
+            if len(self._units) >= self.max_units and not self._evict():
+                logger.warning('Tracking %s units already, ignoring %s from new unit %s', self.max_units, type(command).__name__, key)
+                return
+            unit = self._units[key] = _Unit(key)
+            logger.info('New unit %s', key)
+        unit.address = address or unit.address
+        unit.last_seen = time.time()
+        if not unit.online:
+            unit.online = True
+            self._offline.pop(key, None)
+            logger.info('Unit %s is online', key)
+            self._events.publish(EventType.UNIT_ONLINE, unit=key, address=unit.address)
+        if unit.liveness_timer is not None:
+            self._wheel.cancel(unit.liveness_timer)
+        unit.liveness_timer = self._wheel.schedule(self.heartbeat_timeout_s, self._on_heartbeat_timeout, unit)
+
+        match command:
+            case ShutdownCommand():
+                self._handle_shutdown(unit)
+            case ResumeCommand():
+                self._handle_resume(unit)
+            case HeartbeatCommand():
+                if command.version != unit.version:
+                    logger.info('Unit %s reports version %s', key, command.version)
+                    self._events.publish(EventType.HEARTBEAT_VERSION, unit=key, version=command.version, previous=unit.version)
+                    unit.version = command.version
+            case LogCommand():
+                logger.debug('LOG %s - %s: %s', key, command.key, command.value)
+                if self._telemetry is not None:
+                    self._telemetry.add(f'{key}/{command.key}', command.value, partition=key)
+                self._events.publish(EventType.TELEMETRY, unit=key, key=command.key, value=command.value)
+
+    def _handle_shutdown(self, unit: _Unit) -> None:
+        if unit.shutdown_timer is not None:
+            logger.warning('Shutdown of unit %s already scheduled, ignoring duplicate request.', unit.unit, extra={'rate_limit_key': unit.unit})
+            return
+        logger.info('Scheduling shutdown of unit %s in %s seconds.', unit.unit, self.shutdown_delay_s)
+        unit.shutdown_at = time.time() + self.shutdown_delay_s
+        unit.shutdown_timer = self._wheel.schedule(self.shutdown_delay_s, self._on_shutdown_due, unit)
+        self._events.publish(EventType.SHUTDOWN_SCHEDULED, unit=unit.unit, delay_s=self.shutdown_delay_s, shutdown_at=unit.shutdown_at)
+
+    def _handle_resume(self, unit: _Unit) -> None:
+        if unit.shutdown_timer is None:
+            logger.warning('No shutdown scheduled for unit %s, nothing to resume.', unit.unit, extra={'rate_limit_key': unit.unit})
+            return
+        logger.info('Cancelling scheduled shutdown of unit %s.', unit.unit)
+        self._wheel.cancel(unit.shutdown_timer)
+        unit.shutdown_timer = None
+        unit.shutdown_at = None
+        self._events.publish(EventType.SHUTDOWN_CANCELLED, unit=unit.unit)
+
+    def _on_heartbeat_timeout(self, unit: _Unit) -> None:
+        unit.online = False
+        self._offline[unit.unit] = unit
+        # Re-armed (i.e. cancelled) like the heartbeat timeout when the unit comes back
+        unit.liveness_timer = self._wheel.schedule(self.unit_retention_s, self._on_retention_expired, unit)
+        logger.warning('Unit %s missed heartbeats for %s seconds', unit.unit, self.heartbeat_timeout_s, extra={'rate_limit_key': unit.unit})
+        self._events.publish(EventType.UNIT_OFFLINE, unit=unit.unit, address=unit.address)
+
+    def _on_retention_expired(self, unit: _Unit) -> None:
+        unit.liveness_timer = None
+        if unit.shutdown_timer is not None:
+            unit.liveness_timer = self._wheel.schedule(self.unit_retention_s, self._on_retention_expired, unit)
+            return
+        logger.info('Forgetting unit %s, offline for %s seconds', unit.unit, self.unit_retention_s)
+        self._forget(unit)
+
+    def _evict(self) -> bool:
+        """Forgets the unit that has been offline longest (without a pending shutdown)."""
+        for unit in self._offline.values():
+            if unit.shutdown_timer is None:
+                logger.info('Forgetting offline unit %s to make room for a new one', unit.unit)
+                self._forget(unit)
+                return True
+        return False
+
+    def _forget(self, unit: _Unit) -> None:
+        if unit.liveness_timer is not None:
+            self._wheel.cancel(unit.liveness_timer)
+            unit.liveness_timer = None
+        self._offline.pop(unit.unit, None)
+        del self._units[unit.unit]
+        if self._telemetry is not None:
+            self._telemetry.drop_partition(unit.unit)
+
+    def _on_shutdown_due(self, unit: _Unit) -> None:
+        unit.shutdown_timer = None
+        unit.shutdown_at = None
+        task = asyncio.create_task(self._execute_shutdown(unit.unit, unit.address))
+        self._shutdown_tasks.add(task)
+        task.add_done_callback(self._shutdown_tasks.discard)
+
+    async def _execute_shutdown(self, unit: str, address: Optional[str]) -> None:
+        # Only these exact tokens are replaced, so other braces (e.g. `${HOME}` in a shell snippet) stay as they are
+        command = [arg.replace('{unit}', unit).replace('{address}', address or '') for arg in self.shutdown_command]
+        logger.info('Executing shutdown of unit %s now: %s', unit, ' '.join(command))
+        self._events.publish(EventType.SHUTDOWN_EXECUTING, unit=unit, address=address)
+        result = await self._runner.run(command, timeout_s=self.shutdown_timeout_s)
+        if result.returncode != 0:
+            logger.error('Shutdown command for unit %s failed with exit code %s\n[stdout]\n%s\n[stderr]\n%s',
+                         unit, result.returncode, result.stdout, result.stderr, extra={'rate_limit_key': unit})
@@ -1,7 +1,11 @@
+from collections import OrderedDict
 from enum import StrEnum
-from typing import Annotated, Literal, Union
+import json
+from typing import Annotated, Callable, List, Literal, Union
 
-from pydantic import BaseModel, Field, TypeAdapter
+from pydantic import (BaseModel, ConfigDict, Field, StringConstraints, TypeAdapter,
+                      ValidationError)
+from pydantic_core import from_json
 
 
 class CommandType(StrEnum):
@@ -11,23 +15,40 @@ class CommandType(StrEnum):
     LOG = "LOG"
 
 
+# unit_id ends up in log lines, telemetry keys and (in gateway mode) in shutdown_command arguments,
+# so it must not look like an option (leading `-`) or contain whitespace, quotes or braces
+UnitId = Annotated[str, StringConstraints(pattern=r'^[A-Za-z0-9_.:][A-Za-z0-9_.:-]{0,63}$')]
+
+
 class ShutdownCommand(BaseModel):
+    model_config = ConfigDict(frozen=True)
+
     command: Literal[CommandType.SHUTDOWN]
+    unit_id: UnitId | None = None
 
 
 class ResumeCommand(BaseModel):
+    model_config = ConfigDict(frozen=True)
+
     command: Literal[CommandType.RESUME]
+    unit_id: UnitId | None = None
 
 
 class HeartbeatCommand(BaseModel):
+    model_config = ConfigDict(frozen=True)
+
     command: Literal[CommandType.HEARTBEAT]
     version: str | None = None
+    unit_id: UnitId | None = None
 
 
 class LogCommand(BaseModel):
+    model_config = ConfigDict(frozen=True)
+
     command: Literal[CommandType.LOG]
     key: str
-    value: str
+    value: str | float
+    unit_id: UnitId | None = None
 
 
 # Discriminated union using the 'command' field
@@ -42,6 +63,18 @@ HcuMessage = Annotated[
 ]
 
 
+class CommandResult(BaseModel):
+    status: Literal['ok', 'invalid', 'failed']
+    error: str | None = None
+
+
+class BatchResult(BaseModel):
+    processed: int
+    invalid: int
+    failed: int
+    results: List[CommandResult]
+
+
 # Some helper functions for explicitly parsing messages
 _message_adapter = TypeAdapter(HcuMessage)
 
@@ -49,6 +82,83 @@ def validate_python_message(data: dict) -> HcuMessage:
     """Parse and validate a message dictionary into the appropriate command type."""
     return _message_adapter.validate_python(data)
 
-def validate_json_message(data: str) -> HcuMessage:
+def validate_json_message(data: str | bytes) -> HcuMessage:
     """Parse and validate a JSON string message into the appropriate command type."""
-    return _message_adapter.validate_json(data)
\ No newline at end of file
+    return _message_adapter.validate_json(data)
+
+
+_batch_adapter = TypeAdapter(List[HcuMessage])
+
+def validate_json_batch(data: str | bytes, ndjson: bool = False) -> List[HcuMessage | ValidationError]:
+    """Parse and validate a JSON array of messages (or NDJSON, one message per line) in a single pass.
+    If any item is invalid, the items are validated one by one instead, so the result holds a
+    ValidationError in place of each invalid item. Raises ValidationError if the body is no JSON array."""
+    if isinstance(data, str):
+        data = data.encode()
+    if ndjson:
+        lines = [line for line in data.splitlines() if line.strip()]
+        data = b'[' + b','.join(lines) + b']'
+    try:
+        messages = _batch_adapter.validate_json(data)
+        # A line holding e.g. two comma-separated objects would shift all later items
+        if not ndjson or len(messages) == len(lines):
+            return messages
+    except ValidationError as e:
+        if not ndjson:
+            try:
+                items = json.loads(data)
+            except ValueError:
+                raise e from None
+            if not isinstance(items, list):
+                raise
+            return [_validate_item(_message_adapter.validate_python, item) for item in items]
+    return [_validate_item(_message_adapter.validate_json, line) for line in lines]
+
+def exceeds_batch_size(data: bytes, max_items: int, ndjson: bool = False) -> bool:
+    """Check whether a batch has more than `max_items` items without validating them. Commas (newlines
+    for NDJSON) bound the number of items from above, so only batches that might exceed it are counted."""
+    if ndjson:
+        if data.count(b'\n') + data.count(b'\r') < max_items:
+            return False
+        return sum(1 for line in data.splitlines() if line.strip()) > max_items
+    if data.count(b',') < max_items:
+        return False
+    try:
+        items = from_json(data)
+    except ValueError:
+        # validate_json_batch reports it
+        return False
+    return isinstance(items, list) and len(items) > max_items
+
+def _validate_item(validate: Callable, item) -> HcuMessage | ValidationError:
+    try:
+        return validate(item)
+    except ValidationError as e:
+        return e
+
+
+class MessageDecoder:
+    """Decodes raw datagrams into messages in a single validation pass (surrounding whitespace is
+    accepted by the JSON parser, so no strip copy is needed). Messages are frozen, so results for
+    small repeated payloads (e.g. HEARTBEAT) are kept in a bounded LRU cache keyed by the raw bytes.
+    `parse` replaces JSON validation, e.g. with hcu.binary.decode_binary."""
+
+    def __init__(self, cache_size: int = 32, max_cached_payload: int = 256, parse: Callable[[bytes], HcuMessage] = None):
+        self._cache: OrderedDict[bytes, HcuMessage] = OrderedDict()
+        self._cache_size = cache_size
+        self._max_cached_payload = max_cached_payload
+        self._parse = parse or _message_adapter.validate_json
+
+    def decode(self, data: bytes) -> HcuMessage:
+        """Raises pydantic.ValidationError on malformed JSON or invalid messages (or whatever `parse` raises)."""
+        message = self._cache.get(data)
+        if message is not None:
+            self._cache.move_to_end(data)
+            return message
+
+        message = self._parse(data)
+        if self._cache_size > 0 and len(data) <= self._max_cached_payload:
+            self._cache[data] = message
+            if len(self._cache) > self._cache_size:
+                self._cache.popitem(last=False)
+        return message
\ No newline at end of file
@@ -1,37 +1,73 @@
 import asyncio
-import json
 import logging
-from json import JSONDecodeError
+import time
 from typing import Tuple
 
+from pydantic import ValidationError
+
+from ..config import OverflowPolicy
+from ..metrics import REGISTRY
 from .controller import HcuController
-from .messages import validate_python_message
+from .dispatcher import CommandDispatcher
+from .binary import BinaryFormatError, decode_binary, is_binary
+from .messages import HcuMessage, MessageDecoder
+from .ratelimit import SourceLimiter
 
 logger = logging.getLogger(__name__)
 
+DATAGRAMS_RECEIVED = REGISTRY.counter('msu_hcu_datagrams_received_total', 'UDP datagrams received from the HCU')
+DATAGRAMS_REJECTED = REGISTRY.counter('msu_hcu_datagrams_rejected_total', 'UDP datagrams that failed to decode or validate')
+DATAGRAMS_BINARY = REGISTRY.counter('msu_hcu_datagrams_binary_total', 'UDP datagrams in the binary wire format')
+DATAGRAMS_PARSED = REGISTRY.counter('msu_hcu_datagrams_parsed_total', 'UDP datagrams decoded into a valid message')
+PARSE_LATENCY = REGISTRY.histogram('msu_hcu_parse_seconds', 'Time spent decoding and validating a datagram')
+
 
 class HcuProtocol(asyncio.DatagramProtocol):
-    def __init__(self, controller: HcuController = None):
+    def __init__(self, controller: HcuController = None, queue_size: int = 256, overflow_policy: OverflowPolicy = OverflowPolicy.DROP_OLDEST,
+                 limiter: SourceLimiter = None):
         self._controller = controller
+        self._limiter = limiter
         self._transport = None
+        self._decoder = MessageDecoder()
+        self._binary_decoder = MessageDecoder(parse=decode_binary)
+        self.dispatcher = CommandDispatcher(controller, queue_size, overflow_policy) if controller else None
         
     def connection_made(self, transport: asyncio.DatagramTransport) -> None:
         self._transport = transport
+        if self.dispatcher:
+            self.dispatcher.start()
 
     def datagram_received(self, data: bytes, addr: Tuple[str, int]) -> None:
-        logger.debug(f'Received UDP packet from {addr}: {data}')
+        logger.debug('Received UDP packet from %s: %r', addr, data)
+
+        DATAGRAMS_RECEIVED.inc()
+        if self._limiter is not None and self._limiter.check(data, addr[0], time.monotonic()) is not None:
+            return
 
+        start = time.perf_counter()
         try:
-            json_dict = json.loads(data.strip())
-        except (UnicodeDecodeError, JSONDecodeError):
-            logger.error(f'Failed to decode UDP packet from {addr}: {data}', exc_info=True)
+            if is_binary(data):
+                DATAGRAMS_BINARY.inc()
+                command = self._binary_decoder.decode(data)
+            else:
+                command = self._decoder.decode(data)
+        except (ValidationError, BinaryFormatError) as e:
+            DATAGRAMS_REJECTED.inc()
+            logger.error('Failed to decode UDP packet from %s: %r\n%s', addr, data, e)
             return
-        
-        command = validate_python_message(json_dict)
-        logger.debug(f'Received {type(command).__name__} via UDP: {command.model_dump_json(indent=2)}')
+        PARSE_LATENCY.observe(time.perf_counter() - start)
+        DATAGRAMS_PARSED.inc()
+
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug('Received %s via UDP: %s', type(command).__name__, command.model_dump_json(indent=2))
+
+        self._dispatch(command, addr)
 
-        if self._controller:
-            asyncio.create_task(self._controller.process_command(command))
+    def _dispatch(self, command: HcuMessage, addr: Tuple[str, int]) -> None:
+        if self.dispatcher and not self.dispatcher.put(command, addr):
+            logger.warning('Ingest queue full, dropped %s from %s', type(command).__name__, addr)
 
     def connection_lost(self, exc):
         logger.info('HcuProtocol UDP listener stopped', exc_info=exc)
+        if self.dispatcher:
+            self.dispatcher.close()
@@ -0,0 +1,88 @@
+import logging
+from collections import OrderedDict
+from typing import Optional
+
+from ..metrics import REGISTRY
+
+logger = logging.getLogger(__name__)
+
+DATAGRAMS_THROTTLED = REGISTRY.counter('msu_hcu_datagrams_throttled_total', 'UDP datagrams dropped before decoding', ['reason'])
+
+RATE = 'rate'
+DUPLICATE = 'duplicate'
+
+
+class _Source:
+    __slots__ = ('tokens', 'updated', 'last_payload', 'last_accepted', 'throttled')
+
+    def __init__(self, tokens: float, now: float):
+        self.tokens = tokens
+        self.updated = now
+        self.last_payload: Optional[bytes] = None
+        self.last_accepted = 0.0
+        self.throttled = 0
+
+
+class SourceLimiter:
+    """Per-source token bucket plus suppression of identical consecutive payloads, checked on the raw
+    datagram before it is decoded. A duplicate is let through once per `dedup_window_s`, so repeated
+    HEARTBEATs still arrive; duplicates do not use up tokens. A rate or window of 0 disables that check.
+    At most `max_sources` sources are tracked, the least recently seen one is forgotten first."""
+
+    def __init__(self, rate_per_s: float = 50, burst: int = 100, dedup_window_s: float = 1.0, max_sources: int = 1024):
+        self.rate_per_s = rate_per_s
+        self.burst = burst
+        self.dedup_window_s = dedup_window_s
+        self.max_sources = max_sources
+        self._sources: OrderedDict[str, _Source] = OrderedDict()
+        self._rate_dropped = DATAGRAMS_THROTTLED.labels(RATE)
+        self._duplicate_dropped = DATAGRAMS_THROTTLED.labels(DUPLICATE)
+        self.dropped = {RATE: 0, DUPLICATE: 0}
+
+    def __getstate__(self):
+        # Sent to ingest worker processes, which count into their own metrics
+        return {'rate_per_s': self.rate_per_s, 'burst': self.burst, 'dedup_window_s': self.dedup_window_s, 'max_sources': self.max_sources}
+
+    def __setstate__(self, state):
+        self.__init__(**state)
+
+    def check(self, data: bytes, host: str, now: float) -> Optional[str]:
+        """Returns None if the datagram may be decoded, otherwise the reason for dropping it."""
+        source = self._sources.get(host)
+        if source is None:
+            source = self._sources[host] = _Source(self.burst, now)
+            if len(self._sources) > self.max_sources:
+                self._sources.popitem(last=False)
+        else:
+            self._sources.move_to_end(host)
+
+        if self.dedup_window_s and data == source.last_payload and now - source.last_accepted < self.dedup_window_s:
+            return self._drop(source, host, DUPLICATE)
+
+        if self.rate_per_s:
+            tokens = min(self.burst, source.tokens + (now - source.updated) * self.rate_per_s)
+            source.updated = now
+            if tokens < 1:
+                source.tokens = tokens
+                return self._drop(source, host, RATE)
+            source.tokens = tokens - 1
+
+        # Only report recovery once the bucket has refilled, not for every token during a flood
+        if source.throttled and source.tokens >= self.burst / 2:
+            logger.warning('%s is below the rate limit again, %s datagrams were dropped', host, source.throttled, extra={'rate_limit_key': host})
+            source.throttled = 0
+        source.last_payload = data
+        source.last_accepted = now
+        return None
+
+    def _drop(self, source: _Source, host: str, reason: str) -> str:
+        self.dropped[reason] += 1
+        if reason == DUPLICATE:
+            self._duplicate_dropped.inc()
+            return reason
+
+        self._rate_dropped.inc()
+        if not source.throttled:
+            logger.warning('%s exceeds %s datagrams/s, dropping', host, self.rate_per_s, extra={'rate_limit_key': host})
+        source.throttled += 1
+        return reason
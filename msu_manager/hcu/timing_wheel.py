@@ -0,0 +1,80 @@
+import asyncio
+import logging
+import math
+import time
+from typing import Callable, List, Set
+
+logger = logging.getLogger(__name__)
+
+
+class TimerHandle:
+    __slots__ = ('callback', 'args', 'slot', 'rounds', 'cancelled')
+
+    def __init__(self, callback: Callable, args: tuple, slot: int, rounds: int):
+        self.callback = callback
+        self.args = args
+        self.slot = slot
+        self.rounds = rounds
+        self.cancelled = False
+
+
+class TimingWheel:
+    """Hashed timing wheel. Scheduling and cancelling are O(1); each tick only touches the timers
+    hashed into the current slot, no matter how many timers exist in total. Timers fire with a
+    resolution of `tick_s` (never early). Callbacks run synchronously on the event loop."""
+
+    def __init__(self, tick_s: float = 1.0, size: int = 512):
+        self._tick_s = tick_s
+        self._size = size
+        self._slots: List[Set[TimerHandle]] = [set() for _ in range(size)]
+        self._tick = 0
+        # When the current tick was due (time.monotonic()), None until run() starts
+        self._tick_at = None
+        self._count = 0
+
+    def __len__(self) -> int:
+        return self._count
+
+    def schedule(self, delay_s: float, callback: Callable, *args) -> TimerHandle:
+        # Counted from the start of the current tick, part of which may have passed already
+        elapsed = self._tick_s if self._tick_at is None else max(0.0, time.monotonic() - self._tick_at)
+        ticks = max(1, math.ceil((elapsed + delay_s) / self._tick_s))
+        handle = TimerHandle(callback, args, (self._tick + ticks) % self._size, (ticks - 1) // self._size)
+        self._slots[handle.slot].add(handle)
+        self._count += 1
+        return handle
+
+    def cancel(self, handle: TimerHandle) -> None:
+        if not handle.cancelled:
+            handle.cancelled = True
+            self._slots[handle.slot].discard(handle)
+            self._count -= 1
+
+    def advance(self) -> None:
+        self._tick += 1
+        slot = self._slots[self._tick % self._size]
+        due = []
+        for handle in slot:
+            if handle.rounds == 0:
+                due.append(handle)
+            else:
+                handle.rounds -= 1
+        for handle in due:
+            slot.discard(handle)
+            handle.cancelled = True
+            self._count -= 1
+            try:
+                handle.callback(*handle.args)
+            except Exception:
+                logger.error('Timer callback failed', exc_info=True)
+
+    async def run(self) -> None:
+        self._tick_at = time.monotonic()
+        next_tick = self._tick_at + self._tick_s
+        while True:
+            await asyncio.sleep(max(0.0, next_tick - time.monotonic()))
+            # Catch up on ticks missed while the loop was busy
+            while time.monotonic() >= next_tick:
+                self._tick_at = next_tick
+                self.advance()
+                next_tick += self._tick_s
@@ -0,0 +1,256 @@
+"""Multi-process UDP ingest. Several worker processes bind the same UDP port with SO_REUSEPORT and
+decode datagrams in parallel. Valid commands are forwarded over a Unix stream socket to the owner
+process, which runs the only dispatcher and controller, so shutdown scheduling stays exactly-once.
+
+The kernel picks the worker by hashing the sender's address, so all datagrams of one HCU are handled
+by the same worker and arrive at the owner in order. Decode metrics of the workers live in their own
+processes and are not exported by the owner's /metrics endpoint.
+"""
+import asyncio
+import json
+import logging
+import multiprocessing
+import shutil
+import signal
+import socket
+import struct
+import tempfile
+from pathlib import Path
+from typing import List, Set, Tuple
+
+from ..config import OverflowPolicy
+from ..logs import configure_logging
+from ..metrics import REGISTRY
+from .controller import HcuController
+from .dispatcher import CommandDispatcher
+from .messages import (CommandType, HcuMessage, HeartbeatCommand, LogCommand,
+                       ResumeCommand, ShutdownCommand)
+from .protocol import HcuProtocol
+from .ratelimit import SourceLimiter
+
+logger = logging.getLogger(__name__)
+
+COMMANDS_FORWARDED = REGISTRY.counter('msu_hcu_ingest_forwarded_total', 'Commands received from ingest worker processes')
+WORKER_RESTARTS = REGISTRY.counter('msu_hcu_ingest_worker_restarts_total', 'Ingest worker processes restarted after they exited')
+
+# Frame: length of the rest (I), then source port (H), host length (B), host, JSON body.
+# The re-serialized JSON body can be larger than the datagram it came from, so the length gets 32 bits
+_LENGTH = struct.Struct('<I')
+_SOURCE = struct.Struct('<HB')
+
+_COMMAND_MODELS = {
+    CommandType.SHUTDOWN: ShutdownCommand,
+    CommandType.RESUME: ResumeCommand,
+    CommandType.HEARTBEAT: HeartbeatCommand,
+    CommandType.LOG: LogCommand,
+}
+
+# Worker-side bound on unsent frames; beyond this, commands are dropped instead of buffered
+_MAX_PENDING_BYTES = 1024 * 1024
+
+# Pause before a worker that exited is started again, so one that cannot come up does not spin
+_RESTART_DELAY_S = 1.0
+
+
+def encode_frame(command: HcuMessage, addr: Tuple[str, int]) -> bytes:
+    host = addr[0].encode()
+    body = _SOURCE.pack(addr[1], len(host)) + host + command.model_dump_json(exclude_none=True).encode()
+    return _LENGTH.pack(len(body)) + body
+
+
+def decode_frame(body: bytes) -> Tuple[HcuMessage, Tuple[str, int]]:
+    """Decodes a frame without its length prefix. The worker has already validated the command,
+    so the model is constructed without validating it a second time."""
+    port, host_length = _SOURCE.unpack_from(body)
+    host = body[_SOURCE.size:_SOURCE.size + host_length].decode()
+    fields = json.loads(body[_SOURCE.size + host_length:])
+    command_type = CommandType(fields['command'])
+    fields['command'] = command_type
+    return _COMMAND_MODELS[command_type].model_construct(**fields), (host, port)
+
+
+def reuse_port_socket(bind_address: str, port: int) -> socket.socket:
+    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
+    sock.bind((bind_address, port))
+    return sock
+
+
+class IngestWorkerProtocol(HcuProtocol):
+    """Decodes datagrams like HcuProtocol, but hands valid commands to the owner process."""
+
+    def __init__(self, owner: asyncio.Transport, limiter: SourceLimiter = None):
+        super().__init__(limiter=limiter)
+        self._owner = owner
+        self.dropped = 0
+
+    def _dispatch(self, command: HcuMessage, addr: Tuple[str, int]) -> None:
+        if self._owner.get_write_buffer_size() > _MAX_PENDING_BYTES:
+            self.dropped += 1
+            logger.warning('Owner process is not keeping up, dropped %s from %s', type(command).__name__, addr)
+            return
+        self._owner.write(encode_frame(command, addr))
+
+
+class _WorkerConnection(asyncio.Protocol):
+    def __init__(self, lost: asyncio.Future):
+        self._lost = lost
+
+    def connection_lost(self, exc):
+        if not self._lost.done():
+            self._lost.set_result(None)
+
+
+async def _serve_worker(bind_address: str, port: int, ipc_path: str, limiter: SourceLimiter) -> None:
+    loop = asyncio.get_running_loop()
+    # Bind before connecting, so a successful connection tells the owner that the worker is ready
+    sock = reuse_port_socket(bind_address, port)
+    lost = loop.create_future()
+    owner, _ = await loop.create_unix_connection(lambda: _WorkerConnection(lost), ipc_path)
+    transport, _ = await loop.create_datagram_endpoint(lambda: IngestWorkerProtocol(owner, limiter), sock=sock)
+    try:
+        # The owner closes the connection on shutdown; the kernel does it if the owner dies
+        await lost
+    finally:
+        transport.close()
+
+
+def _worker_main(bind_address: str, port: int, ipc_path: str, log_level: str, limiter: SourceLimiter) -> None:
+    # Ctrl+C reaches the whole process group; the owner decides when workers stop
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    configure_logging(log_level)
+    asyncio.run(_serve_worker(bind_address, port, ipc_path, limiter))
+
+
+class _OwnerConnection(asyncio.Protocol):
+    def __init__(self, pool: 'IngestWorkerPool'):
+        self._pool = pool
+        self._transport: asyncio.Transport = None
+        self._buffer = bytearray()
+
+    def connection_made(self, transport: asyncio.Transport) -> None:
+        self._transport = transport
+        self._pool._connection_made(transport)
+
+    def data_received(self, data: bytes) -> None:
+        buffer = self._buffer
+        buffer += data
+        offset = 0
+        dispatcher = self._pool.dispatcher
+        while len(buffer) - offset >= _LENGTH.size:
+            (length,) = _LENGTH.unpack_from(buffer, offset)
+            end = offset + _LENGTH.size + length
+            if len(buffer) < end:
+                break
+            command, addr = decode_frame(bytes(buffer[offset + _LENGTH.size:end]))
+            offset = end
+            COMMANDS_FORWARDED.inc()
+            if not dispatcher.put(command, addr):
+                logger.warning('Ingest queue full, dropped %s from %s', type(command).__name__, addr)
+        del buffer[:offset]
+
+    def connection_lost(self, exc):
+        self._pool._connection_lost(self._transport)
+
+
+class IngestWorkerPool:
+    """Owner side of multi-process ingest: starts `workers` processes listening on `port` and feeds
+    the commands they forward into a single CommandDispatcher. Each worker gets its own copy of
+    `limiter`; a source is normally always handled by the same worker, so limits still apply per source."""
+
+    def __init__(self, controller: HcuController, workers: int, bind_address: str = '0.0.0.0', port: int = 8001,
+                 queue_size: int = 256, overflow_policy: OverflowPolicy = OverflowPolicy.DROP_OLDEST, log_level: str = 'INFO',
+                 limiter: SourceLimiter = None):
+        self.workers = workers
+        self.bind_address = bind_address
+        self.port = port
+        self.log_level = log_level
+        self.limiter = limiter
+        self.dispatcher = CommandDispatcher(controller, queue_size, overflow_policy)
+        self._processes: List[multiprocessing.Process] = []
+        self._connections: Set[asyncio.Transport] = set()
+        self._ready = asyncio.Event()
+        self._server: asyncio.Server = None
+        self._ipc_dir: str = None
+        self._ipc_path: str = None
+        self._closing = False
+
+    async def start(self, timeout_s: float = 30) -> None:
+        """Returns once all workers are listening. Raises RuntimeError if they do not come up in time."""
+        loop = asyncio.get_running_loop()
+        # Private directory, so only this user can connect and inject commands
+        self._ipc_dir = tempfile.mkdtemp(prefix='msu-ingest-')
+        self._ipc_path = str(Path(self._ipc_dir) / 'owner.sock')
+        self._server = await loop.create_unix_server(lambda: _OwnerConnection(self), self._ipc_path)
+        self.dispatcher.start()
+
+        for i in range(self.workers):
+            self._processes.append(None)
+            self._spawn(i)
+
+        try:
+            await asyncio.wait_for(self._ready.wait(), timeout_s)
+        except asyncio.TimeoutError:
+            await self.close()
+            raise RuntimeError(f'Only {len(self._connections)} of {self.workers} ingest workers started on port {self.port}')
+        logger.info('Started %s ingest workers on %s:%s', self.workers, self.bind_address, self.port)
+
+    async def close(self) -> None:
+        self._closing = True
+        loop = asyncio.get_running_loop()
+        for process in self._processes:
+            if process is not None:
+                loop.remove_reader(process.sentinel)
+        if self._server is not None:
+            self._server.close()
+        for transport in list(self._connections):
+            transport.close()
+        await asyncio.to_thread(self._join)
+        self.dispatcher.close()
+        if self._ipc_dir is not None:
+            shutil.rmtree(self._ipc_dir, ignore_errors=True)
+
+    def _join(self, timeout_s: float = 5) -> None:
+        for process in self._processes:
+            if process is None:
+                continue
+            process.join(timeout_s)
+            if process.is_alive():
+                logger.warning('Ingest worker %s did not stop, terminating it', process.name)
+                process.terminate()
+                process.join()
+        self._processes.clear()
+
+    def _spawn(self, i: int) -> None:
+        if self._closing:
+            return
+        # Spawn instead of fork: the owner already runs threads (e.g. the log listener) and an event loop
+        context = multiprocessing.get_context('spawn')
+        process = context.Process(target=_worker_main, args=(self.bind_address, self.port, self._ipc_path, self.log_level, self.limiter),
+                                  name=f'hcu-ingest-{i}', daemon=True)
+        process.start()
+        self._processes[i] = process
+        # The sentinel becomes readable when the process exits
+        asyncio.get_running_loop().add_reader(process.sentinel, self._worker_exited, i)
+
+    def _worker_exited(self, i: int) -> None:
+        process = self._processes[i]
+        loop = asyncio.get_running_loop()
+        loop.remove_reader(process.sentinel)
+        if self._closing:
+            return
+        # Already gone, this only reaps it
+        process.join(1)
+        logger.error('Ingest worker %s exited with code %s, restarting it', process.name, process.exitcode)
+        WORKER_RESTARTS.inc()
+        loop.call_later(_RESTART_DELAY_S, self._spawn, i)
+
+    def _connection_made(self, transport: asyncio.Transport) -> None:
+        self._connections.add(transport)
+        if len(self._connections) >= self.workers:
+            self._ready.set()
+
+    def _connection_lost(self, transport: asyncio.Transport) -> None:
+        self._connections.discard(transport)
+        if self._server is not None and self._server.is_serving():
+            logger.error('An ingest worker disconnected unexpectedly, %s of %s remain', len(self._connections), self.workers)
@@ -0,0 +1,86 @@
+import atexit
+import logging
+import queue
+import time
+from logging.handlers import QueueHandler, QueueListener
+from typing import Dict, Tuple
+
+LOG_FORMAT = '%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+LOG_DATE_FORMAT = '%Y-%m-%d %H:%M:%S'
+
+_listener: QueueListener = None
+
+
+class RateLimitFilter(logging.Filter):
+    """Collapses repeated WARNING+ records. The first occurrence within `window_s` passes, further
+    ones are counted and dropped. The next occurrence after the window passes again, annotated with
+    how many were suppressed. Records are compared by logger, level and message template, not args,
+    so a message that keeps changing its details (an error text, a countdown) still collapses and the
+    check does not format anything. Records about distinct subjects that should not collapse into
+    each other pass `extra={'rate_limit_key': subject}`."""
+
+    def __init__(self, window_s: float = 60, min_level: int = logging.WARNING, max_tracked: int = 256):
+        super().__init__()
+        self._window_s = window_s
+        self._min_level = min_level
+        self._max_tracked = max_tracked
+        # key -> (window start, suppressed count)
+        self._seen: Dict[Tuple, Tuple[float, int]] = {}
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if record.levelno < self._min_level:
+            return True
+        try:
+            key = (record.name, record.levelno, record.msg, getattr(record, 'rate_limit_key', None))
+            hash(key)
+        except TypeError:
+            key = (record.name, record.levelno, record.getMessage())
+
+        now = time.monotonic()
+        seen = self._seen.get(key)
+        if seen is not None:
+            window_start, suppressed = seen
+            if now - window_start < self._window_s:
+                self._seen[key] = (window_start, suppressed + 1)
+                return False
+            if suppressed:
+                record.msg = f'{record.msg} (repeated {suppressed} more times in the last {now - window_start:.0f}s)'
+        elif len(self._seen) >= self._max_tracked:
+            self._seen.clear()
+        self._seen[key] = (now, 0)
+        return True
+
+
+def configure_logging(level: int | str = logging.INFO, rate_limit_window_s: float = 60) -> None:
+    """Routes all records through a queue to a background listener thread, so the event loop never
+    blocks on stdout/journald writes. Repeated identical warnings and errors are rate limited."""
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+
+    stream_handler = logging.StreamHandler()
+    stream_handler.setFormatter(logging.Formatter(LOG_FORMAT, LOG_DATE_FORMAT))
+
+    log_queue = queue.SimpleQueue()
+    queue_handler = QueueHandler(log_queue)
+    queue_handler.addFilter(RateLimitFilter(rate_limit_window_s))
+
+    root = logging.getLogger()
+    for handler in root.handlers[:]:
+        root.removeHandler(handler)
+    root.addHandler(queue_handler)
+    root.setLevel(level)
+
+    _listener = QueueListener(log_queue, stream_handler, respect_handler_level=True)
+    _listener.start()
+
+
+def stop_logging() -> None:
+    """Flushes all queued records."""
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
+
+
+atexit.register(stop_logging)
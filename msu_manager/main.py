@@ -1,64 +1,62 @@
 import asyncio
 import logging
+import signal
+import threading
 from contextlib import asynccontextmanager
+from typing import Dict, List, Literal
 
-from fastapi import FastAPI, HTTPException, status
+from fastapi import (FastAPI, HTTPException, Query, Request, WebSocket,
+                     WebSocketDisconnect, status)
+from fastapi.responses import PlainTextResponse, StreamingResponse
+from pydantic import ValidationError
 
 from .config import MsuManagerConfig
-from .hcu import HcuController, HcuProtocol
-from .hcu.messages import HcuMessage
-from .uplink.monitor import UplinkMonitor
+from .events import EventBus, EventType, format_sse
+from .hcu.dispatcher import DispatcherStats
+from .hcu.gateway import UnitState
+from .hcu.messages import (BatchResult, CommandResult, HcuMessage,
+                           exceeds_batch_size, validate_json_batch)
+from .logs import configure_logging
+from .metrics import REGISTRY
+from .profiling import LoopStall, format_collapsed
+from .runtime import start_services, stop_services
+from .telemetry import TelemetrySeries
+from .thermal.monitor import SensorReading
+from .uplink.quality import WindowStats
+from .uplink.scheduler import UplinkStatus
 
-logging.basicConfig(
-    level=logging.INFO,
-    format="%(asctime)s - %(name)s - %(levelname)s - %(message)s",
-    datefmt="%Y-%m-%d %H:%M:%S",
-)
+configure_logging(logging.INFO)
 
 logger = logging.getLogger(__name__)
 
 
 async def before_startup(app: FastAPI):
     CONFIG = MsuManagerConfig()
-    app.state.CONFIG = CONFIG
-    logger.info(f'Effective configuration: {CONFIG.model_dump_json(indent=2)}')
+    logger.info('Effective configuration: %s', CONFIG.model_dump_json(indent=2))
 
-    logging.getLogger().setLevel(app.state.CONFIG.log_level.value)
+    configure_logging(CONFIG.log_level.value, CONFIG.log_rate_limit_window_s)
 
-    if CONFIG.hcu_controller.enabled:
-        hcu_controller = HcuController(CONFIG.hcu_controller.shutdown_command, CONFIG.hcu_controller.shutdown_delay_s)
-        app.state.hcu_controller = hcu_controller
+    await start_services(app.state, CONFIG)
+    _close_event_streams_on_exit(app.state.event_bus)
 
-        hcu_bind_address = CONFIG.hcu_controller.udp_bind_address
-        hcu_listen_port = CONFIG.hcu_controller.udp_listen_port
-        loop = asyncio.get_running_loop()
-        transport, protocol = await loop.create_datagram_endpoint(
-            lambda: HcuProtocol(controller=hcu_controller), local_addr=(hcu_bind_address, hcu_listen_port)
-        )
-        app.state.hcu_transport = transport
-        app.state.hcu_protocol = protocol
-
-        logger.info(f'Started HcuProtocol UDP listener on {hcu_bind_address}:{hcu_listen_port}')
-
-    if CONFIG.uplink_monitor.enabled:
-        uplink_monitor = UplinkMonitor(CONFIG.uplink_monitor)
-        app.state.uplink_monitor = uplink_monitor
-        app.state.uplink_monitor_task = asyncio.create_task(uplink_monitor.run())
-
-        logger.info('Started UplinkMonitor')
+def _close_event_streams_on_exit(events: EventBus) -> None:
+    """uvicorn waits for running responses to finish before the lifespan shutdown, so the event
+    streams are ended as soon as it is signalled to exit (its handlers are in place by now)."""
+    if threading.current_thread() is not threading.main_thread():
+        return
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        previous = signal.getsignal(sig)
+        if not callable(previous):
+            continue
+        def handler(signum, frame, previous=previous):
+            loop.call_soon_threadsafe(events.close)
+            previous(signum, frame)
+        signal.signal(sig, handler)
 
 async def after_shutdown(app: FastAPI):
-    if app.state.CONFIG.hcu_controller.enabled:
-        app.state.hcu_transport.close()
+    await stop_services(app.state)
 
-    if app.state.CONFIG.uplink_monitor.enabled:
-        app.state.uplink_monitor_task.cancel()
-        try:
-            await app.state.uplink_monitor_task
-        except asyncio.CancelledError:
-            # Task cancellation is expected here as we've called cancel()
-            pass
-    
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     await before_startup(app)
@@ -71,11 +69,199 @@ app = FastAPI(lifespan=lifespan)
 async def health():
     pass
 
+@app.get('/metrics', response_class=PlainTextResponse)
+async def metrics():
+    return PlainTextResponse(REGISTRY.render(), media_type='text/plain; version=0.0.4')
+
+@app.get('/admin/loop-stalls')
+async def loop_stalls_endpoint() -> List[LoopStall]:
+    return list(app.state.loop_monitor.stalls)
+
+@app.get('/admin/profile', response_class=PlainTextResponse, responses={404: {}, 409: {}})
+async def profile_endpoint(duration_s: float = Query(5, gt=0), interval_ms: float = Query(5, ge=1)):
+    diagnostics = app.state.CONFIG.diagnostics
+    if not diagnostics.profiler_enabled:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail='Profiler is disabled')
+    if duration_s > diagnostics.profiler_max_duration_s:
+        raise HTTPException(status_code=422, detail=f'duration_s must be at most {diagnostics.profiler_max_duration_s}')
+
+    try:
+        stacks = await asyncio.to_thread(app.state.stack_sampler.sample, duration_s, interval_ms / 1000)
+    except RuntimeError as e:
+        raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail=str(e))
+    return PlainTextResponse(format_collapsed(stacks))
+
 @app.post('/hcu-controller/command', status_code=status.HTTP_204_NO_CONTENT, responses={404: {}})
-async def command_endpoint(command: HcuMessage):
-    logger.info(f'Received {type(command).__name__} via HTTP: {command.model_dump_json(indent=2)}')
+async def command_endpoint(command: HcuMessage, request: Request):
+    logger.debug('Received %s via HTTP', type(command).__name__)
     if not app.state.CONFIG.hcu_controller.enabled:
         logger.warning('HcuController is disabled; ignoring command')
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail='HcuController is disabled')
 
-    await app.state.hcu_controller.process_command(command)
\ No newline at end of file
+    client = (request.client.host, request.client.port) if request.client else None
+    await app.state.hcu_controller.process_command(command, client)
+
+_OK = CommandResult(status='ok')
+# Validating larger batches takes milliseconds, don't hold up the event loop for that
+_BATCH_INLINE_BYTES = 65536
+
+def _parse_batch(body: bytes, ndjson: bool, max_commands: int) -> List[HcuMessage | ValidationError]:
+    if exceeds_batch_size(body, max_commands, ndjson):
+        raise HTTPException(status_code=413, detail=f'At most {max_commands} commands per request')
+    return validate_json_batch(body, ndjson)
+
+@app.post('/hcu-controller/commands', responses={404: {}, 413: {}, 422: {}})
+async def batch_command_endpoint(request: Request) -> BatchResult:
+    if not app.state.CONFIG.hcu_controller.enabled:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail='HcuController is disabled')
+
+    config = app.state.CONFIG.hcu_controller
+    # Oversized batches are rejected before they are read and parsed
+    if int(request.headers.get('content-length') or 0) > config.http_batch_max_bytes:
+        raise HTTPException(status_code=413, detail=f'At most {config.http_batch_max_bytes} bytes per request')
+    body = bytearray()
+    async for chunk in request.stream():
+        body += chunk
+        if len(body) > config.http_batch_max_bytes:
+            raise HTTPException(status_code=413, detail=f'At most {config.http_batch_max_bytes} bytes per request')
+    body = bytes(body)
+
+    ndjson = request.headers.get('content-type', '').startswith(('application/x-ndjson', 'application/jsonl'))
+    args = (body, ndjson, config.http_batch_max_commands)
+    try:
+        messages = await asyncio.to_thread(_parse_batch, *args) if len(body) > _BATCH_INLINE_BYTES else _parse_batch(*args)
+    except ValidationError as e:
+        raise HTTPException(status_code=422, detail=e.errors(include_url=False, include_input=False))
+    logger.debug('Received batch of %s commands via HTTP', len(messages))
+
+    # Commands are processed in order, so a SHUTDOWN followed by a RESUME cancels as it would over UDP
+    client = (request.client.host, request.client.port) if request.client else None
+    controller = app.state.hcu_controller
+    results = []
+    invalid = failed = 0
+    for message in messages:
+        if isinstance(message, ValidationError):
+            invalid += 1
+            results.append(CommandResult(status='invalid', error=message.errors(include_url=False)[0]['msg']))
+            continue
+        try:
+            await controller.process_command(message, client)
+        except Exception as e:
+            failed += 1
+            logger.error('Failed to process %s from batch', type(message).__name__, exc_info=True)
+            results.append(CommandResult(status='failed', error=repr(e)))
+            continue
+        results.append(_OK)
+    return BatchResult(processed=len(messages) - invalid - failed, invalid=invalid, failed=failed, results=results)
+
+@app.get('/hcu-controller/ingest-stats', responses={404: {}})
+async def ingest_stats_endpoint() -> DispatcherStats:
+    if not app.state.CONFIG.hcu_controller.enabled:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail='HcuController is disabled')
+
+    return app.state.hcu_dispatcher.stats()
+
+def _gateway_controller():
+    if not app.state.CONFIG.hcu_controller.enabled or not app.state.CONFIG.hcu_controller.gateway_mode:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail='HcuController is not running in gateway mode')
+    return app.state.hcu_controller
+
+@app.get('/hcu-controller/units', responses={404: {}})
+async def units_endpoint() -> List[UnitState]:
+    return _gateway_controller().units()
+
+@app.get('/hcu-controller/units/{unit}', responses={404: {}})
+async def unit_endpoint(unit: str) -> UnitState:
+    state = _gateway_controller().unit(unit)
+    if state is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=f'Unknown unit {unit}')
+    return state
+
+@app.get('/hcu-controller/telemetry')
+async def telemetry_keys_endpoint() -> List[str]:
+    return app.state.telemetry_store.keys()
+
+# Keys may contain `/` (e.g. `<unit>/<key>` in gateway mode)
+@app.get('/hcu-controller/telemetry/{key:path}', responses={404: {}})
+async def telemetry_endpoint(key: str, from_: float = Query(None, alias='from'), to: float = None, step: float = Query(None, gt=0),
+                             source: Literal['memory', 'disk'] = 'memory') -> TelemetrySeries:
+    if source == 'disk':
+        segment_store = app.state.telemetry_store.persistence
+        if segment_store is None:
+            raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail='Telemetry persistence is disabled')
+        snapshot = await segment_store.snapshot(key, from_, to)
+    else:
+        snapshot = app.state.telemetry_store.snapshot(key)
+    if snapshot is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=f'No telemetry for key {key}')
+
+    # Aggregate the copied data off the event loop so UDP ingestion is not held up
+    return await asyncio.to_thread(snapshot.aggregate, from_, to, step)
+
+@app.get('/uplink-monitor/status', responses={404: {}})
+async def uplink_status_endpoint() -> UplinkStatus:
+    if not app.state.CONFIG.uplink_monitor.enabled:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail='UplinkMonitor is disabled')
+
+    return app.state.uplink_monitor.status()
+
+@app.get('/uplink-monitor/stats', responses={404: {}})
+async def uplink_stats_endpoint() -> Dict[str, Dict[str, WindowStats]]:
+    if not app.state.CONFIG.uplink_monitor.enabled:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail='UplinkMonitor is disabled')
+
+    return app.state.uplink_monitor.stats()
+
+@app.get('/thermal-monitor/sensors', responses={404: {}})
+async def thermal_sensors_endpoint() -> List[SensorReading]:
+    if not app.state.CONFIG.thermal_monitor.enabled:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail='ThermalMonitor is disabled')
+
+    return app.state.thermal_monitor.readings()
+
+
+@app.get('/events', response_class=StreamingResponse)
+async def events_endpoint(types: List[EventType] = Query(None)):
+    subscription = app.state.event_bus.subscribe(types)
+
+    async def stream():
+        try:
+            while True:
+                try:
+                    event = await asyncio.wait_for(subscription.get(), 15)
+                except asyncio.TimeoutError:
+                    # Comment line, keeps proxies from closing an idle stream
+                    yield b': keep-alive\n\n'
+                    continue
+                if event is None:
+                    # Dropped for falling behind, the client reconnects
+                    return
+                yield format_sse(event)
+        finally:
+            app.state.event_bus.unsubscribe(subscription)
+
+    return StreamingResponse(stream(), media_type='text/event-stream', headers={'Cache-Control': 'no-cache'})
+
+@app.websocket('/events/ws')
+async def events_websocket(websocket: WebSocket, types: List[EventType] = Query(None)):
+    await websocket.accept()
+    subscription = app.state.event_bus.subscribe(types)
+
+    async def watch_disconnect():
+        # Nothing is expected from the client, but its close has to end the subscription
+        while (await websocket.receive())['type'] != 'websocket.disconnect':
+            pass
+        app.state.event_bus.unsubscribe(subscription)
+
+    watcher = asyncio.create_task(watch_disconnect())
+    try:
+        async for event in subscription:
+            await websocket.send_text(event.model_dump_json())
+        if not watcher.done():
+            # Dropped for falling behind: 1013 = try again later, or shutting down: 1001 = going away
+            await websocket.close(code=1001 if app.state.event_bus.closed else 1013)
+    except (WebSocketDisconnect, OSError):
+        pass
+    finally:
+        watcher.cancel()
+        app.state.event_bus.unsubscribe(subscription)
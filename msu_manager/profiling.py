@@ -0,0 +1,170 @@
+"""Event loop diagnostics: lag sampling, stall detection and an on-demand stack sampling profiler.
+
+All of it works from outside the loop's callbacks, so the loop itself only pays for one timer
+per lag interval. A watchdog thread notices when that timer is overdue and records what the loop
+thread is executing at that moment; the profiler thread only exists while a profile is taken.
+"""
+import asyncio
+import logging
+import os
+import sys
+import threading
+import time
+import traceback
+from collections import Counter, deque
+from types import FrameType
+from typing import Deque, List, Optional
+
+from pydantic import BaseModel
+
+from .metrics import LOOP_LAG, REGISTRY
+
+logger = logging.getLogger(__name__)
+
+LOOP_STALLS = REGISTRY.counter('msu_event_loop_stalls_total', 'Callbacks that blocked the event loop longer than the slow callback threshold')
+
+_HANDLE_RUN = asyncio.Handle._run.__code__
+_MAX_REPR = 200
+
+
+class LoopStall(BaseModel):
+    detected_at: float
+    duration_s: float
+    handle: str | None
+    task: str | None
+    stack: List[str]
+
+
+def _describe_handle(frame: FrameType) -> tuple[str | None, str | None]:
+    """Finds the Handle being run further up the stack (asyncio.Handle._run's `self`)."""
+    while frame is not None:
+        if frame.f_code is _HANDLE_RUN:
+            handle = frame.f_locals.get('self')
+            owner = getattr(getattr(handle, '_callback', None), '__self__', None)
+            task = None
+            if isinstance(owner, asyncio.Task):
+                task = f'{owner.get_name()} {getattr(owner.get_coro(), "__qualname__", "")}'.strip()
+            return repr(handle)[:_MAX_REPR], task
+        frame = frame.f_back
+    return None, None
+
+
+class LoopMonitor:
+    """Samples event loop lag into `msu_event_loop_lag_seconds` and, with `slow_callback_s` > 0,
+    runs a watchdog thread that records a LoopStall (with the loop thread's stack) whenever a lag
+    sample is overdue by more than that. Blocks longer than `interval_s + slow_callback_s` are
+    always caught, shorter ones only if they overlap a sample."""
+
+    def __init__(self, interval_s: float = 0.5, slow_callback_s: float = 0.1, history: int = 32):
+        self._interval_s = interval_s
+        self._slow_callback_s = slow_callback_s
+        self.stalls: Deque[LoopStall] = deque(maxlen=history)
+        self._last_tick = time.monotonic()
+        self._stall: Optional[LoopStall] = None
+        self._stop = threading.Event()
+        self._thread_id: Optional[int] = None
+
+    async def run(self) -> None:
+        loop = asyncio.get_running_loop()
+        self._thread_id = threading.get_ident()
+        self._last_tick = time.monotonic()
+        if self._slow_callback_s > 0:
+            self._stop.clear()
+            threading.Thread(target=self._watch, name='loop-watchdog', daemon=True).start()
+        try:
+            while True:
+                expected = loop.time() + self._interval_s
+                await asyncio.sleep(self._interval_s)
+                LOOP_LAG.observe(max(0.0, loop.time() - expected))
+                self._tick()
+        finally:
+            self._stop.set()
+
+    def _tick(self) -> None:
+        now = time.monotonic()
+        stall = self._stall
+        if stall is not None:
+            # The watchdog only saw the start of it
+            stall.duration_s = now - self._last_tick - self._interval_s
+            logger.warning('Event loop was blocked for %.3f seconds by %s', stall.duration_s, stall.handle or 'unknown code')
+            self._stall = None
+        self._last_tick = now
+
+    def _watch(self) -> None:
+        # Sleeps until the next lag sample is overdue, so this wakes up about once per interval
+        checked_tick = None
+        while True:
+            last_tick = self._last_tick
+            if last_tick == checked_tick:
+                # Still blocked (or already reported), look again later
+                timeout_s = self._slow_callback_s
+            else:
+                timeout_s = max(0.0, last_tick + self._interval_s + self._slow_callback_s - time.monotonic())
+            if self._stop.wait(timeout_s):
+                return
+            if self._last_tick == last_tick and last_tick != checked_tick:
+                checked_tick = last_tick
+                self._record_stall(time.monotonic() - last_tick - self._interval_s)
+
+    def _record_stall(self, overdue_s: float) -> None:
+        frame = sys._current_frames().get(self._thread_id)
+        if frame is None:
+            return
+        handle, task = _describe_handle(frame)
+        stack = [line.rstrip() for line in traceback.format_stack(frame)]
+        del frame
+        stall = LoopStall(detected_at=time.time(), duration_s=overdue_s, handle=handle, task=task, stack=stack)
+        self._stall = stall
+        self.stalls.append(stall)
+        LOOP_STALLS.inc()
+        logger.warning('Event loop blocked for more than %s seconds by %s in\n%s', self._slow_callback_s, handle or 'unknown code', ''.join(stack[-5:]))
+
+
+def _frame_name(frame: FrameType) -> str:
+    code = frame.f_code
+    name = getattr(code, 'co_qualname', code.co_name)
+    # `;` separates frames in the collapsed format
+    return f'{os.path.basename(code.co_filename)}:{name}'.replace(';', ':')
+
+
+class StackSampler:
+    """Samples the stack of one thread (the event loop's) at a fixed interval and aggregates the
+    samples into collapsed stacks (`root;...;leaf count` per line), the input format of
+    flamegraph.pl, speedscope and similar tools. Only one profile can be taken at a time."""
+
+    def __init__(self, thread_id: int = None):
+        self._thread_id = thread_id or threading.get_ident()
+        self._lock = threading.Lock()
+
+    def sample(self, duration_s: float, interval_s: float = 0.005) -> Counter:
+        """Blocks for `duration_s`, so run it in another thread than the one being sampled."""
+        if not self._lock.acquire(blocking=False):
+            raise RuntimeError('A profile is already being taken')
+        try:
+            stacks = Counter()
+            names = {}
+            deadline = time.monotonic() + duration_s
+            while time.monotonic() < deadline:
+                frame = sys._current_frames().get(self._thread_id)
+                if frame is None:
+                    break
+                frames = []
+                while frame is not None:
+                    frames.append(frame)
+                    frame = frame.f_back
+                key = []
+                for f in reversed(frames):
+                    name = names.get(f.f_code)
+                    if name is None:
+                        name = names[f.f_code] = _frame_name(f)
+                    key.append(name)
+                del frames
+                stacks[';'.join(key)] += 1
+                time.sleep(interval_s)
+            return stacks
+        finally:
+            self._lock.release()
+
+
+def format_collapsed(stacks: Counter) -> str:
+    return ''.join(f'{stack} {count}\n' for stack, count in stacks.most_common())
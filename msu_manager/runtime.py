@@ -0,0 +1,178 @@
+import asyncio
+import logging
+
+from .commands import CommandHelper, CommandRunner
+from .config import MsuManagerConfig
+from .events import EventBus
+from .hcu import (GatewayController, HcuController, HcuProtocol,
+                  IngestWorkerPool, SourceLimiter)
+from .profiling import LoopMonitor, StackSampler
+from .telemetry import SegmentStore, TelemetryStore, TelemetryUploader
+from .thermal.monitor import ThermalMonitor
+from .uplink.monitor import UplinkMonitor
+
+logger = logging.getLogger(__name__)
+
+
+async def start_services(state, CONFIG: MsuManagerConfig) -> None:
+    """Starts all enabled components and stores them as attributes of `state` (e.g. FastAPI's app.state)."""
+    state.CONFIG = CONFIG
+    diagnostics = CONFIG.diagnostics
+    state.loop_monitor = LoopMonitor(diagnostics.loop_lag_interval_s, diagnostics.slow_callback_s, diagnostics.slow_callback_history)
+    state.loop_lag_task = asyncio.create_task(state.loop_monitor.run())
+    # Must be created on the event loop's thread, which it samples
+    state.stack_sampler = StackSampler()
+
+    commands = CONFIG.commands
+    helper = CommandHelper(commands.helper_command, commands.capture_bytes) if commands.helper_command else None
+    runner = CommandRunner(commands.max_concurrency, commands.default_timeout_s, commands.kill_grace_s, commands.capture_bytes, helper)
+    state.command_runner = runner
+
+    events = EventBus(CONFIG.events.queue_size)
+    state.event_bus = events
+
+    segment_store = None
+    if CONFIG.telemetry.persistence.enabled:
+        persistence = CONFIG.telemetry.persistence
+        segment_store = SegmentStore(
+            persistence.directory,
+            segment_size_kb=persistence.segment_size_kb,
+            segment_max_age_s=persistence.segment_max_age_s,
+            compact_after_s=persistence.compact_after_s,
+            compact_step_s=persistence.compact_step_s,
+            max_disk_mb=persistence.max_disk_mb,
+            flush_interval_s=persistence.flush_interval_s,
+        )
+        state.segment_store_task = asyncio.create_task(segment_store.run())
+
+    uplink_monitor = UplinkMonitor(CONFIG.uplink_monitor, runner, events=events) if CONFIG.uplink_monitor.enabled else None
+
+    uploader = None
+    if CONFIG.telemetry.upload.enabled:
+        upload = CONFIG.telemetry.upload
+        uploader = TelemetryUploader(
+            upload.url,
+            upload.spool_directory,
+            batch_max_records=upload.batch_max_records,
+            batch_max_age_s=upload.batch_max_age_s,
+            spool_max_disk_mb=upload.spool_max_disk_mb,
+            timeout_s=upload.timeout_s,
+            headers={name: value.get_secret_value() for name, value in upload.headers.items()},
+            link_up=uplink_monitor.link_up if uplink_monitor is not None else None,
+        )
+        state.telemetry_uploader_task = asyncio.create_task(uploader.run())
+
+    gateway_mode = CONFIG.hcu_controller.enabled and CONFIG.hcu_controller.gateway_mode
+    telemetry_store = TelemetryStore(CONFIG.telemetry.memory_budget_kb, CONFIG.telemetry.max_keys, CONFIG.telemetry.bucket_s, segment_store, uploader,
+                                     max_partitions=CONFIG.hcu_controller.gateway_max_units if gateway_mode else 0,
+                                     max_keys_per_partition=CONFIG.telemetry.max_keys_per_unit,
+                                     partitions={'thermal': CONFIG.thermal_monitor.max_keys} if CONFIG.thermal_monitor.enabled else None)
+    state.telemetry_store = telemetry_store
+
+    if CONFIG.hcu_controller.enabled:
+        if CONFIG.hcu_controller.gateway_mode:
+            hcu_controller = GatewayController(CONFIG.hcu_controller.shutdown_command, CONFIG.hcu_controller.shutdown_delay_s,
+                                               CONFIG.hcu_controller.heartbeat_timeout_s, telemetry_store, runner=runner,
+                                               shutdown_timeout_s=CONFIG.hcu_controller.shutdown_timeout_s, events=events,
+                                               max_units=CONFIG.hcu_controller.gateway_max_units,
+                                               unit_retention_s=CONFIG.hcu_controller.gateway_unit_retention_s)
+            hcu_controller.start()
+        else:
+            hcu_controller = HcuController(CONFIG.hcu_controller.shutdown_command, CONFIG.hcu_controller.shutdown_delay_s, telemetry_store,
+                                           runner, CONFIG.hcu_controller.shutdown_timeout_s, events)
+        state.hcu_controller = hcu_controller
+
+        limiter = SourceLimiter(CONFIG.hcu_controller.ingest_rate_limit_per_s, CONFIG.hcu_controller.ingest_rate_limit_burst,
+                                CONFIG.hcu_controller.ingest_dedup_window_s)
+        hcu_bind_address = CONFIG.hcu_controller.udp_bind_address
+        hcu_listen_port = CONFIG.hcu_controller.udp_listen_port
+        if CONFIG.hcu_controller.ingest_workers > 1:
+            ingest_pool = IngestWorkerPool(
+                hcu_controller,
+                CONFIG.hcu_controller.ingest_workers,
+                hcu_bind_address,
+                hcu_listen_port,
+                queue_size=CONFIG.hcu_controller.ingest_queue_size,
+                overflow_policy=CONFIG.hcu_controller.ingest_overflow_policy,
+                log_level=CONFIG.log_level.value,
+                limiter=limiter,
+            )
+            await ingest_pool.start()
+            state.hcu_ingest_pool = ingest_pool
+            state.hcu_dispatcher = ingest_pool.dispatcher
+        else:
+            loop = asyncio.get_running_loop()
+            transport, protocol = await loop.create_datagram_endpoint(
+                lambda: HcuProtocol(
+                    controller=hcu_controller,
+                    queue_size=CONFIG.hcu_controller.ingest_queue_size,
+                    overflow_policy=CONFIG.hcu_controller.ingest_overflow_policy,
+                    limiter=limiter,
+                ),
+                local_addr=(hcu_bind_address, hcu_listen_port)
+            )
+            state.hcu_transport = transport
+            state.hcu_protocol = protocol
+            state.hcu_dispatcher = protocol.dispatcher
+
+            logger.info('Started HcuProtocol UDP listener on %s:%s', hcu_bind_address, hcu_listen_port)
+
+    if CONFIG.thermal_monitor.enabled:
+        thermal_monitor = ThermalMonitor(CONFIG.thermal_monitor, getattr(state, 'hcu_controller', None), telemetry_store, events)
+        state.thermal_monitor = thermal_monitor
+        state.thermal_monitor_task = asyncio.create_task(thermal_monitor.run())
+
+        logger.info('Started ThermalMonitor')
+
+    if uplink_monitor is not None:
+        state.uplink_monitor = uplink_monitor
+        state.uplink_monitor_task = asyncio.create_task(uplink_monitor.run())
+
+        logger.info('Started UplinkMonitor')
+
+async def stop_services(state) -> None:
+    state.event_bus.close()
+    state.loop_lag_task.cancel()
+
+    if state.CONFIG.hcu_controller.enabled:
+        if state.CONFIG.hcu_controller.ingest_workers > 1:
+            await state.hcu_ingest_pool.close()
+        else:
+            state.hcu_transport.close()
+        if state.CONFIG.hcu_controller.gateway_mode:
+            await state.hcu_controller.close()
+
+    if state.CONFIG.uplink_monitor.enabled:
+        state.uplink_monitor_task.cancel()
+        try:
+            await state.uplink_monitor_task
+        except asyncio.CancelledError:
+            # Task cancellation is expected here as we've called cancel()
+            pass
+
+    if state.CONFIG.thermal_monitor.enabled:
+        state.thermal_monitor_task.cancel()
+        try:
+            await state.thermal_monitor_task
+        except asyncio.CancelledError:
+            # Task cancellation is expected here as we've called cancel(); sensor files are closed on cancel
+            pass
+
+    if state.CONFIG.telemetry.persistence.enabled:
+        state.segment_store_task.cancel()
+        try:
+            await state.segment_store_task
+        except asyncio.CancelledError:
+            # Task cancellation is expected here as we've called cancel(); the store flushes on cancel
+            pass
+
+    if state.CONFIG.telemetry.upload.enabled:
+        state.telemetry_uploader_task.cancel()
+        try:
+            await state.telemetry_uploader_task
+        except asyncio.CancelledError:
+            # Task cancellation is expected here as we've called cancel(); buffered records are spooled on cancel
+            pass
+
+    if state.command_runner.helper is not None:
+        await state.command_runner.helper.close()
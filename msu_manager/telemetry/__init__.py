@@ -0,0 +1,3 @@
+from .segments import SegmentStore
+from .store import TelemetrySeries, TelemetryStore
+from .upload import TelemetryUploader
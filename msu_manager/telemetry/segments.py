@@ -0,0 +1,430 @@
+import asyncio
+import logging
+import math
+import mmap
+import os
+import struct
+import time
+import zlib
+from array import array
+from typing import Dict, List, Optional, Tuple
+
+from .store import SeriesSnapshot
+
+logger = logging.getLogger(__name__)
+
+_MAGIC = b'MSUT'
+_VERSION = 1
+_KIND_RAW = 0
+_KIND_COMPACTED = 1
+
+# magic, version, kind, record size, created (unix ts), bucket step (compacted only)
+_HEADER = struct.Struct('<4sBBHdI12x')
+# ts, value, key id, check
+_RAW_RECORD = struct.Struct('<dfHH')
+# ts (bucket start), min, max, avg, count, key id, check
+_BUCKET_RECORD = struct.Struct('<dfffIHH4x')
+_TS = struct.Struct('<d')
+
+_RECORDS = {_KIND_RAW: _RAW_RECORD, _KIND_COMPACTED: _BUCKET_RECORD}
+
+
+def _check(record: bytes) -> int:
+    # The check field sits after all payload fields (and before padding)
+    return zlib.crc32(record) & 0xFFFF
+
+
+def _pack_raw(ts: float, value: float, key_id: int) -> bytes:
+    payload = struct.pack('<dfH', ts, value, key_id)
+    return payload + struct.pack('<H', _check(payload))
+
+
+def _pack_bucket(ts: float, mn: float, mx: float, avg: float, count: int, key_id: int) -> bytes:
+    payload = struct.pack('<dfffIH', ts, mn, mx, avg, count, key_id)
+    return payload + struct.pack('<H', _check(payload)) + b'\x00' * 4
+
+
+def _record_valid(buf, offset: int, record: struct.Struct) -> bool:
+    check_offset = record.size - (6 if record is _BUCKET_RECORD else 2)
+    payload = bytes(buf[offset:offset + check_offset])
+    (check,) = struct.unpack_from('<H', buf, offset + check_offset)
+    return _TS.unpack_from(buf, offset)[0] != 0 and _check(payload) == check
+
+
+def _count_records(buf, capacity: int, record: struct.Struct) -> int:
+    """Records are appended to zero-filled space, so the valid ones form a prefix that can be found
+    with a binary search on the timestamp. A torn last record is discarded."""
+    lo, hi = 0, capacity
+    while lo < hi:
+        mid = (lo + hi) // 2
+        if _TS.unpack_from(buf, _HEADER.size + mid * record.size)[0] != 0:
+            lo = mid + 1
+        else:
+            hi = mid
+    if lo > 0 and not _record_valid(buf, _HEADER.size + (lo - 1) * record.size, record):
+        lo -= 1
+    return lo
+
+
+def _lower_bound(buf, count: int, record: struct.Struct, ts: float) -> int:
+    lo, hi = 0, count
+    while lo < hi:
+        mid = (lo + hi) // 2
+        if _TS.unpack_from(buf, _HEADER.size + mid * record.size)[0] < ts:
+            lo = mid + 1
+        else:
+            hi = mid
+    return lo
+
+
+class _Segment:
+    """A sealed (read-only) segment file."""
+    __slots__ = ('path', 'kind', 'start', 'end', 'count', 'size')
+
+    def __init__(self, path: str, kind: int, start: float, end: float, count: int, size: int):
+        self.path = path
+        self.kind = kind
+        self.start = start
+        self.end = end
+        self.count = count
+        self.size = size
+
+
+class _ActiveSegment:
+    """Preallocated raw segment that records are appended to sequentially. Creating and sealing
+    one waits for the disk, so SegmentStore does both in a thread."""
+
+    def __init__(self, path: str, capacity: int, created: float, count: int = 0, start: float = None, end: float = None):
+        self.path = path
+        self.capacity = capacity
+        self.created = created
+        self.count = count
+        self.start = start
+        self.end = end
+        self.fd = os.open(path, os.O_RDWR)
+
+    @classmethod
+    def create(cls, path: str, capacity: int) -> '_ActiveSegment':
+        created = time.time()
+        size = _HEADER.size + capacity * _RAW_RECORD.size
+        fd = os.open(path, os.O_RDWR | os.O_CREAT | os.O_EXCL, 0o644)
+        try:
+            try:
+                os.posix_fallocate(fd, 0, size)
+            except OSError:
+                os.ftruncate(fd, size)
+            os.pwrite(fd, _HEADER.pack(_MAGIC, _VERSION, _KIND_RAW, _RAW_RECORD.size, created, 0), 0)
+            os.fsync(fd)
+        finally:
+            os.close(fd)
+        return cls(path, capacity, created)
+
+    def activate(self) -> None:
+        """Restarts the age of a segment that was created ahead of time (page cache only)."""
+        self.created = time.time()
+        os.pwrite(self.fd, _HEADER.pack(_MAGIC, _VERSION, _KIND_RAW, _RAW_RECORD.size, self.created, 0), 0)
+
+    def write(self, data: bytes, n_records: int) -> None:
+        os.pwrite(self.fd, data, _HEADER.size + self.count * _RAW_RECORD.size)
+        self.count += n_records
+
+    def sealed(self) -> _Segment:
+        return _Segment(self.path, _KIND_RAW, self.start, self.end, self.count, _HEADER.size + self.count * _RAW_RECORD.size)
+
+    def seal(self) -> None:
+        """Trims the preallocated space and closes the file."""
+        os.ftruncate(self.fd, _HEADER.size + self.count * _RAW_RECORD.size)
+        os.fsync(self.fd)
+        os.close(self.fd)
+
+
+def _read_segment(path: str, kind: int, count: int, key_id: int, start: float, end: float) -> List[Tuple[float, ...]]:
+    record = _RECORDS[kind]
+    try:
+        with open(path, 'rb') as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            count = min(count, (len(mm) - _HEADER.size) // record.size)
+            rows = []
+            for i in range(_lower_bound(mm, count, record, start), count):
+                row = record.unpack_from(mm, _HEADER.size + i * record.size)
+                if row[0] > end:
+                    break
+                if row[-2] == key_id:
+                    rows.append(row)
+            return rows
+    except FileNotFoundError:
+        # Removed by compaction in the meantime; its data lives on in the compacted segment
+        return []
+
+
+class SegmentStore:
+    """Persistent, append-only telemetry log. Raw samples go into preallocated segment files
+    which roll over by size or age. Old raw segments are compacted into min/max/avg buckets and the
+    oldest segments are removed once `max_disk_mb` is exceeded. Nothing but the write buffer and
+    the segment index is held in memory; reads go through mmap."""
+
+    def __init__(self, directory: str, segment_size_kb: int = 1024, segment_max_age_s: float = 86400,
+                 compact_after_s: float = 7 * 86400, compact_step_s: int = 300, max_disk_mb: int = 64,
+                 flush_interval_s: float = 5, flush_max_records: int = 256):
+        self._directory = directory
+        self._capacity = max(1, (segment_size_kb * 1024 - _HEADER.size) // _RAW_RECORD.size)
+        self._segment_max_age_s = segment_max_age_s
+        self._compact_after_s = compact_after_s
+        self._compact_step_s = compact_step_s
+        self._max_disk_bytes = max_disk_mb * 1024 * 1024
+        self._flush_interval_s = flush_interval_s
+        self._flush_max_records = flush_max_records
+
+        self._key_ids: Dict[str, int] = {}
+        self._sealed: List[_Segment] = []
+        self._active: _ActiveSegment = None
+        # Segments are created ahead of time and sealed after a roll-over, both in run(), so that
+        # append() never waits for the disk
+        self._spare: Optional[_ActiveSegment] = None
+        self._rolled: List[_ActiveSegment] = []
+        self._keys_file = None
+        self._keys_dirty = False
+        self._buffer = bytearray()
+        self._buffered: List[Tuple[float, float, int]] = []
+        self._last_ts = 0.0
+
+        os.makedirs(directory, exist_ok=True)
+        self._open()
+
+    def _keys_path(self) -> str:
+        return os.path.join(self._directory, 'keys.txt')
+
+    def _open(self) -> None:
+        if os.path.exists(self._keys_path()):
+            with open(self._keys_path()) as f:
+                for line in f:
+                    self._key_ids[line.rstrip('\n')] = len(self._key_ids)
+
+        names = sorted(n for n in os.listdir(self._directory) if n.endswith('.seg'))
+        raw = []
+        for name in names:
+            path = os.path.join(self._directory, name)
+            if os.path.getsize(path) < _HEADER.size:
+                logger.warning('Ignoring truncated telemetry segment %s', path)
+                continue
+            with open(path, 'rb') as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+                magic, version, kind, record_size, created, _ = _HEADER.unpack_from(mm)
+                if magic != _MAGIC or version != _VERSION or kind not in _RECORDS or record_size != _RECORDS[kind].size:
+                    logger.warning('Ignoring unknown telemetry segment %s', path)
+                    continue
+                capacity = (len(mm) - _HEADER.size) // record_size
+                count = _count_records(mm, capacity, _RECORDS[kind])
+                start = _TS.unpack_from(mm, _HEADER.size)[0] if count else None
+                end = _TS.unpack_from(mm, _HEADER.size + (count - 1) * record_size)[0] if count else None
+            if end is not None:
+                self._last_ts = max(self._last_ts, end)
+            if kind == _KIND_RAW:
+                raw.append((path, capacity, created, count, start, end))
+            else:
+                self._sealed.append(_Segment(path, kind, start, end, count, _HEADER.size + count * record_size))
+
+        # After a crash there may be a spare segment created ahead of time (empty) and segments
+        # that were rolled over but not trimmed yet. Writing resumes in the newest one holding records.
+        for path, capacity, created, count, start, end in raw:
+            if count == 0:
+                os.remove(path)
+        raw = [segment for segment in raw if segment[3] > 0]
+        if raw and raw[-1][3] < raw[-1][1]:
+            self._active = _ActiveSegment(*raw.pop())
+        for path, capacity, created, count, start, end in raw:
+            size = _HEADER.size + count * _RAW_RECORD.size
+            if capacity > count:
+                with open(path, 'r+b') as f:
+                    os.ftruncate(f.fileno(), size)
+                    os.fsync(f.fileno())
+            self._sealed.append(_Segment(path, _KIND_RAW, start, end, count, size))
+        self._sealed.sort(key=lambda s: s.start if s.start is not None else math.inf)
+        self._keys_file = open(self._keys_path(), 'a')
+        logger.info('Opened telemetry segment store in %s (%s sealed segments, %s keys)', self._directory, len(self._sealed), len(self._key_ids))
+
+    def _key_id(self, key: str) -> int:
+        key_id = self._key_ids.get(key)
+        if key_id is None:
+            if len(self._key_ids) >= 0xFFFF or '\n' in key:
+                raise ValueError(f'Cannot persist telemetry key {key!r}')
+            key_id = self._key_ids[key] = len(self._key_ids)
+            # Made durable by the next sync()
+            self._keys_file.write(key + '\n')
+            self._keys_file.flush()
+            self._keys_dirty = True
+        return key_id
+
+    def append(self, key: str, value: float, ts: float = None) -> None:
+        # Keep timestamps monotonic within the log so range reads can binary search
+        ts = max(time.time() if ts is None else ts, self._last_ts)
+        self._last_ts = ts
+        key_id = self._key_id(key)
+        self._buffer += _pack_raw(ts, value, key_id)
+        self._buffered.append((ts, value, key_id))
+        if len(self._buffered) >= self._flush_max_records:
+            self.flush()
+
+    def flush(self) -> None:
+        """Writes buffered records to the active segment (page cache only, see sync())."""
+        offset = 0
+        while offset < len(self._buffered):
+            if self._active is None or self._active.count >= self._active.capacity:
+                self._roll()
+            n = min(len(self._buffered) - offset, self._active.capacity - self._active.count)
+            chunk = self._buffered[offset:offset + n]
+            self._active.write(bytes(self._buffer[offset * _RAW_RECORD.size:(offset + n) * _RAW_RECORD.size]), n)
+            if self._active.start is None:
+                self._active.start = chunk[0][0]
+            self._active.end = chunk[-1][0]
+            offset += n
+        self._buffer.clear()
+        self._buffered.clear()
+
+    def sync(self) -> None:
+        """Makes new keys and flushed records durable (blocking, run() calls it in a thread)."""
+        if self._keys_dirty:
+            self._keys_dirty = False
+            os.fsync(self._keys_file.fileno())
+        active = self._active
+        if active is not None:
+            os.fdatasync(active.fd)
+
+    def _new_segment(self) -> _ActiveSegment:
+        return _ActiveSegment.create(os.path.join(self._directory, f'raw-{time.time_ns():020d}.seg'), self._capacity)
+
+    def _roll(self) -> None:
+        if self._active is not None:
+            if self._active.count > 0:
+                # Readable as it is, the preallocated space is trimmed later
+                self._sealed.append(self._active.sealed())
+                self._rolled.append(self._active)
+            else:
+                os.close(self._active.fd)
+                os.remove(self._active.path)
+        if self._spare is not None:
+            self._active, self._spare = self._spare, None
+            self._active.activate()
+        else:
+            # Only before run() had a chance to create one, or after a burst of appends
+            self._active = self._new_segment()
+
+    async def _prepare_segments(self) -> None:
+        while self._rolled:
+            # If cancelled, close() seals the rest
+            segment = self._rolled.pop(0)
+            await asyncio.to_thread(segment.seal)
+        if self._spare is None:
+            self._spare = await asyncio.to_thread(self._new_segment)
+
+    def close(self) -> None:
+        self.flush()
+        if self._active is not None:
+            self.sync()
+            os.close(self._active.fd)
+            self._active = None
+        for segment in self._rolled:
+            segment.seal()
+        self._rolled.clear()
+        if self._spare is not None:
+            os.close(self._spare.fd)
+            os.remove(self._spare.path)
+            self._spare = None
+        self._keys_file.close()
+
+    async def run(self) -> None:
+        """Periodic flush, age-based roll-over, compaction and retention."""
+        try:
+            while True:
+                await asyncio.sleep(self._flush_interval_s)
+                self.flush()
+                if self._active is not None:
+                    await asyncio.to_thread(self.sync)
+                    if self._active.count > 0 and time.time() - self._active.created > self._segment_max_age_s:
+                        self._roll()
+                await self._prepare_segments()
+                await self.maintain()
+        except asyncio.CancelledError:
+            self.close()
+            raise
+
+    async def maintain(self, now: float = None) -> None:
+        now = time.time() if now is None else now
+        for segment in [s for s in self._sealed if s.kind == _KIND_RAW and s.end is not None and s.end < now - self._compact_after_s]:
+            compacted = await asyncio.to_thread(self._compact, segment)
+            index = self._sealed.index(segment)
+            if compacted is None:
+                del self._sealed[index]
+            else:
+                self._sealed[index] = compacted
+            os.remove(segment.path)
+
+        preallocated = sum(1 for s in (self._active, self._spare) if s is not None) * (_HEADER.size + self._capacity * _RAW_RECORD.size)
+        total = sum(s.size for s in self._sealed) + preallocated
+        while self._sealed and total > self._max_disk_bytes:
+            oldest = self._sealed.pop(0)
+            total -= oldest.size
+            os.remove(oldest.path)
+            logger.info('Removed telemetry segment %s to stay within disk budget', oldest.path)
+
+    def _compact(self, segment: _Segment) -> Optional[_Segment]:
+        step = self._compact_step_s
+        buckets: Dict[Tuple[float, int], List[float]] = {}
+        with open(segment.path, 'rb') as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            for i in range(segment.count):
+                ts, value, key_id, _ = _RAW_RECORD.unpack_from(mm, _HEADER.size + i * _RAW_RECORD.size)
+                slot = (math.floor(ts / step) * step, key_id)
+                b = buckets.get(slot)
+                if b is None:
+                    buckets[slot] = [value, value, value, 1]
+                else:
+                    b[0] = min(b[0], value)
+                    b[1] = max(b[1], value)
+                    b[2] += value
+                    b[3] += 1
+        if not buckets:
+            return None
+
+        directory, name = os.path.split(segment.path)
+        path = os.path.join(directory, name.replace('raw-', 'compacted-', 1))
+        tmp_path = path + '.tmp'
+        with open(tmp_path, 'wb') as f:
+            f.write(_HEADER.pack(_MAGIC, _VERSION, _KIND_COMPACTED, _BUCKET_RECORD.size, time.time(), step))
+            for (ts, key_id), (mn, mx, sm, cnt) in sorted(buckets.items()):
+                f.write(_pack_bucket(ts, mn, mx, sm / cnt, cnt, key_id))
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+        starts = [ts for ts, _ in buckets]
+        return _Segment(path, _KIND_COMPACTED, min(starts), max(starts), len(buckets), _HEADER.size + len(buckets) * _BUCKET_RECORD.size)
+
+    async def snapshot(self, key: str, start: float = None, end: float = None) -> Optional[SeriesSnapshot]:
+        key_id = self._key_ids.get(key)
+        if key_id is None:
+            return None
+        start = -math.inf if start is None else start
+        end = math.inf if end is None else end
+
+        # Everything the reader thread touches is fixed here, on the event loop
+        segments = [s for s in self._sealed if s.count and s.start <= end and s.end >= start]
+        plan = [(s.path, s.kind, s.count) for s in segments]
+        if self._active is not None and self._active.count:
+            plan.append((self._active.path, _KIND_RAW, self._active.count))
+        pending = [(ts, v) for ts, v, k in self._buffered if k == key_id and start <= ts <= end]
+
+        def read() -> SeriesSnapshot:
+            raw = [array('d'), array('d')]
+            buckets = [array('d') for _ in range(5)]
+            for path, kind, count in plan:
+                for row in _read_segment(path, kind, count, key_id, start, end):
+                    if kind == _KIND_RAW:
+                        raw[0].append(row[0])
+                        raw[1].append(row[1])
+                    else:
+                        ts, mn, mx, avg, cnt = row[:5]
+                        for col, v in zip(buckets, (ts, mn, mx, avg * cnt, cnt)):
+                            col.append(v)
+            for ts, v in pending:
+                raw[0].append(ts)
+                raw[1].append(v)
+            return SeriesSnapshot(key, raw, buckets)
+
+        return await asyncio.to_thread(read)
@@ -0,0 +1,252 @@
+import logging
+import math
+import time
+from array import array
+from typing import TYPE_CHECKING, Dict, List, Optional, Set, Tuple
+
+from pydantic import BaseModel
+
+from ..metrics import REGISTRY
+
+if TYPE_CHECKING:
+    from .segments import SegmentStore
+    from .upload import TelemetryUploader
+
+logger = logging.getLogger(__name__)
+
+REJECTED_SAMPLES = REGISTRY.counter('msu_telemetry_rejected_samples_total', 'Numeric samples not recorded because the key limit was reached')
+
+# 2 columns (timestamp, value) for raw samples, 5 (start, min, max, sum, count) for buckets
+_RAW_ROW_BYTES = 2 * 8
+_BUCKET_ROW_BYTES = 5 * 8
+
+
+class TelemetrySeries(BaseModel):
+    """Columnar query result. Raw samples are returned as buckets of count 1."""
+    key: str
+    step_s: float | None
+    t: List[float]
+    min: List[float]
+    max: List[float]
+    avg: List[float]
+    count: List[int]
+
+
+class _Ring:
+    """Fixed-capacity ring of float rows, stored column-wise in preallocated arrays."""
+    __slots__ = ('columns', 'capacity', 'head', 'size')
+
+    def __init__(self, n_columns: int, capacity: int):
+        self.columns = [array('d', [0.0]) * capacity for _ in range(n_columns)]
+        self.capacity = capacity
+        self.head = 0
+        self.size = 0
+
+    def last(self) -> int:
+        """Index of the newest row (only valid if size > 0)."""
+        return (self.head - 1) % self.capacity
+
+    def push(self, *row: float) -> Optional[Tuple[float, ...]]:
+        """Appends a row and returns the evicted oldest row, if any."""
+        evicted = None
+        if self.size == self.capacity:
+            evicted = tuple(col[self.head] for col in self.columns)
+        else:
+            self.size += 1
+        for col, value in zip(self.columns, row):
+            col[self.head] = value
+        self.head = (self.head + 1) % self.capacity
+        return evicted
+
+    def snapshot(self) -> List[array]:
+        """Copies all columns in chronological order."""
+        if self.size < self.capacity:
+            return [col[:self.size] for col in self.columns]
+        return [col[self.head:] + col[:self.head] for col in self.columns]
+
+
+class _Series:
+    """Recent samples at full resolution; samples falling out of the raw ring are folded into
+    min/max/sum/count buckets of `bucket_s` which cover a much longer history."""
+    __slots__ = ('raw', 'buckets', 'bucket_s')
+
+    def __init__(self, raw_capacity: int, bucket_capacity: int, bucket_s: float):
+        self.raw = _Ring(2, raw_capacity)
+        self.buckets = _Ring(5, bucket_capacity)
+        self.bucket_s = bucket_s
+
+    def add(self, ts: float, value: float) -> None:
+        evicted = self.raw.push(ts, value)
+        if evicted is not None:
+            self._fold(*evicted)
+
+    def _fold(self, ts: float, value: float) -> None:
+        start = math.floor(ts / self.bucket_s) * self.bucket_s
+        buckets = self.buckets
+        if buckets.size > 0:
+            i = buckets.last()
+            starts, mins, maxs, sums, counts = buckets.columns
+            if starts[i] == start:
+                if value < mins[i]:
+                    mins[i] = value
+                if value > maxs[i]:
+                    maxs[i] = value
+                sums[i] += value
+                counts[i] += 1
+                return
+        buckets.push(start, value, value, value, 1)
+
+
+class _Bucket:
+    __slots__ = ('min', 'max', 'sum', 'count')
+
+    def __init__(self, min_: float, max_: float, sum_: float, count: float):
+        self.min = min_
+        self.max = max_
+        self.sum = sum_
+        self.count = count
+
+    def merge(self, min_: float, max_: float, sum_: float, count: float) -> None:
+        if min_ < self.min:
+            self.min = min_
+        if max_ > self.max:
+            self.max = max_
+        self.sum += sum_
+        self.count += count
+
+
+class SeriesSnapshot:
+    """Immutable copy of one series. Aggregation works on the copy only, so it can run off the
+    event loop (e.g. via asyncio.to_thread) while ingestion continues."""
+    __slots__ = ('key', '_raw', '_buckets')
+
+    def __init__(self, key: str, raw: List[array], buckets: List[array]):
+        self.key = key
+        self._raw = raw
+        self._buckets = buckets
+
+    def aggregate(self, start: float = None, end: float = None, step_s: float = None) -> TelemetrySeries:
+        start = -math.inf if start is None else start
+        end = math.inf if end is None else end
+        rows = []
+        for t, mn, mx, sm, cnt in zip(*self._buckets):
+            if start <= t <= end:
+                rows.append((t, mn, mx, sm, cnt))
+        for t, v in zip(*self._raw):
+            if start <= t <= end:
+                rows.append((t, v, v, v, 1.0))
+
+        if step_s:
+            merged: Dict[float, _Bucket] = {}
+            for t, mn, mx, sm, cnt in rows:
+                slot = math.floor(t / step_s) * step_s
+                bucket = merged.get(slot)
+                if bucket is None:
+                    merged[slot] = _Bucket(mn, mx, sm, cnt)
+                else:
+                    bucket.merge(mn, mx, sm, cnt)
+            rows = [(t, b.min, b.max, b.sum, b.count) for t, b in sorted(merged.items())]
+
+        return TelemetrySeries(
+            key=self.key,
+            step_s=step_s,
+            t=[r[0] for r in rows],
+            min=[r[1] for r in rows],
+            max=[r[2] for r in rows],
+            avg=[r[3] / r[4] for r in rows],
+            count=[int(r[4]) for r in rows],
+        )
+
+
+class TelemetryStore:
+    """In-memory store for numeric telemetry with a fixed memory budget, split evenly among all keys
+    it may hold. Half of each key's share holds raw samples, the other half downsampled buckets.
+    All LOG records, including non-numeric ones, are also handed to the `uploader` if there is one.
+
+    Keys are added to a partition with its own key budget, so no source can crowd out the others:
+    the default partition holds `max_keys`, named `partitions` the given number of keys, and up to
+    `max_partitions` further ones (e.g. gateway units) `max_keys_per_partition` each."""
+
+    def __init__(self, memory_budget_kb: int = 1024, max_keys: int = 64, bucket_s: float = 60, persistence: 'SegmentStore' = None,
+                 uploader: 'TelemetryUploader' = None, partitions: Dict[str, int] = None, max_partitions: int = 0,
+                 max_keys_per_partition: int = 0):
+        self._limits = {'': max_keys, **(partitions or {})}
+        self._max_partitions = max_partitions
+        self._max_keys_per_partition = max_keys_per_partition
+        total_keys = sum(self._limits.values()) + max_partitions * max_keys_per_partition
+        per_key = memory_budget_kb * 1024 // max(1, total_keys)
+        self._raw_capacity = max(1, per_key // 2 // _RAW_ROW_BYTES)
+        self._bucket_capacity = max(1, per_key // 2 // _BUCKET_ROW_BYTES)
+        self._bucket_s = bucket_s
+        self._series: Dict[str, _Series] = {}
+        # partition -> its keys, for partitions that hold any
+        self._partition_keys: Dict[str, List[str]] = {}
+        self._dynamic_partitions = 0
+        self._limit_reported: Set[str] = set()
+        self.persistence = persistence
+        self.uploader = uploader
+
+    def add(self, key: str, value: str | float, ts: float = None, partition: str = '') -> bool:
+        """Records a sample. Returns False for non-numeric values and keys over the limit."""
+        ts = time.time() if ts is None else ts
+        if self.uploader is not None:
+            self.uploader.add(key, value, ts)
+
+        try:
+            value = float(value)
+        except (TypeError, ValueError):
+            return False
+
+        series = self._series.get(key)
+        if series is None:
+            if not self._admit(key, partition):
+                return False
+            series = self._series[key] = _Series(self._raw_capacity, self._bucket_capacity, self._bucket_s)
+
+        series.add(ts, value)
+        if self.persistence is not None:
+            try:
+                self.persistence.append(key, value, ts)
+            except (OSError, ValueError) as e:
+                logger.error('Failed to persist telemetry sample for %s: %s', key, e)
+        return True
+
+    def _admit(self, key: str, partition: str) -> bool:
+        keys = self._partition_keys.get(partition)
+        limit = self._limits.get(partition)
+        if limit is None:
+            limit = self._max_keys_per_partition if keys is not None or self._dynamic_partitions < self._max_partitions else 0
+        if len(keys or ()) >= limit:
+            REJECTED_SAMPLES.inc()
+            # Only the first one per partition, as senders may come up with new keys endlessly
+            reported = partition if keys is not None or partition in self._limits else None
+            if reported not in self._limit_reported:
+                self._limit_reported.add(reported)
+                logger.warning('Telemetry key limit (%s) reached, not recording %s and other new keys', limit, key)
+            return False
+        if keys is None:
+            keys = self._partition_keys[partition] = []
+            if partition not in self._limits:
+                self._dynamic_partitions += 1
+        keys.append(key)
+        return True
+
+    def drop_partition(self, partition: str) -> None:
+        """Forgets the keys of a partition (e.g. of a unit that went away) and frees its budget."""
+        keys = self._partition_keys.pop(partition, None)
+        if keys is None:
+            return
+        for key in keys:
+            del self._series[key]
+        if partition not in self._limits:
+            self._dynamic_partitions -= 1
+            self._limit_reported.discard(partition)
+
+    def keys(self) -> List[str]:
+        return list(self._series)
+
+    def snapshot(self, key: str) -> Optional[SeriesSnapshot]:
+        series = self._series.get(key)
+        if series is None:
+            return None
+        return SeriesSnapshot(key, series.raw.snapshot(), series.buckets.snapshot())
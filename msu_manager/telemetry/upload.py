@@ -0,0 +1,300 @@
+"""Store-and-forward upload of telemetry records to an HTTP endpoint.
+
+Records are collected in memory and sealed into gzip-compressed NDJSON batches once
+`batch_max_records` are buffered or the oldest record is `batch_max_age_s` old. Sealed batches
+go to a bounded spool directory first and are POSTed from there, oldest first, over one
+keep-alive connection. While the uplink is down nothing is sent; the spool drains once it is
+back up. If the spool exceeds its disk budget, the oldest batches are dropped.
+"""
+import asyncio
+import gzip
+import json
+import logging
+import os
+import ssl
+import time
+from collections import deque
+from typing import Deque, Dict, List, Optional, Tuple
+from urllib.parse import urlsplit
+
+from ..metrics import REGISTRY
+
+logger = logging.getLogger(__name__)
+
+UPLOAD_BATCHES = REGISTRY.counter('msu_telemetry_upload_batches_total', 'Telemetry batches sent to the upload endpoint', ['result'])
+UPLOAD_BYTES = REGISTRY.counter('msu_telemetry_upload_bytes_total', 'Compressed telemetry bytes uploaded')
+SPOOL_BYTES = REGISTRY.gauge('msu_telemetry_spool_bytes', 'Size of telemetry batches waiting for upload')
+SPOOL_DROPPED = REGISTRY.counter('msu_telemetry_spool_dropped_batches_total', 'Telemetry batches dropped to stay within the spool disk budget')
+
+
+class HttpConnection:
+    """Minimal HTTP/1.1 client for POST requests over a single persistent connection."""
+
+    def __init__(self, url: str, timeout_s: float = 30):
+        parts = urlsplit(url)
+        if parts.scheme not in ('http', 'https'):
+            raise ValueError(f'Unsupported upload URL {url}')
+        self.host = parts.hostname
+        self.port = parts.port or (443 if parts.scheme == 'https' else 80)
+        self.path = (parts.path or '/') + (f'?{parts.query}' if parts.query else '')
+        self._ssl = ssl.create_default_context() if parts.scheme == 'https' else None
+        self._host_header = parts.netloc.rsplit('@', 1)[-1]
+        self.timeout_s = timeout_s
+        self._reader: asyncio.StreamReader = None
+        self._writer: asyncio.StreamWriter = None
+        self.connects = 0
+
+    async def post(self, body: bytes, headers: Dict[str, str]) -> int:
+        """Sends `body` and returns the response status. Raises OSError (incl. timeouts) on connection problems."""
+        try:
+            return await asyncio.wait_for(self._post(body, headers), self.timeout_s)
+        except asyncio.TimeoutError as e:
+            self.close()
+            raise TimeoutError(f'No response from {self.host}:{self.port} within {self.timeout_s} seconds') from e
+
+    async def _post(self, body: bytes, headers: Dict[str, str]) -> int:
+        request = [f'POST {self.path} HTTP/1.1', f'Host: {self._host_header}', f'Content-Length: {len(body)}']
+        request.extend(f'{name}: {value}' for name, value in headers.items())
+        request = ('\r\n'.join(request) + '\r\n\r\n').encode('latin-1') + body
+
+        reused = self._writer is not None
+        received = False
+        try:
+            if not reused:
+                await self._connect()
+            self._writer.write(request)
+            await self._writer.drain()
+            first = await self._reader.readexactly(1)
+            received = True
+            status, keep_alive = await self._read_response(first)
+        except (OSError, ValueError, asyncio.IncompleteReadError, asyncio.LimitOverrunError) as e:
+            self.close()
+            if not reused or received:
+                # Once part of a response arrived the server has the batch, sending it again could duplicate it
+                raise ConnectionError(f'Upload to {self.host}:{self.port} failed: {e!r}') from e
+            # The server closed the idle connection in the meantime, retry once on a fresh one
+            return await self._post(body, headers)
+        if not keep_alive:
+            self.close()
+        return status
+
+    async def _connect(self) -> None:
+        self._reader, self._writer = await asyncio.open_connection(self.host, self.port, ssl=self._ssl)
+        self.connects += 1
+
+    async def _read_response(self, first: bytes) -> Tuple[int, bool]:
+        head = first + await self._reader.readuntil(b'\r\n\r\n')
+        lines = head.decode('latin-1').split('\r\n')
+        version, status = lines[0].split(' ', 2)[:2]
+        headers = {}
+        for line in lines[1:]:
+            if ':' in line:
+                name, value = line.split(':', 1)
+                headers[name.strip().lower()] = value.strip().lower()
+
+        keep_alive = headers.get('connection') != 'close' and version == 'HTTP/1.1'
+        if headers.get('transfer-encoding') == 'chunked':
+            while size := int((await self._reader.readuntil(b'\r\n')).split(b';')[0], 16):
+                await self._reader.readexactly(size + 2)
+            await self._reader.readuntil(b'\r\n')
+        elif 'content-length' in headers:
+            await self._reader.readexactly(int(headers['content-length']))
+        else:
+            await self._reader.read()
+            keep_alive = False
+        return int(status), keep_alive
+
+    def close(self) -> None:
+        if self._writer is not None:
+            self._writer.close()
+            self._writer = None
+            self._reader = None
+
+
+class SpoolQueue:
+    """Directory of sealed batch files, uploaded oldest first. Survives restarts."""
+
+    def __init__(self, directory: str, max_disk_mb: float = 16):
+        self._directory = directory
+        self._max_bytes = max_disk_mb * 1024 * 1024
+        os.makedirs(directory, exist_ok=True)
+        self._batches: Deque[Tuple[str, int]] = deque()
+        for name in sorted(os.listdir(directory)):
+            path = os.path.join(directory, name)
+            if name.endswith('.tmp'):
+                os.remove(path)
+            elif name.startswith('batch-'):
+                self._batches.append((path, os.path.getsize(path)))
+        self.bytes = sum(size for _, size in self._batches)
+        SPOOL_BYTES.set(self.bytes)
+
+    def __len__(self) -> int:
+        return len(self._batches)
+
+    def write(self, data: bytes) -> str:
+        """Writes a batch file without adding it to the queue yet, so this can run in a thread."""
+        path = os.path.join(self._directory, f'batch-{time.time_ns():020d}.ndjson.gz')
+        with open(path + '.tmp', 'wb') as f:
+            f.write(data)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(path + '.tmp', path)
+        return path
+
+    def put(self, data: bytes) -> None:
+        self.append(self.write(data), len(data))
+
+    def append(self, path: str, size: int) -> None:
+        self._batches.append((path, size))
+        self.bytes += size
+        while self.bytes > self._max_bytes and len(self._batches) > 1:
+            oldest, size = self._batches.popleft()
+            os.remove(oldest)
+            self.bytes -= size
+            SPOOL_DROPPED.inc()
+            logger.warning('Telemetry spool exceeds %s MB, dropped oldest batch %s', self._max_bytes / 1024 / 1024, oldest)
+        SPOOL_BYTES.set(self.bytes)
+
+    def peek(self) -> Optional[str]:
+        return self._batches[0][0] if self._batches else None
+
+    def remove(self, path: str) -> None:
+        if self._batches and self._batches[0][0] == path:
+            _, size = self._batches.popleft()
+            self.bytes -= size
+            SPOOL_BYTES.set(self.bytes)
+            os.remove(path)
+
+
+def encode_batch(records: List[Tuple[float, str, str | float]]) -> bytes:
+    lines = ''.join(json.dumps({'ts': ts, 'key': key, 'value': value}) + '\n' for ts, key, value in records)
+    return gzip.compress(lines.encode(), compresslevel=6, mtime=0)
+
+
+class TelemetryUploader:
+    def __init__(self, url: str, spool_directory: str, batch_max_records: int = 1000, batch_max_age_s: float = 300,
+                 spool_max_disk_mb: float = 16, timeout_s: float = 30, headers: Dict[str, str] = None,
+                 retry_s: float = 5, retry_max_s: float = 300, link_up: asyncio.Event = None):
+        self._connection = HttpConnection(url, timeout_s)
+        self._spool = SpoolQueue(spool_directory, spool_max_disk_mb)
+        self._batch_max_records = batch_max_records
+        self._batch_max_age_s = batch_max_age_s
+        self._headers = {'Content-Type': 'application/x-ndjson', 'Content-Encoding': 'gzip', **(headers or {})}
+        self._retry_s = retry_s
+        self._retry_max_s = retry_max_s
+        # Set while the uplink is up; without an UplinkMonitor uploads are always attempted
+        self.link_up = link_up
+        self._records: List[Tuple[float, str, str | float]] = []
+        self._full_batches: List[List[Tuple[float, str, str | float]]] = []
+        self._first_record = 0.0
+        self._has_records = asyncio.Event()
+        self._batch_full = asyncio.Event()
+        self._spooled = asyncio.Event()
+        if len(self._spool):
+            self._spooled.set()
+        self._uploaded = UPLOAD_BATCHES.labels('success')
+        self._failed = UPLOAD_BATCHES.labels('failure')
+        self._rejected = UPLOAD_BATCHES.labels('rejected')
+
+    def add(self, key: str, value: str | float, ts: float) -> None:
+        if not self._records:
+            self._first_record = time.monotonic()
+            self._has_records.set()
+        self._records.append((ts, key, value))
+        if len(self._records) >= self._batch_max_records:
+            self._full_batches.append(self._records)
+            self._records = []
+            self._batch_full.set()
+
+    def _take_batches(self, partial: bool = True) -> List[List[Tuple[float, str, str | float]]]:
+        batches, self._full_batches = self._full_batches, []
+        self._batch_full.clear()
+        if partial and self._records:
+            batches.append(self._records)
+            self._records = []
+        if not self._records:
+            self._has_records.clear()
+        return batches
+
+    async def seal(self, partial: bool = True) -> None:
+        """Moves the buffered records into the spool, in batches of at most `batch_max_records`.
+        Without `partial`, only full batches are sealed."""
+        batches = self._take_batches(partial)
+        if not batches:
+            return
+
+        def write() -> List[Tuple[str, int]]:
+            written = []
+            for records in batches:
+                data = encode_batch(records)
+                written.append((self._spool.write(data), len(data)))
+            return written
+
+        for path, size in await asyncio.to_thread(write):
+            self._spool.append(path, size)
+        self._spooled.set()
+
+    async def drain(self) -> bool:
+        """Uploads spooled batches until the spool is empty (True) or an upload fails (False)."""
+        while (path := self._spool.peek()) is not None:
+            if self.link_up is not None and not self.link_up.is_set():
+                return False
+            with open(path, 'rb') as f:
+                body = f.read()
+            try:
+                status = await self._connection.post(body, self._headers)
+            except OSError as e:
+                self._failed.inc()
+                logger.warning('Telemetry upload failed: %s', e)
+                return False
+            if 200 <= status < 300:
+                self._uploaded.inc()
+                UPLOAD_BYTES.inc(len(body))
+            elif 400 <= status < 500 and status not in (408, 429):
+                # Retrying will not help, don't let the batch block the ones behind it
+                self._rejected.inc()
+                logger.error('Telemetry upload endpoint rejected batch %s with status %s, dropping it', path, status)
+            else:
+                self._failed.inc()
+                logger.warning('Telemetry upload endpoint answered with status %s', status)
+                return False
+            self._spool.remove(path)
+        self._spooled.clear()
+        return True
+
+    async def _seal_loop(self) -> None:
+        while True:
+            await self._has_records.wait()
+            remaining = self._first_record + self._batch_max_age_s - time.monotonic()
+            try:
+                await asyncio.wait_for(self._batch_full.wait(), max(0, remaining))
+                partial = False
+            except asyncio.TimeoutError:
+                partial = True
+            try:
+                await self.seal(partial)
+            except OSError:
+                logger.error('Failed to spool telemetry batch, records are lost', exc_info=True)
+
+    async def _upload_loop(self) -> None:
+        retry_s = self._retry_s
+        while True:
+            await self._spooled.wait()
+            if self.link_up is not None and not self.link_up.is_set():
+                logger.info('Uplink is down, holding %s telemetry batches (%s bytes) until it is back', len(self._spool), self._spool.bytes)
+                await self.link_up.wait()
+            if await self.drain():
+                retry_s = self._retry_s
+            else:
+                await asyncio.sleep(retry_s)
+                retry_s = min(self._retry_max_s, retry_s * 2)
+
+    async def run(self) -> None:
+        try:
+            await asyncio.gather(self._seal_loop(), self._upload_loop())
+        except asyncio.CancelledError:
+            # Keep buffered records for the next start
+            for records in self._take_batches():
+                self._spool.put(encode_batch(records))
+            self._connection.close()
+            raise
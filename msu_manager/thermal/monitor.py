@@ -0,0 +1,212 @@
+import asyncio
+import glob
+import logging
+import os
+import re
+import time
+from fnmatch import fnmatchcase
+from typing import List, Optional
+
+from pydantic import BaseModel
+
+from ..config import SensorConfig, ThermalAction, ThermalMonitorConfig, ThermalRuleConfig
+from ..events import EventBus, EventType
+from ..metrics import REGISTRY
+from ..telemetry import TelemetryStore
+
+logger = logging.getLogger(__name__)
+
+SENSOR_VALUE = REGISTRY.gauge('msu_thermal_sensor_value', 'Latest sensor reading (°C, V, A, W or RPM)', ['sensor'])
+SENSOR_READ_ERRORS = REGISTRY.counter('msu_thermal_sensor_read_errors_total', 'Failed sensor reads', ['sensor'])
+SAMPLE_DURATION = REGISTRY.histogram('msu_thermal_sample_seconds', 'Time to read all sensors once')
+THERMAL_ALERTS = REGISTRY.counter('msu_thermal_alerts_total', 'Threshold rules that fired', ['sensor', 'action'])
+
+# hwmon reports millidegrees, millivolts, milliamperes, microwatts and RPM
+_HWMON_INPUT = re.compile(r'^(temp|in|curr|power|fan)(\d+)_input$')
+_HWMON_SCALE = {'temp': 0.001, 'in': 0.001, 'curr': 0.001, 'power': 1e-6, 'fan': 1}
+
+
+class SensorReading(BaseModel):
+    name: str
+    path: str
+    value: float | None
+
+
+def _read_text(path: str) -> Optional[str]:
+    try:
+        with open(path) as f:
+            return f.read().strip()
+    except OSError:
+        return None
+
+
+def discover_sensors(sysfs_root: str = '/sys') -> List[SensorConfig]:
+    """Thermal zones are named after their type, hwmon inputs `<chip>/<label>` (or `<chip>/temp1` etc.)."""
+    sensors = []
+    for zone in sorted(glob.glob(os.path.join(sysfs_root, 'class/thermal/thermal_zone*'))):
+        zone_type = _read_text(os.path.join(zone, 'type')) or os.path.basename(zone)
+        sensors.append(SensorConfig(name=zone_type, path=os.path.join(zone, 'temp')))
+    for chip in sorted(glob.glob(os.path.join(sysfs_root, 'class/hwmon/hwmon*'))):
+        chip_name = _read_text(os.path.join(chip, 'name')) or os.path.basename(chip)
+        for entry in sorted(os.listdir(chip)):
+            match = _HWMON_INPUT.match(entry)
+            if match is None:
+                continue
+            kind, index = match.groups()
+            label = _read_text(os.path.join(chip, f'{kind}{index}_label')) or f'{kind}{index}'
+            sensors.append(SensorConfig(name=f'{chip_name}/{label}', path=os.path.join(chip, entry), scale=_HWMON_SCALE[kind]))
+
+    # Several chips or zones can share a name
+    seen = {}
+    for sensor in sensors:
+        count = seen[sensor.name] = seen.get(sensor.name, 0) + 1
+        if count > 1:
+            sensor.name = f'{sensor.name}#{count}'
+    return sensors
+
+
+class _Sensor:
+    """Keeps its sysfs file open; each sample re-reads it at offset 0, which makes the driver report a
+    fresh value. The file is reopened after an error (e.g. a USB hwmon device that went away)."""
+    __slots__ = ('name', 'path', 'scale', 'fd', 'value', 'error', 'gauge', 'errors')
+
+    def __init__(self, config: SensorConfig):
+        self.name = config.name
+        self.path = config.path
+        self.scale = config.scale
+        self.fd: Optional[int] = None
+        self.value: Optional[float] = None
+        self.error: Optional[str] = None
+        self.gauge = SENSOR_VALUE.labels(config.name)
+        self.errors = SENSOR_READ_ERRORS.labels(config.name)
+
+    def read(self) -> None:
+        try:
+            if self.fd is None:
+                self.fd = os.open(self.path, os.O_RDONLY | os.O_CLOEXEC)
+            self.value = float(os.pread(self.fd, 32, 0)) * self.scale
+            self.error = None
+        except (OSError, ValueError) as e:
+            self.value = None
+            self.error = str(e)
+            self.close()
+
+    def close(self) -> None:
+        if self.fd is not None:
+            os.close(self.fd)
+            self.fd = None
+
+
+def _read_all(sensors: List[_Sensor]) -> None:
+    for sensor in sensors:
+        sensor.read()
+
+
+class _Rule:
+    __slots__ = ('config', 'sensor', 'since', 'fired')
+
+    def __init__(self, config: ThermalRuleConfig, sensor: _Sensor):
+        self.config = config
+        self.sensor = sensor
+        self.since: Optional[float] = None
+        self.fired = False
+
+    def violated(self) -> bool:
+        value = self.sensor.value
+        if value is None:
+            return False
+        return (self.config.above is not None and value > self.config.above) or (self.config.below is not None and value < self.config.below)
+
+    def evaluate(self, now: float) -> bool:
+        """Returns True once the threshold has been violated for `for_s`; re-arms when the reading is back in range."""
+        if not self.violated():
+            self.since = None
+            self.fired = False
+            return False
+        if self.since is None:
+            self.since = now
+        if self.fired or now - self.since < self.config.for_s:
+            return False
+        self.fired = True
+        return True
+
+
+class ThermalMonitor:
+    """Samples thermal and power sensors from sysfs into the telemetry store (as `thermal/<sensor>`, in the
+    store's `thermal` partition) and the metrics. Threshold rules can schedule a shutdown through the HcuController."""
+
+    def __init__(self, config: ThermalMonitorConfig, controller=None, telemetry: TelemetryStore = None, events: EventBus = None):
+        self._controller = controller
+        self._telemetry = telemetry
+        self._events = events or EventBus()
+        self._sample_interval_s = config.sample_interval_s
+        self._reading: asyncio.Task = None
+
+        sensor_configs = discover_sensors(config.sysfs_root) if config.discover else []
+        configured = {sensor.name for sensor in config.sensors}
+        sensor_configs = [s for s in sensor_configs if s.name not in configured] + config.sensors
+        self._sensors = [_Sensor(sensor) for sensor in sensor_configs]
+        logger.info('Sampling %s sensors: %s', len(self._sensors), ', '.join(s.name for s in self._sensors))
+
+        self._rules = []
+        for rule in config.rules:
+            matched = [sensor for sensor in self._sensors if fnmatchcase(sensor.name, rule.sensor)]
+            if not matched:
+                logger.warning('Thermal rule for %s matches no sensor', rule.sensor, extra={'rate_limit_key': rule.sensor})
+            self._rules.extend(_Rule(rule, sensor) for sensor in matched)
+        if controller is not None and not hasattr(controller, 'handle_shutdown'):
+            logger.warning('Thermal rules cannot shut down in gateway mode, they only log')
+            self._controller = None
+
+    def readings(self) -> List[SensorReading]:
+        return [SensorReading(name=s.name, path=s.path, value=s.value) for s in self._sensors]
+
+    async def sample(self) -> None:
+        start = time.perf_counter()
+        # sysfs reads may block on slow buses (e.g. I2C), so the whole batch runs in one thread hop.
+        # Shielded: the thread cannot be stopped, run() waits for it before closing the files
+        self._reading = asyncio.create_task(asyncio.to_thread(_read_all, self._sensors))
+        await asyncio.shield(self._reading)
+        SAMPLE_DURATION.observe(time.perf_counter() - start)
+
+        ts = time.time()
+        for sensor in self._sensors:
+            if sensor.value is None:
+                sensor.errors.inc()
+                logger.debug('Reading %s failed: %s', sensor.path, sensor.error)
+                continue
+            sensor.gauge.set(sensor.value)
+            if self._telemetry is not None:
+                self._telemetry.add(f'thermal/{sensor.name}', sensor.value, ts, partition='thermal')
+
+        now = time.monotonic()
+        for rule in self._rules:
+            if rule.evaluate(now):
+                await self._fire(rule)
+
+    async def _fire(self, rule: _Rule) -> None:
+        config, sensor = rule.config, rule.sensor
+        THERMAL_ALERTS.labels(sensor.name, config.action.value).inc()
+        self._events.publish(EventType.THERMAL_ALERT, sensor=sensor.name, value=sensor.value, above=config.above,
+                             below=config.below, action=config.action.value)
+        logger.warning('%s reads %s (limits: above %s, below %s)', sensor.name, sensor.value, config.above, config.below,
+                       extra={'rate_limit_key': sensor.name})
+        if config.action == ThermalAction.SHUTDOWN:
+            if self._controller is None:
+                logger.error('No HcuController to shut down with')
+                return
+            await self._controller.handle_shutdown()
+
+    async def run(self) -> None:
+        try:
+            while True:
+                try:
+                    await self.sample()
+                except Exception:
+                    logger.error('Sampling sensors failed', exc_info=True)
+                await asyncio.sleep(self._sample_interval_s)
+        finally:
+            if self._reading is not None:
+                await asyncio.gather(self._reading, return_exceptions=True)
+            for sensor in self._sensors:
+                sensor.close()
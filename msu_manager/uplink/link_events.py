@@ -0,0 +1,146 @@
+import asyncio
+import errno
+import logging
+import socket
+import struct
+from typing import Callable, Dict, Iterator, Optional, Tuple
+
+from pydantic import BaseModel
+
+logger = logging.getLogger(__name__)
+
+RTMGRP_LINK = 0x1
+RTMGRP_IPV4_IFADDR = 0x10
+RTMGRP_IPV6_IFADDR = 0x100
+
+RTM_NEWLINK = 16
+RTM_DELLINK = 17
+RTM_NEWADDR = 20
+RTM_DELADDR = 21
+
+IFLA_IFNAME = 3
+IFF_UP = 0x1
+IFF_LOWER_UP = 0x10000
+
+_NLMSGHDR = struct.Struct('=IHHII')
+_IFINFOMSG = struct.Struct('=BxHiII')
+_IFADDRMSG = struct.Struct('=BBBBi')
+_RTATTR = struct.Struct('=HH')
+
+
+class LinkEvent(BaseModel):
+    device: str
+    kind: str  # 'link', 'address' or 'overflow' (events were lost)
+    up: bool | None = None
+
+
+def _align(length: int) -> int:
+    return (length + 3) & ~3
+
+
+def _ifname(data: bytes, offset: int, end: int) -> Optional[str]:
+    while offset + _RTATTR.size <= end:
+        length, attr_type = _RTATTR.unpack_from(data, offset)
+        if length < _RTATTR.size:
+            break
+        if attr_type == IFLA_IFNAME:
+            return data[offset + _RTATTR.size:offset + length].rstrip(b'\0').decode(errors='replace')
+        offset += _align(length)
+    return None
+
+
+def parse_messages(data: bytes) -> Iterator[Tuple[str, int, Optional[str], bool]]:
+    """Yields (kind, interface index, interface name if included, up) for link and address messages."""
+    offset = 0
+    while offset + _NLMSGHDR.size <= len(data):
+        length, msg_type, _, _, _ = _NLMSGHDR.unpack_from(data, offset)
+        if length < _NLMSGHDR.size:
+            break
+        body = offset + _NLMSGHDR.size
+        end = min(offset + length, len(data))
+        if msg_type in (RTM_NEWLINK, RTM_DELLINK) and body + _IFINFOMSG.size <= end:
+            _, _, index, flags, _ = _IFINFOMSG.unpack_from(data, body)
+            up = msg_type == RTM_NEWLINK and flags & IFF_UP != 0 and flags & IFF_LOWER_UP != 0
+            yield 'link', index, _ifname(data, body + _IFINFOMSG.size, end), up
+        elif msg_type in (RTM_NEWADDR, RTM_DELADDR) and body + _IFADDRMSG.size <= end:
+            index = _IFADDRMSG.unpack_from(data, body)[4]
+            yield 'address', index, None, msg_type == RTM_NEWADDR
+        offset += _align(length)
+
+
+class LinkEventSource:
+    """Base class of link event sources. Calls `callback` with a LinkEvent whenever the link or the
+    addresses of `device` change. Without any source the UplinkMonitor only polls."""
+
+    def __init__(self, device: str):
+        self.device = device
+        self._callback: Callable[[LinkEvent], None] = None
+
+    async def start(self, callback: Callable[[LinkEvent], None]) -> None:
+        self._callback = callback
+
+    def close(self) -> None:
+        self._callback = None
+
+    def _emit(self, event: LinkEvent) -> None:
+        if self._callback is not None:
+            self._callback(event)
+
+
+class NetlinkEventSource(LinkEventSource):
+    """Subscribes to rtnetlink link and address notifications (no privileges needed)."""
+
+    def __init__(self, device: str):
+        super().__init__(device)
+        self._sock: socket.socket = None
+        self._names: Dict[int, str] = {}
+
+    async def start(self, callback: Callable[[LinkEvent], None]) -> None:
+        await super().start(callback)
+        self._sock = socket.socket(socket.AF_NETLINK, socket.SOCK_RAW | socket.SOCK_NONBLOCK | socket.SOCK_CLOEXEC, socket.NETLINK_ROUTE)
+        self._sock.bind((0, RTMGRP_LINK | RTMGRP_IPV4_IFADDR | RTMGRP_IPV6_IFADDR))
+        asyncio.get_running_loop().add_reader(self._sock.fileno(), self._on_readable)
+
+    def close(self) -> None:
+        if self._sock is not None:
+            asyncio.get_running_loop().remove_reader(self._sock.fileno())
+            self._sock.close()
+            self._sock = None
+        super().close()
+
+    def _name(self, index: int, name: Optional[str]) -> Optional[str]:
+        if name is not None:
+            self._names[index] = name
+            return name
+        name = self._names.get(index)
+        if name is None:
+            try:
+                name = self._names[index] = socket.if_indextoname(index)
+            except OSError:
+                # Interface is already gone
+                return None
+        return name
+
+    def _on_readable(self) -> None:
+        while True:
+            try:
+                data = self._sock.recv(65536)
+            except BlockingIOError:
+                return
+            except OSError as e:
+                if e.errno == errno.ENOBUFS:
+                    # The kernel dropped notifications, so the state of the device is unknown
+                    self._emit(LinkEvent(device=self.device, kind='overflow'))
+                    continue
+                logger.error('Reading netlink events failed', exc_info=True)
+                return
+            for kind, index, name, up in parse_messages(data):
+                if self._name(index, name) == self.device:
+                    self._emit(LinkEvent(device=self.device, kind=kind, up=up))
+
+
+class FakeLinkEventSource(LinkEventSource):
+    """For tests: events are injected with `emit()`."""
+
+    def emit(self, kind: str = 'link', up: bool | None = None) -> None:
+        self._emit(LinkEvent(device=self.device, kind=kind, up=up))
@@ -1,84 +1,216 @@
 
 import logging
 import asyncio
-import os
-from typing import Dict, List, Tuple
+import time
+from typing import Dict, List, Optional, Set
 
-from ..config import UplinkMonitorConfig
+from ..commands import CommandRunner
+from ..config import LinkEvents, ProbeMethod, UplinkMonitorConfig
+from ..events import EventBus, EventType
+from ..metrics import REGISTRY
+from .link_events import LinkEvent, LinkEventSource, NetlinkEventSource
+from .probe import (AutoProbe, IcmpProbe, Probe, ProbeResult,
+                    SubprocessPingProbe, TcpConnectProbe, UdpEchoProbe,
+                    probe_quorum)
+from .quality import LinkQuality, WindowStats
+from .scheduler import CheckScheduler, StateTransition, UplinkStatus
 
 logger = logging.getLogger(__name__)
 
+PROBE_RTT = REGISTRY.histogram('msu_uplink_probe_rtt_seconds', 'Round-trip time of answered connection probes', ['target'])
+PROBES_SENT = REGISTRY.counter('msu_uplink_probes_sent_total', 'Connection probes sent', ['target'])
+PROBES_LOST = REGISTRY.counter('msu_uplink_probes_lost_total', 'Connection probes that were not answered', ['target'])
+PROBE_LOSS = REGISTRY.gauge('msu_uplink_probe_loss_ratio', 'Probe loss ratio of the latest check', ['target'])
+UPLINK_UP = REGISTRY.gauge('msu_uplink_up', 'Verdict of the latest connection check (1 = up)')
+RESTORE_ATTEMPTS = REGISTRY.counter('msu_uplink_restore_attempts_total', 'Connection restore attempts', ['result'])
+LINK_EVENTS = REGISTRY.counter('msu_uplink_link_events_total', 'Link and address change notifications for the WWAN device', ['kind'])
+RESTORE_DURATION = REGISTRY.histogram('msu_uplink_restore_seconds', 'Duration of connection restore attempts')
+CHECK_INTERVAL = REGISTRY.gauge('msu_uplink_check_interval_seconds', 'Current interval between connection checks')
+RESTORE_CIRCUIT_OPEN = REGISTRY.gauge('msu_uplink_restore_circuit_open', 'Restore attempts are paused after repeated failures (1 = paused)')
+PROBE_BYTES = REGISTRY.counter('msu_uplink_probe_bytes_total', 'Estimated traffic caused by connection probes')
+
 class UplinkMonitor:
-    def __init__(self, config: UplinkMonitorConfig):
+    def __init__(self, config: UplinkMonitorConfig, runner: CommandRunner = None, link_events: LinkEventSource = None,
+                 events: EventBus = None):
+        self._runner = runner or CommandRunner()
+        self._events = events or EventBus()
+        self._link_events = link_events or self._create_link_event_source(config)
+        self._wakeup = asyncio.Event()
+        # Set while the latest check found the connection up
+        self.link_up = asyncio.Event()
         self._restore_connection_cmd = config.restore_connection_cmd
+        self._restore_connection_timeout_s = config.restore_connection_timeout_s
         self._restore_connection_env = {
             'WWAN_IFACE': config.wwan_device,
             'DEVICE_ID': config.wwan_usb_id,
             'APN': config.wwan_apn,
         }
-        self._check_connection_cmd = [
-            'ping',
-            '-c', '3',
-            '-w', '1',
-            '-i', '0.2',
-            *(['-I', config.check_connection_device] if config.check_connection_device else []),
-            config.check_connection_target,
-        ]
-        self._check_interval_s = config.check_interval_s
+        self._check_connection_targets = config.check_connection_target
+        self._check_connection_quorum = config.check_connection_quorum
+        self._probe = self._create_probe(config)
+        self._scheduler = CheckScheduler(
+            check_interval_s=config.check_interval_s,
+            min_check_interval_s=config.min_check_interval_s,
+            stable_check_interval_s=config.stable_check_interval_s,
+            growth=config.check_interval_growth,
+            restore_backoff_s=config.restore_backoff_s,
+            restore_backoff_max_s=config.restore_backoff_max_s,
+            circuit_threshold=config.restore_circuit_threshold,
+            circuit_open_s=config.restore_circuit_open_s,
+            budget_bytes_per_day=config.probe_budget_kb_per_day * 1024,
+            on_transition=self._on_state_transition,
+        )
+        self.last_probe_results: List[ProbeResult] = []
+        # Probes of targets that were not needed for the verdict, they still finish for the statistics
+        self._background_probes: Set[asyncio.Task] = set()
+        self.quality = LinkQuality(self._check_connection_targets)
+        self._target_metrics = {
+            target: (PROBE_RTT.labels(target), PROBES_SENT.labels(target), PROBES_LOST.labels(target), PROBE_LOSS.labels(target))
+            for target in self._check_connection_targets
+        }
+        self._restore_success = RESTORE_ATTEMPTS.labels('success')
+        self._restore_failure = RESTORE_ATTEMPTS.labels('failure')
+
+    def _create_probe(self, config: UplinkMonitorConfig) -> Probe:
+        probe_args = dict(
+            device=config.check_connection_device,
+            count=config.check_connection_count,
+            timeout_s=config.check_connection_timeout_s,
+        )
+        port_arg = dict(port=config.check_connection_port) if config.check_connection_port else {}
+        match config.check_connection_method:
+            case ProbeMethod.AUTO:
+                return AutoProbe(**probe_args, **port_arg)
+            case ProbeMethod.ICMP:
+                return IcmpProbe(**probe_args)
+            case ProbeMethod.TCP:
+                return TcpConnectProbe(**probe_args, **port_arg)
+            case ProbeMethod.UDP:
+                return UdpEchoProbe(**probe_args, **port_arg)
+            case ProbeMethod.PING:
+                return SubprocessPingProbe(self._runner.run, **probe_args)
+
+    def _create_link_event_source(self, config: UplinkMonitorConfig) -> Optional[LinkEventSource]:
+        match config.link_events:
+            case LinkEvents.NETLINK:
+                return NetlinkEventSource(config.wwan_device)
+            case LinkEvents.NONE:
+                return None
+
+    async def _start_link_events(self) -> None:
+        if self._link_events is None:
+            return
+        try:
+            await self._link_events.start(self._on_link_event)
+            logger.info('Watching link events of %s', self._link_events.device)
+        except OSError:
+            logger.warning('Cannot subscribe to link events, polling only', exc_info=True)
+            self._link_events = None
+
+    def _on_link_event(self, event: LinkEvent) -> None:
+        LINK_EVENTS.labels(event.kind).inc()
+        logger.info('Link event on %s (%s, up=%s), checking connection now', event.device, event.kind, event.up)
+        self._wakeup.set()
+
+    async def _wait_for_next_check(self) -> None:
+        delay = self._scheduler.next_check_delay(time.monotonic())
+        if self._link_events is None:
+            await asyncio.sleep(delay)
+            return
+        # Events trigger checks right away, the interval is only a safety net
+        try:
+            await asyncio.wait_for(self._wakeup.wait(), delay)
+        except asyncio.TimeoutError:
+            pass
+
+    def _on_state_transition(self, transition: StateTransition) -> None:
+        self._events.publish(EventType.UPLINK_STATE, state=transition.state.value, reason=transition.reason)
+
+    def status(self) -> UplinkStatus:
+        return self._scheduler.status(time.monotonic())
+
+    def stats(self) -> Dict[str, Dict[str, WindowStats]]:
+        return self.quality.stats(time.time())
 
     async def run(self):
+        await self._start_link_events()
         try:
             while True:
+                self._wakeup.clear()
                 is_up = await self.check_connection()
-                logger.debug(f'Connection status: {"up" if is_up else "down"}')
+                logger.debug('Connection status: %s', 'up' if is_up else 'down')
+                self._record_check(is_up)
                 if not is_up:
-                    logger.warning("Connection is down, attempting to restore...")
-                    success = await self.restore_connection()
-                    if success:
-                        logger.info("Connection restored successfully.")
-                    else:
-                        logger.error("Failed to restore connection.")
-                await asyncio.sleep(self._check_interval_s)
+                    await self._maybe_restore_connection()
+                CHECK_INTERVAL.set(self._scheduler.interval_s)
+                await self._wait_for_next_check()
         except asyncio.CancelledError:
             logger.info("UplinkMonitor task cancelled.")
             raise
         except Exception as e:
-            logger.error(f"Unexpected error occurred in UplinkMonitor", exc_info=True)
+            logger.error("Unexpected error occurred in UplinkMonitor", exc_info=True)
+        finally:
+            for task in self._background_probes:
+                task.cancel()
+            if self._link_events is not None:
+                self._link_events.close()
 
-    async def check_connection(self) -> bool:
-        ret_code, stdout, stderr = await self._run_command(self._check_connection_cmd)
+    def _record_check(self, is_up: bool) -> None:
+        self._scheduler.record_check(is_up, time.monotonic())
+        if is_up:
+            self.link_up.set()
+            RESTORE_CIRCUIT_OPEN.set(0)
+        else:
+            self.link_up.clear()
 
-        if ret_code == 0:
-            return True
+    async def _maybe_restore_connection(self) -> None:
+        now = time.monotonic()
+        if not self._scheduler.start_restore(now):
+            logger.warning('Connection is down, next restore attempt in %.0f seconds', self._scheduler.next_restore_delay(now))
+            return
+        logger.warning("Connection is down, attempting to restore...")
+        success = await self.restore_connection()
+        if success:
+            logger.info("Connection restored successfully.")
         else:
-            logger.error(f'Connection check failed. Output of {" ".join(self._check_connection_cmd)}')
-            logger.error(f"STDOUT:")
-            logger.error(f"{stdout}")
-            logger.error(f"STDERR:")
-            logger.error(f"{stderr}")
-            return False
+            logger.error("Failed to restore connection.")
+        self._scheduler.record_restore(success, time.monotonic())
+        RESTORE_CIRCUIT_OPEN.set(1 if self._scheduler.circuit_open(time.monotonic()) else 0)
+
+    async def check_connection(self) -> bool:
+        is_up, results = await probe_quorum(self._probe, self._check_connection_targets, self._check_connection_quorum.value,
+                                            on_result=self._record_probe_result, background=self._background_probes)
+        self.last_probe_results = results
+        logger.debug('Probe results: %s', results)
+        UPLINK_UP.set(1 if is_up else 0)
+        return is_up
+
+    def _record_probe_result(self, result: ProbeResult) -> None:
+        # Every probe reports here, also those the quorum did not wait for, so their packets count against the budget
+        probe_bytes = result.sent * self._probe.bytes_per_probe
+        PROBE_BYTES.inc(probe_bytes)
+        self._scheduler.record_probe_bytes(probe_bytes, time.monotonic())
+        self.quality.add(result, time.time())
+        rtt, sent, lost, loss = self._target_metrics[result.target]
+        for rtt_ms in result.rtts_ms:
+            rtt.observe(rtt_ms / 1000)
+        sent.inc(result.sent)
+        lost.inc(result.sent - result.received)
+        loss.set(result.loss)
 
     async def restore_connection(self) -> bool:
-        ret_code, stdout, stderr = await self._run_command(self._restore_connection_cmd, env=self._restore_connection_env)
+        start = time.perf_counter()
+        result = await self._runner.run(self._restore_connection_cmd, env=self._restore_connection_env, timeout_s=self._restore_connection_timeout_s)
+        duration_s = time.perf_counter() - start
+        RESTORE_DURATION.observe(duration_s)
+        self._events.publish(EventType.UPLINK_RESTORE, success=result.returncode == 0, returncode=result.returncode,
+                             timed_out=result.timed_out, duration_s=duration_s)
 
-        if ret_code == 0:
+        if result.returncode == 0:
+            self._restore_success.inc()
             return True
         else:
-            logger.error(f"Failed to restore connection. Output of {' '.join(self._restore_connection_cmd)}")
-            logger.error(f"STDOUT:")
-            logger.error(f"{stdout}")
-            logger.error(f"STDERR:")
-            logger.error(f"{stderr}")
+            self._restore_failure.inc()
+            logger.error('Failed to restore connection. Output of %s\n[stdout]\n%s\n[stderr]\n%s',
+                         ' '.join(self._restore_connection_cmd), result.stdout, result.stderr)
             return False
-
-    async def _run_command(self, command: List[str], env: Dict[str, str] = None) -> Tuple[int, str, str]:
-        proc = await asyncio.create_subprocess_exec(
-            *command,
-            stdout=asyncio.subprocess.PIPE,
-            stderr=asyncio.subprocess.PIPE,
-            env={**os.environ, **env} if env else None
-        )
-        stdout, stderr = await proc.communicate()
-        stdout = stdout.decode() if stdout else ''
-        stderr = stderr.decode() if stderr else ''
-        return proc.returncode, stdout, stderr
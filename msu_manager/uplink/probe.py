@@ -0,0 +1,371 @@
+import asyncio
+import errno
+import logging
+import os
+import socket
+import struct
+import time
+from typing import Callable, Dict, List, Optional, Set, Tuple
+
+from pydantic import BaseModel, computed_field
+
+logger = logging.getLogger(__name__)
+
+_ICMP_ECHO_REQUEST = 8
+_ICMP_ECHO_REPLY = 0
+_ICMP_HEADER = struct.Struct('!BBHHH')
+
+
+class ProbeResult(BaseModel):
+    target: str
+    method: str
+    sent: int
+    received: int
+    rtts_ms: List[float] = []
+
+    @computed_field
+    @property
+    def loss(self) -> float:
+        if self.sent == 0:
+            return 1.0
+        return 1.0 - self.received / self.sent
+
+    @property
+    def is_up(self) -> bool:
+        return self.received > 0
+
+
+def _bind_to_device(sock: socket.socket, device: Optional[str]) -> None:
+    if device:
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_BINDTODEVICE, device.encode())
+
+
+def _icmp_checksum(data: bytes) -> int:
+    if len(data) % 2:
+        data += b'\x00'
+    total = sum(struct.unpack(f'!{len(data) // 2}H', data))
+    total = (total >> 16) + (total & 0xFFFF)
+    total += total >> 16
+    return ~total & 0xFFFF
+
+
+class Probe:
+    """Base class of all connection probes. Sends `count` probes spaced `interval_s` apart
+    and waits at most `timeout_s` in total for answers (mirrors `ping -c -i -w`)."""
+
+    method = 'none'
+    # Estimated bytes on the wire per probe, request and reply including IP headers
+    bytes_per_probe = 0
+
+    def __init__(self, device: Optional[str] = None, count: int = 3, interval_s: float = 0.2, timeout_s: float = 1.0):
+        self._device = device
+        self._count = count
+        self._interval_s = interval_s
+        self._timeout_s = timeout_s
+
+    async def probe(self, target: str) -> ProbeResult:
+        raise NotImplementedError()
+
+
+class _EchoProtocol(asyncio.DatagramProtocol):
+    """Matches echo replies to outstanding requests by sequence number."""
+
+    def __init__(self, match_reply):
+        self._match_reply = match_reply
+        self.pending: Dict[int, Tuple[float, asyncio.Future]] = {}
+
+    def datagram_received(self, data: bytes, addr) -> None:
+        seq = self._match_reply(data)
+        if seq is None:
+            return
+        entry = self.pending.pop(seq, None)
+        if entry is not None and not entry[1].done():
+            entry[1].set_result((time.monotonic() - entry[0]) * 1000)
+
+    def error_received(self, exc: Exception) -> None:
+        logger.debug('Probe socket error', exc_info=exc)
+
+
+class _DatagramEchoProbe(Probe):
+    """Common request/reply loop for ICMP echo and UDP echo probes."""
+
+    async def probe(self, target: str) -> ProbeResult:
+        loop = asyncio.get_running_loop()
+        sock = self._open_socket()
+        try:
+            transport, protocol = await loop.create_datagram_endpoint(lambda: _EchoProtocol(self._match_reply), sock=sock)
+        except BaseException:
+            sock.close()
+            raise
+
+        deadline = loop.time() + self._timeout_s
+        futures = []
+        try:
+            for seq in range(self._count):
+                if seq > 0:
+                    await asyncio.sleep(self._interval_s)
+                if loop.time() >= deadline:
+                    break
+                future = loop.create_future()
+                protocol.pending[seq] = (time.monotonic(), future)
+                futures.append(future)
+                transport.sendto(self._build_request(seq), self._address(target))
+
+            remaining = deadline - loop.time()
+            if remaining > 0:
+                await asyncio.wait(futures, timeout=remaining)
+        finally:
+            transport.close()
+
+        rtts = [f.result() for f in futures if f.done() and not f.cancelled()]
+        return ProbeResult(target=target, method=self.method, sent=len(futures), received=len(rtts), rtts_ms=rtts)
+
+    def _open_socket(self) -> socket.socket:
+        raise NotImplementedError()
+
+    def _address(self, target: str) -> Tuple[str, int]:
+        raise NotImplementedError()
+
+    def _build_request(self, seq: int) -> bytes:
+        raise NotImplementedError()
+
+    def _match_reply(self, data: bytes) -> Optional[int]:
+        raise NotImplementedError()
+
+
+class IcmpProbe(_DatagramEchoProbe):
+    """ICMP echo via unprivileged ping sockets (needs the gid in net.ipv4.ping_group_range).
+    The kernel rewrites the echo identifier and only delivers replies for this socket."""
+
+    method = 'icmp'
+    bytes_per_probe = 2 * (20 + 8 + 16)
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._payload = os.urandom(16)
+
+    def _open_socket(self) -> socket.socket:
+        sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM, socket.IPPROTO_ICMP)
+        try:
+            _bind_to_device(sock, self._device)
+            sock.setblocking(False)
+        except BaseException:
+            sock.close()
+            raise
+        return sock
+
+    def _address(self, target: str) -> Tuple[str, int]:
+        return (target, 0)
+
+    def _build_request(self, seq: int) -> bytes:
+        header = _ICMP_HEADER.pack(_ICMP_ECHO_REQUEST, 0, 0, 0, seq)
+        checksum = _icmp_checksum(header + self._payload)
+        return _ICMP_HEADER.pack(_ICMP_ECHO_REQUEST, 0, checksum, 0, seq) + self._payload
+
+    def _match_reply(self, data: bytes) -> Optional[int]:
+        if len(data) < _ICMP_HEADER.size:
+            return None
+        icmp_type, _, _, _, seq = _ICMP_HEADER.unpack_from(data)
+        if icmp_type != _ICMP_ECHO_REPLY or data[_ICMP_HEADER.size:] != self._payload:
+            return None
+        return seq
+
+
+class UdpEchoProbe(_DatagramEchoProbe):
+    """Sends datagrams to an echo service (RFC 862) and waits for them to come back."""
+
+    method = 'udp'
+    bytes_per_probe = 2 * (20 + 8 + 10)
+
+    def __init__(self, *args, port: int = 7, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._port = port
+        self._token = os.urandom(8)
+
+    def _open_socket(self) -> socket.socket:
+        sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        try:
+            _bind_to_device(sock, self._device)
+            sock.setblocking(False)
+        except BaseException:
+            sock.close()
+            raise
+        return sock
+
+    def _address(self, target: str) -> Tuple[str, int]:
+        return (target, self._port)
+
+    def _build_request(self, seq: int) -> bytes:
+        return self._token + struct.pack('!H', seq)
+
+    def _match_reply(self, data: bytes) -> Optional[int]:
+        if len(data) != len(self._token) + 2 or not data.startswith(self._token):
+            return None
+        return struct.unpack_from('!H', data, len(self._token))[0]
+
+
+class TcpConnectProbe(Probe):
+    """Measures TCP handshake time. A refused connection still proves the path is up."""
+
+    method = 'tcp'
+    # SYN, SYN-ACK, ACK and the FIN/RST exchange on close
+    bytes_per_probe = 6 * 60
+
+    def __init__(self, *args, port: int = 443, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._port = port
+
+    async def probe(self, target: str) -> ProbeResult:
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + self._timeout_s
+        sent = 0
+        rtts = []
+        for attempt in range(self._count):
+            if attempt > 0:
+                await asyncio.sleep(self._interval_s)
+            remaining = deadline - loop.time()
+            if remaining <= 0:
+                break
+            sent += 1
+            rtt = await self._connect_once(target, remaining)
+            if rtt is not None:
+                rtts.append(rtt)
+        return ProbeResult(target=target, method=self.method, sent=sent, received=len(rtts), rtts_ms=rtts)
+
+    async def _connect_once(self, target: str, timeout_s: float) -> Optional[float]:
+        loop = asyncio.get_running_loop()
+        sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        try:
+            _bind_to_device(sock, self._device)
+            sock.setblocking(False)
+            start = time.monotonic()
+            try:
+                await asyncio.wait_for(loop.sock_connect(sock, (target, self._port)), timeout_s)
+            except ConnectionRefusedError:
+                pass
+            except (asyncio.TimeoutError, OSError):
+                return None
+            return (time.monotonic() - start) * 1000
+        finally:
+            sock.close()
+
+
+class SubprocessPingProbe(Probe):
+    """Legacy probe forking the system `ping` binary. Only reports aggregate success."""
+
+    method = 'ping'
+    bytes_per_probe = 2 * (20 + 8 + 56)
+
+    def __init__(self, run_command, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._run_command = run_command
+
+    def command(self, target: str) -> List[str]:
+        return [
+            'ping',
+            '-c', str(self._count),
+            '-w', str(max(1, round(self._timeout_s))),
+            '-i', str(self._interval_s),
+            *(['-I', self._device] if self._device else []),
+            target,
+        ]
+
+    async def probe(self, target: str) -> ProbeResult:
+        cmd = self.command(target)
+        # ping gives up after its own deadline (-w), the margin covers process startup
+        result = await self._run_command(cmd, timeout_s=max(1, round(self._timeout_s)) + 5)
+        if result.returncode != 0:
+            logger.error('Connection check failed. Output of %s\n[stdout]\n%s\n[stderr]\n%s', ' '.join(cmd), result.stdout, result.stderr)
+        received = self._count if result.returncode == 0 else 0
+        return ProbeResult(target=target, method=self.method, sent=self._count, received=received)
+
+
+class AutoProbe(Probe):
+    """Uses ICMP if ping sockets are permitted, otherwise falls back to TCP connect."""
+
+    method = 'auto'
+
+    def __init__(self, *args, port: int = 443, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._icmp = IcmpProbe(*args, **kwargs)
+        self._tcp = TcpConnectProbe(*args, port=port, **kwargs)
+        self._delegate: Probe = self._icmp
+
+    @property
+    def bytes_per_probe(self) -> int:
+        return self._delegate.bytes_per_probe
+
+    async def probe(self, target: str) -> ProbeResult:
+        if self._delegate is self._icmp:
+            try:
+                return await self._icmp.probe(target)
+            except OSError as e:
+                if e.errno not in (errno.EACCES, errno.EPERM, errno.EPROTONOSUPPORT):
+                    raise
+                logger.warning('ICMP ping sockets unavailable (%s), falling back to TCP connect probes on port %s', e, self._tcp._port)
+                self._delegate = self._tcp
+        return await self._delegate.probe(target)
+
+
+def required_successes(policy: str, n_targets: int) -> int:
+    match policy:
+        case 'any':
+            return 1
+        case 'majority':
+            return n_targets // 2 + 1
+        case 'all':
+            return n_targets
+    raise ValueError(f'Unknown quorum policy {policy}')
+
+
+async def probe_quorum(probe: Probe, targets: List[str], policy: str, on_result: Callable[[ProbeResult], None] = None,
+                       background: Set[asyncio.Task] = None) -> Tuple[bool, List[ProbeResult]]:
+    """Probes all targets concurrently and returns as soon as the quorum verdict is certain, with
+    the verdict and the results finished so far. Probes still running at that point are cancelled,
+    unless a `background` set is passed: then they keep running (tracked in that set until done).
+    Every result, including those finishing in the background, is passed to `on_result`."""
+    needed = required_successes(policy, len(targets))
+    tasks = {asyncio.create_task(probe.probe(target)): target for target in targets}
+    pending = set(tasks)
+    results = []
+    up = down = 0
+
+    def collect(task: asyncio.Task) -> Optional[ProbeResult]:
+        if task.cancelled():
+            return None
+        try:
+            result = task.result()
+        except OSError as e:
+            # e.g. ENODEV if the wwan device vanished; treat like a failed probe
+            logger.error('Connection check to %s failed: %s', tasks[task], e)
+            result = ProbeResult(target=tasks[task], method=probe.method, sent=0, received=0)
+        if on_result is not None:
+            on_result(result)
+        return result
+
+    try:
+        while pending:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                result = collect(task)
+                results.append(result)
+                if result.is_up:
+                    up += 1
+                else:
+                    down += 1
+            if up >= needed:
+                return True, results
+            if down > len(targets) - needed:
+                return False, results
+        return up >= needed, results
+    finally:
+        if background is not None and pending:
+            for task in pending:
+                background.add(task)
+                task.add_done_callback(background.discard)
+                task.add_done_callback(collect)
+        else:
+            for task in pending:
+                task.cancel()
+            if pending:
+                await asyncio.wait(pending)
@@ -0,0 +1,180 @@
+import math
+from collections import deque
+from typing import Dict, List, Optional
+
+from pydantic import BaseModel
+
+from .probe import ProbeResult
+
+# Name, length and number of slots of the sliding windows. A window covers between
+# (slots - 1) and slots slot lengths, as the newest slot is still filling up.
+WINDOWS = (('1h', 3600, 12), ('1d', 86400, 24), ('7d', 7 * 86400, 28))
+
+
+class DDSketch:
+    """Mergeable quantile sketch with relative error guarantees (Masson et al., "DDSketch", VLDB 2019).
+
+    Values are counted in logarithmically sized bins, so every quantile is reported within
+    `relative_accuracy` of a value of the right rank. Values <= 0 are counted separately.
+    If more than `max_bins` bins are in use, the lowest ones are collapsed, which only costs
+    accuracy at the low end of the distribution."""
+
+    __slots__ = ('relative_accuracy', 'max_bins', '_gamma', '_log_gamma', 'bins', 'zero_count', 'count', 'sum', 'min', 'max')
+
+    def __init__(self, relative_accuracy: float = 0.01, max_bins: int = 512):
+        self.relative_accuracy = relative_accuracy
+        self.max_bins = max_bins
+        self._gamma = (1 + relative_accuracy) / (1 - relative_accuracy)
+        self._log_gamma = math.log(self._gamma)
+        self.bins: Dict[int, int] = {}
+        self.zero_count = 0
+        self.count = 0
+        self.sum = 0.0
+        self.min = math.inf
+        self.max = -math.inf
+
+    def add(self, value: float, count: int = 1) -> None:
+        if value > 0:
+            key = math.ceil(math.log(value) / self._log_gamma)
+            self.bins[key] = self.bins.get(key, 0) + count
+            if len(self.bins) > self.max_bins:
+                self._collapse()
+        else:
+            self.zero_count += count
+        self.count += count
+        self.sum += value * count
+        self.min = min(self.min, value)
+        self.max = max(self.max, value)
+
+    def merge(self, other: 'DDSketch') -> None:
+        if other._gamma != self._gamma:
+            raise ValueError('Cannot merge sketches of different relative accuracy')
+        for key, count in other.bins.items():
+            self.bins[key] = self.bins.get(key, 0) + count
+        if len(self.bins) > self.max_bins:
+            self._collapse()
+        self.zero_count += other.zero_count
+        self.count += other.count
+        self.sum += other.sum
+        self.min = min(self.min, other.min)
+        self.max = max(self.max, other.max)
+
+    def _collapse(self) -> None:
+        keys = sorted(self.bins)
+        excess = keys[:len(keys) - self.max_bins + 1]
+        self.bins[excess[-1]] += sum(self.bins.pop(key) for key in excess[:-1])
+
+    def quantile(self, q: float) -> Optional[float]:
+        if self.count == 0:
+            return None
+        rank = q * (self.count - 1)
+        if rank < self.zero_count:
+            return max(self.min, 0.0)
+        seen = self.zero_count
+        for key in sorted(self.bins):
+            seen += self.bins[key]
+            if seen > rank:
+                value = 2 * self._gamma ** key / (self._gamma + 1)
+                return min(max(value, self.min), self.max)
+        return self.max
+
+
+class QuantileSummary(BaseModel):
+    count: int
+    min: float | None = None
+    max: float | None = None
+    mean: float | None = None
+    p50: float | None = None
+    p95: float | None = None
+    p99: float | None = None
+
+
+def _summarize(sketch: DDSketch) -> QuantileSummary:
+    if sketch.count == 0:
+        return QuantileSummary(count=0)
+    return QuantileSummary(count=sketch.count, min=sketch.min, max=sketch.max, mean=sketch.sum / sketch.count,
+                           p50=sketch.quantile(0.5), p95=sketch.quantile(0.95), p99=sketch.quantile(0.99))
+
+
+class WindowStats(BaseModel):
+    window_s: int
+    probes_sent: int
+    probes_received: int
+    loss: float | None
+    rtt_ms: QuantileSummary
+    check_loss: QuantileSummary
+
+
+class _Slot:
+    __slots__ = ('index', 'rtt', 'loss', 'sent', 'received')
+
+    def __init__(self, index: int, relative_accuracy: float):
+        self.index = index
+        self.rtt = DDSketch(relative_accuracy)
+        self.loss = DDSketch(relative_accuracy)
+        self.sent = 0
+        self.received = 0
+
+
+class SlidingWindow:
+    """Ring of per-slot sketches; a summary merges the slots still inside the window."""
+
+    def __init__(self, window_s: int, slots: int, relative_accuracy: float = 0.01):
+        self.window_s = window_s
+        self.slots = slots
+        self.slot_s = window_s / slots
+        self.relative_accuracy = relative_accuracy
+        self._slots: deque[_Slot] = deque()
+
+    def _expire(self, index: int) -> None:
+        while self._slots and self._slots[0].index <= index - self.slots:
+            self._slots.popleft()
+
+    def add(self, result: ProbeResult, now: float) -> None:
+        index = int(now // self.slot_s)
+        self._expire(index)
+        if not self._slots or self._slots[-1].index != index:
+            self._slots.append(_Slot(index, self.relative_accuracy))
+        slot = self._slots[-1]
+        for rtt_ms in result.rtts_ms:
+            slot.rtt.add(rtt_ms)
+        if result.sent:
+            slot.loss.add(result.loss)
+        slot.sent += result.sent
+        slot.received += result.received
+
+    def summary(self, now: float) -> WindowStats:
+        self._expire(int(now // self.slot_s))
+        rtt, loss = DDSketch(self.relative_accuracy), DDSketch(self.relative_accuracy)
+        sent = received = 0
+        for slot in self._slots:
+            rtt.merge(slot.rtt)
+            loss.merge(slot.loss)
+            sent += slot.sent
+            received += slot.received
+        return WindowStats(window_s=self.window_s, probes_sent=sent, probes_received=received,
+                           loss=1 - received / sent if sent else None, rtt_ms=_summarize(rtt), check_loss=_summarize(loss))
+
+
+class LinkQuality:
+    """RTT and loss history per probe target over the WINDOWS, in constant memory.
+    `check_loss` summarizes the loss ratio of each check, `loss` is the overall ratio."""
+
+    def __init__(self, targets: List[str], relative_accuracy: float = 0.01):
+        self._windows = {
+            target: {name: SlidingWindow(window_s, slots, relative_accuracy) for name, window_s, slots in WINDOWS}
+            for target in targets
+        }
+
+    def add(self, result: ProbeResult, now: float) -> None:
+        windows = self._windows.get(result.target)
+        if windows is None:
+            return
+        for window in windows.values():
+            window.add(result, now)
+
+    def stats(self, now: float) -> Dict[str, Dict[str, WindowStats]]:
+        return {
+            target: {name: window.summary(now) for name, window in windows.items()}
+            for target, windows in self._windows.items()
+        }
@@ -0,0 +1,210 @@
+import logging
+import random
+import time
+from collections import deque
+from enum import Enum
+from typing import Callable, List, Optional
+
+from pydantic import BaseModel
+
+logger = logging.getLogger(__name__)
+
+
+class UplinkState(str, Enum):
+    UNKNOWN = 'unknown'
+    UP = 'up'
+    DOWN = 'down'
+    RESTORING = 'restoring'
+    BACKOFF = 'backoff'
+    CIRCUIT_OPEN = 'circuit-open'
+
+
+class StateTransition(BaseModel):
+    at: float
+    state: UplinkState
+    reason: str
+
+
+class UplinkStatus(BaseModel):
+    state: UplinkState
+    check_interval_s: float
+    last_check_at: float | None
+    next_check_at: float | None
+    restore_attempts: int
+    next_restore_at: float | None
+    circuit_open_until: float | None
+    probe_budget_remaining_bytes: float | None
+    probe_bytes_total: int
+    transitions: List[StateTransition]
+
+
+class CheckScheduler:
+    """Decides when the UplinkMonitor checks the connection next and whether it may try to restore it.
+
+    The check interval grows by `growth` per successful check from `check_interval_s` up to
+    `stable_check_interval_s`. The first failed check drops it to `min_check_interval_s`, from where
+    it grows back to `check_interval_s` while the connection stays down.
+    Restore attempts since the connection was last up are spaced by exponential backoff with jitter.
+    After `circuit_threshold` attempts the circuit opens for `circuit_open_s`, then a single attempt
+    is allowed (half-open) before it opens again.
+    With a daily probe budget, checks are postponed once the budget is used up; up to an hour's worth
+    of budget can be saved up. All times are `time.monotonic()` values passed in by the caller."""
+
+    def __init__(self, check_interval_s: float = 10, min_check_interval_s: float = 2, stable_check_interval_s: float = 60,
+                 growth: float = 1.5, restore_backoff_s: float = 30, restore_backoff_max_s: float = 900,
+                 circuit_threshold: int = 5, circuit_open_s: float = 1800, budget_bytes_per_day: float = 0,
+                 rng: random.Random = None, max_transitions: int = 32, on_transition: Callable[['StateTransition'], None] = None):
+        self.check_interval_s = check_interval_s
+        self.min_check_interval_s = min(min_check_interval_s, check_interval_s)
+        self.stable_check_interval_s = max(stable_check_interval_s, check_interval_s)
+        self.growth = growth
+        self.restore_backoff_s = restore_backoff_s
+        self.restore_backoff_max_s = restore_backoff_max_s
+        self.circuit_threshold = circuit_threshold
+        self.circuit_open_s = circuit_open_s
+        self._rng = rng or random.Random()
+        self._on_transition = on_transition
+
+        self.state = UplinkState.UNKNOWN
+        self.transitions: deque[StateTransition] = deque(maxlen=max_transitions)
+        self.interval_s = check_interval_s
+        self.restore_attempts = 0
+        self._last_check: Optional[float] = None
+        self._next_check: Optional[float] = None
+        self._next_restore: Optional[float] = None
+        self._circuit_open_until: Optional[float] = None
+
+        self._budget_rate = budget_bytes_per_day / 86400
+        self._budget_capacity = budget_bytes_per_day / 24
+        self._budget_tokens = self._budget_capacity
+        self._budget_updated: Optional[float] = None
+        self._budget_limited = False
+        self._check_bytes = 0
+        self.probe_bytes_total = 0
+
+    def _transition(self, state: UplinkState, reason: str) -> None:
+        if state == self.state:
+            return
+        logger.info('Uplink %s -> %s (%s)', self.state.value, state.value, reason)
+        self.state = state
+        transition = StateTransition(at=time.time(), state=state, reason=reason)
+        self.transitions.append(transition)
+        if self._on_transition is not None:
+            self._on_transition(transition)
+
+    def _refill_budget(self, now: float) -> None:
+        if self._budget_updated is not None:
+            self._budget_tokens = min(self._budget_capacity, self._budget_tokens + (now - self._budget_updated) * self._budget_rate)
+        self._budget_updated = now
+
+    def circuit_open(self, now: float) -> bool:
+        return self._circuit_open_until is not None and now < self._circuit_open_until
+
+    def record_probe_bytes(self, probe_bytes: int, now: float) -> None:
+        """Charges the traffic of one probe against the budget, including probes finishing after the verdict."""
+        self.probe_bytes_total += probe_bytes
+        self._check_bytes += probe_bytes
+        if self._budget_rate:
+            self._refill_budget(now)
+            # May go negative (e.g. checks triggered by link events), which postpones later checks accordingly
+            self._budget_tokens -= probe_bytes
+
+    def record_check(self, is_up: bool, now: float) -> None:
+        """Records the verdict of a check and schedules the next one."""
+        self._last_check = now
+        # What was charged since the last verdict, as the estimate of what the next check will cost
+        probe_bytes, self._check_bytes = self._check_bytes, 0
+
+        if is_up:
+            self.interval_s = min(self.stable_check_interval_s, self.interval_s * self.growth) if self.state == UplinkState.UP else self.check_interval_s
+            self.restore_attempts = 0
+            self._next_restore = None
+            self._circuit_open_until = None
+            self._transition(UplinkState.UP, 'check succeeded')
+        else:
+            if self.state in (UplinkState.UP, UplinkState.UNKNOWN):
+                self.interval_s = self.min_check_interval_s
+            else:
+                self.interval_s = min(self.check_interval_s, self.interval_s * self.growth)
+            if self.circuit_open(now):
+                self._transition(UplinkState.CIRCUIT_OPEN, 'check failed')
+            elif self._next_restore is not None and now < self._next_restore:
+                self._transition(UplinkState.BACKOFF, 'check failed')
+            else:
+                self._transition(UplinkState.DOWN, 'check failed')
+        self._next_check = now + self.interval_s
+
+        if self._budget_rate:
+            self._refill_budget(now)
+            if self._budget_tokens < probe_bytes:
+                self._next_check = max(self._next_check, now + (probe_bytes - self._budget_tokens) / self._budget_rate)
+                if not self._budget_limited:
+                    logger.warning('Probe data budget used up, postponing connection checks')
+                self._budget_limited = True
+            elif self._budget_limited:
+                logger.info('Probe data budget available again')
+                self._budget_limited = False
+
+    def next_check_delay(self, now: float) -> float:
+        if self._next_check is None:
+            return 0
+        return max(0.0, self._next_check - now)
+
+    def next_restore_delay(self, now: float) -> float:
+        if self._next_restore is None:
+            return 0
+        return max(0.0, self._next_restore - now)
+
+    def start_restore(self, now: float) -> bool:
+        """Returns whether a restore attempt may start now and if so, enters the restoring state."""
+        if self.circuit_open(now):
+            return False
+        if self._next_restore is not None and now < self._next_restore:
+            return False
+        if self._circuit_open_until is not None:
+            reason = 'circuit half-open'
+        else:
+            reason = f'attempt {self.restore_attempts + 1}'
+        self._transition(UplinkState.RESTORING, reason)
+        return True
+
+    def backoff_s(self, attempts: int) -> float:
+        """Backoff after `attempts` restore attempts, with "equal jitter" (half fixed, half random)."""
+        delay = min(self.restore_backoff_max_s, self.restore_backoff_s * 2 ** (attempts - 1))
+        return delay / 2 + self._rng.uniform(0, delay / 2)
+
+    def record_restore(self, success: bool, now: float) -> None:
+        """Records a finished restore attempt. Whether it worked is decided by the next check, so
+        attempts only stop counting once a check succeeds."""
+        self.restore_attempts += 1
+        result = 'succeeded' if success else 'failed'
+        if self.restore_attempts >= self.circuit_threshold:
+            self._circuit_open_until = now + self.circuit_open_s
+            self._next_restore = self._circuit_open_until
+            self._transition(UplinkState.CIRCUIT_OPEN, f'{self.restore_attempts} restore attempts, last one {result}')
+        else:
+            self._next_restore = now + self.backoff_s(self.restore_attempts)
+            self._transition(UplinkState.BACKOFF, f'restore attempt {self.restore_attempts} {result}')
+
+    def status(self, now: float) -> UplinkStatus:
+        # Report wall-clock times
+        offset = time.time() - now
+        def wall(t: Optional[float]) -> Optional[float]:
+            return None if t is None else t + offset
+
+        budget = None
+        if self._budget_rate:
+            self._refill_budget(now)
+            budget = self._budget_tokens
+        return UplinkStatus(
+            state=self.state,
+            check_interval_s=self.interval_s,
+            last_check_at=wall(self._last_check),
+            next_check_at=wall(self._next_check),
+            restore_attempts=self.restore_attempts,
+            next_restore_at=wall(self._next_restore),
+            circuit_open_until=wall(self._circuit_open_until) if self.circuit_open(now) else None,
+            probe_budget_remaining_bytes=budget,
+            probe_bytes_total=self.probe_bytes_total,
+            transitions=list(self.transitions),
+        )
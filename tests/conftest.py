@@ -3,4 +3,21 @@ import pytest
 # This is necessary to prevent tests from accidentally loading real config files
 @pytest.fixture(autouse=True)
 def set_settings_file_location(monkeypatch):
-    monkeypatch.setenv('SETTINGS_FILE', '/tmp/should_not_exist.yaml')
\ No newline at end of file
+    monkeypatch.setenv('SETTINGS_FILE', '/tmp/should_not_exist.yaml')
+
+
+class RecordingController:
+    """Stands in for HcuController, keeping the commands it was given and where they came from."""
+
+    def __init__(self):
+        self.commands = []
+        self.addrs = []
+
+    async def process_command(self, command, addr=None):
+        self.commands.append(command)
+        self.addrs.append(addr)
+
+
+@pytest.fixture
+def controller():
+    return RecordingController()
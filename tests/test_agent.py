@@ -0,0 +1,10 @@
+import subprocess
+import sys
+
+
+def test_agent_does_not_import_http_stack():
+    out = subprocess.run(
+        [sys.executable, '-c', 'import sys, msu_manager.agent; print("fastapi" in sys.modules, "uvicorn" in sys.modules)'],
+        capture_output=True, text=True, check=True,
+    )
+    assert out.stdout.strip() == 'False False'
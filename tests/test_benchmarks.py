@@ -0,0 +1,38 @@
+import pytest
+
+from benchmarks.common import generate_payloads, parse_mix, percentile
+from benchmarks.run import compare
+from benchmarks.udp_load import run_udp_load
+from benchmarks.udp_scaling import run_udp_scaling
+
+
+def test_parse_mix_and_generate():
+    mix = parse_mix('heartbeat=1,MALFORMED=1')
+    assert mix == {'HEARTBEAT': 1, 'MALFORMED': 1}
+    payloads = generate_payloads(mix, 100)
+    assert len(payloads) == 100
+    with pytest.raises(ValueError):
+        parse_mix('REBOOT=1')
+
+def test_percentile():
+    assert percentile([3, 1, 2], 50) == 2
+    assert percentile(list(range(101)), 99) == 99
+
+def test_compare_flags_regressions():
+    baseline = {'version': '1', 'git_revision': 'a', 'results': {'udp': {'throughput_dgram_s': 1000, 'handling_latency': {'p99_us': 10}}}}
+    same = {'results': {'udp': {'throughput_dgram_s': 1000, 'handling_latency': {'p99_us': 10}}}}
+    slower = {'results': {'udp': {'throughput_dgram_s': 500, 'handling_latency': {'p99_us': 10}}}}
+    assert compare(baseline, same, 0.1)
+    assert not compare(baseline, slower, 0.1)
+
+@pytest.mark.asyncio
+async def test_udp_load_smoke():
+    result = await run_udp_load(count=200, rate=20_000)
+    assert result['received'] > 0
+    assert result['dispatched'] > 0
+
+@pytest.mark.asyncio
+async def test_udp_scaling_smoke():
+    result = await run_udp_scaling(count=200, workers=[1], senders=1)
+    assert result['workers_1']['dispatched'] > 0
+    assert result['workers_1']['speedup'] == 1.0
@@ -0,0 +1,73 @@
+import asyncio
+import os
+import sys
+import time
+
+import pytest
+
+from msu_manager.commands import CommandHelper, CommandRunner, _RingBuffer
+
+
+def test_ring_buffer_keeps_tail():
+    buffer = _RingBuffer(4)
+    buffer.write(b'abc')
+    buffer.write(b'defg')
+    assert buffer.text() == '[3 bytes truncated]\ndefg'
+
+
+@pytest.mark.asyncio
+async def test_captures_output_and_env():
+    result = await CommandRunner().run(['sh', '-c', 'echo out; echo $FOO >&2; exit 3'], env={'FOO': 'bar'})
+    assert (result.returncode, result.stdout, result.stderr, result.timed_out) == (3, 'out\n', 'bar\n', False)
+
+
+@pytest.mark.asyncio
+async def test_output_is_bounded():
+    result = await CommandRunner(capture_bytes=1000).run([sys.executable, '-c', 'print("x" * 100000)'])
+    assert result.returncode == 0
+    assert result.stdout.startswith('[99001 bytes truncated]\n')
+
+
+@pytest.mark.asyncio
+async def test_timeout_terminates():
+    result = await CommandRunner().run(['sleep', '10'], timeout_s=0.2)
+    assert result.timed_out
+    assert result.returncode == -15
+
+
+@pytest.mark.asyncio
+async def test_timeout_escalates_to_kill():
+    runner = CommandRunner(kill_grace_s=0.2)
+    start = time.perf_counter()
+    result = await runner.run(['sh', '-c', 'trap "" TERM; echo ready; sleep 10'], timeout_s=0.3)
+    assert result.timed_out
+    assert result.returncode == -9
+    assert result.stdout == 'ready\n'
+    assert time.perf_counter() - start < 5
+
+
+@pytest.mark.asyncio
+async def test_concurrency_cap():
+    runner = CommandRunner(max_concurrency=1)
+    start = time.perf_counter()
+    await asyncio.gather(*(runner.run(['sleep', '0.2']) for _ in range(3)))
+    assert time.perf_counter() - start >= 0.6
+
+
+@pytest.mark.asyncio
+async def test_sudo_commands_go_through_helper():
+    helper = CommandHelper([sys.executable, '-m', 'msu_manager.commands'])
+    runner = CommandRunner(helper=helper)
+    try:
+        results = await asyncio.gather(
+            runner.run(['sudo', 'sh', '-c', 'echo $FOO'], env={'FOO': 'via helper'}),
+            runner.run(['sudo', 'sleep', '10'], timeout_s=0.2),
+        )
+        assert results[0].stdout == 'via helper\n'
+        assert results[1].timed_out
+        assert (await runner.run(['sudo', 'sh', '-c', 'echo $PPID'])).stdout.strip() == str(helper._proc.pid)
+        # Commands without sudo are run directly
+        assert (await runner.run(['sh', '-c', 'echo $PPID'])).stdout.strip() == str(os.getpid())
+    finally:
+        await helper.close()
+    assert helper._proc.returncode == 0
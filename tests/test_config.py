@@ -25,6 +25,7 @@ def test_full_config(monkeypatch):
     ''')
     assert CONFIG.hcu_controller.udp_listen_port == 8001
     assert CONFIG.uplink_monitor.check_interval_s == 10
+    assert CONFIG.uplink_monitor.check_connection_target == ['1.1.1.1']
 
 def test_explicit_feature_disable():
     CONFIG = MsuManagerConfig.model_validate_json('''
@@ -45,4 +46,19 @@ def test_implicit_feature_disable(monkeypatch):
     { }
     ''')
     assert CONFIG.hcu_controller.enabled == False
-    assert CONFIG.uplink_monitor.enabled == False
\ No newline at end of file
+    assert CONFIG.uplink_monitor.enabled == False
+
+def test_upload_headers_are_redacted():
+    CONFIG = MsuManagerConfig.model_validate_json('''
+    {
+        "telemetry": {
+            "upload": {
+                "enabled": true,
+                "url": "https://example.com/ingest",
+                "headers": {"Authorization": "Bearer secret-token"}
+            }
+        }
+    }
+    ''')
+    assert CONFIG.telemetry.upload.headers['Authorization'].get_secret_value() == 'Bearer secret-token'
+    assert 'secret-token' not in CONFIG.model_dump_json(indent=2)
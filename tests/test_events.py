@@ -0,0 +1,164 @@
+import asyncio
+import json
+import os
+import signal
+import socket
+import subprocess
+import sys
+import time
+from unittest.mock import AsyncMock
+
+import pytest
+
+from msu_manager.config import UplinkMonitorConfig
+from msu_manager.events import EventBus, EventType, format_sse
+from msu_manager.hcu.controller import HcuController
+from msu_manager.hcu.messages import (HeartbeatCommand, LogCommand,
+                                      ResumeCommand, ShutdownCommand)
+from msu_manager.uplink.monitor import UplinkMonitor
+
+
+@pytest.mark.asyncio
+async def test_fan_out_and_type_filter():
+    bus = EventBus()
+    everything = bus.subscribe()
+    telemetry = bus.subscribe([EventType.TELEMETRY])
+
+    bus.publish(EventType.SHUTDOWN_SCHEDULED, delay_s=10)
+    bus.publish(EventType.TELEMETRY, key='temp', value=40.5)
+
+    assert [(await everything.get()).type for _ in range(2)] == [EventType.SHUTDOWN_SCHEDULED, EventType.TELEMETRY]
+    event = await telemetry.get()
+    assert event.data == {'key': 'temp', 'value': 40.5}
+    assert event.seq == 2
+
+    bus.unsubscribe(telemetry)
+    assert await telemetry.get() is None
+
+
+@pytest.mark.asyncio
+async def test_slow_subscriber_is_dropped():
+    bus = EventBus(queue_size=3)
+    slow = bus.subscribe()
+    fast = bus.subscribe()
+    received = []
+
+    async def consume():
+        async for event in fast:
+            received.append(event.data['i'])
+
+    consumer = asyncio.create_task(consume())
+    for i in range(10):
+        bus.publish(EventType.TELEMETRY, i=i)
+        await asyncio.sleep(0)
+
+    assert slow.closed
+    assert [event async for event in slow] == []
+    assert received == list(range(10))
+    bus.unsubscribe(fast)
+    await consumer
+
+
+def test_publish_without_subscribers_is_free():
+    bus = EventBus()
+    bus.publish(EventType.TELEMETRY, key='temp', value=1)
+    assert bus._seq == 0
+
+
+@pytest.mark.asyncio
+async def test_format_sse():
+    bus = EventBus()
+    subscription = bus.subscribe()
+    bus.publish(EventType.UPLINK_STATE, state='down', reason='check failed')
+    lines = format_sse(await subscription.get()).decode().split('\n')
+    assert lines[:2] == ['id: 1', 'event: uplink-state']
+    assert json.loads(lines[2].removeprefix('data: '))['data'] == {'state': 'down', 'reason': 'check failed'}
+    assert lines[3:] == ['', '']
+
+
+@pytest.mark.asyncio
+async def test_hcu_controller_events():
+    bus = EventBus()
+    subscription = bus.subscribe()
+    controller = HcuController(['true'], 3600, events=bus)
+
+    await controller.process_command(HeartbeatCommand(command='HEARTBEAT', version='1.0'))
+    await controller.process_command(HeartbeatCommand(command='HEARTBEAT', version='1.0'))
+    await controller.process_command(ShutdownCommand(command='SHUTDOWN'))
+    await controller.process_command(LogCommand(command='LOG', key='temp', value=41.5))
+    await controller.process_command(ResumeCommand(command='RESUME'))
+
+    events = [await subscription.get() for _ in range(4)]
+    assert [e.type for e in events] == [EventType.HEARTBEAT_VERSION, EventType.SHUTDOWN_SCHEDULED,
+                                        EventType.TELEMETRY, EventType.SHUTDOWN_CANCELLED]
+    assert events[0].data == {'version': '1.0', 'previous': None}
+    assert events[1].data['delay_s'] == 3600
+
+
+@pytest.mark.asyncio
+async def test_uplink_monitor_events(monkeypatch):
+    bus = EventBus()
+    subscription = bus.subscribe([EventType.UPLINK_STATE])
+    monitor = UplinkMonitor(UplinkMonitorConfig(
+        enabled=True,
+        restore_connection_cmd=['./restore'],
+        wwan_device='wwan0',
+        wwan_usb_id='1234:5678',
+        wwan_apn='test_apn',
+        check_connection_target='8.8.8.8',
+    ), events=bus)
+
+    verdicts = [True, False]
+    async def check_connection():
+        return verdicts.pop(0)
+    async def restore_connection():
+        raise asyncio.CancelledError()
+    monitor.check_connection = check_connection
+    monitor.restore_connection = restore_connection
+    monkeypatch.setattr(asyncio, 'sleep', AsyncMock())
+
+    with pytest.raises(asyncio.CancelledError):
+        await monitor.run()
+    assert [(await subscription.get()).data['state'] for _ in range(3)] == ['up', 'down', 'restoring']
+
+
+@pytest.mark.asyncio
+async def test_close_ends_all_streams():
+    bus = EventBus()
+    subscription = bus.subscribe()
+    waiter = asyncio.create_task(subscription.get())
+    await asyncio.sleep(0)
+    bus.close()
+    assert await waiter is None
+    assert await bus.subscribe().get() is None
+
+
+def test_shutdown_with_stream_connected(tmp_path):
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        port = s.getsockname()[1]
+    settings = tmp_path / 'settings.yaml'
+    settings.write_text(f'http_api:\n  host: 127.0.0.1\n  port: {port}\n')
+    agent = subprocess.Popen([sys.executable, '-m', 'msu_manager.agent'], env={**os.environ, 'SETTINGS_FILE': str(settings)},
+                             stdout=subprocess.PIPE, stderr=subprocess.STDOUT, text=True)
+    try:
+        deadline = time.monotonic() + 10
+        while True:
+            try:
+                client = socket.create_connection(('127.0.0.1', port), timeout=1)
+                break
+            except ConnectionRefusedError:
+                assert time.monotonic() < deadline and agent.poll() is None
+                time.sleep(0.05)
+        with client:
+            client.sendall(b'GET /events HTTP/1.1\r\nHost: test\r\n\r\n')
+            assert client.recv(1024).startswith(b'HTTP/1.1 200')
+
+            start = time.monotonic()
+            agent.send_signal(signal.SIGTERM)
+            agent.wait(timeout=5)
+            assert time.monotonic() - start < 3
+    finally:
+        agent.kill()
+    assert agent.returncode == -signal.SIGTERM
+    assert 'Application shutdown complete' in agent.stdout.read()
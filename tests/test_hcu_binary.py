@@ -0,0 +1,64 @@
+import asyncio
+
+import pytest
+
+from msu_manager.hcu.binary import (BinaryFormatError, decode_binary,
+                                    encode_binary, is_binary)
+from msu_manager.hcu.messages import (HeartbeatCommand, LogCommand,
+                                      ResumeCommand, ShutdownCommand)
+from msu_manager.hcu.protocol import HcuProtocol
+
+
+@pytest.mark.parametrize('message', [
+    ShutdownCommand(command='SHUTDOWN'),
+    ResumeCommand(command='RESUME', unit_id='hcu-1'),
+    HeartbeatCommand(command='HEARTBEAT', version='0.0.3'),
+    HeartbeatCommand(command='HEARTBEAT'),
+    LogCommand(command='LOG', key='temperature', value=21.5, unit_id='hcu-1'),
+    LogCommand(command='LOG', key='state', value='charging'),
+])
+def test_round_trip(message):
+    data = encode_binary(message)
+    assert is_binary(data)
+    assert decode_binary(data) == message
+
+
+def test_numeric_log_values_are_sent_as_float():
+    data = encode_binary(LogCommand(command='LOG', key='temperature', value='21.5'))
+    assert len(data) == 2 + 1 + len('temperature') + 8
+    assert decode_binary(data).value == 21.5
+    # Strings that do not survive the conversion unchanged are kept as strings
+    assert decode_binary(encode_binary(LogCommand(command='LOG', key='t', value='21.50'))).value == '21.50'
+
+
+def test_header_layout():
+    assert encode_binary(ShutdownCommand(command='SHUTDOWN')) == b'\xb1\x01'
+    assert not is_binary(b'{"command": "SHUTDOWN"}')
+
+
+@pytest.mark.parametrize('data', [
+    b'\xb1',                       # truncated header
+    b'\xb2\x01',                   # unsupported version
+    b'\xb1\x09',                   # unknown command type
+    b'\xb1\x03\x05abc',            # string runs past the end
+    b'\xb1\x04\x01k\xff\x00',      # numeric flag missing, str16 too short
+    b'\xb1\x01\x00',               # trailing bytes
+    b'\xb1\x03\x02\xff\xfe',       # invalid UTF-8
+])
+def test_malformed(data):
+    with pytest.raises(BinaryFormatError):
+        decode_binary(data)
+
+
+@pytest.mark.asyncio
+async def test_protocol_accepts_both_formats(controller):
+    protocol = HcuProtocol(controller=controller)
+    protocol.connection_made(None)
+
+    protocol.datagram_received(encode_binary(HeartbeatCommand(command='HEARTBEAT', version='1.0')), ('127.0.0.1', 1234))
+    protocol.datagram_received(b'\xb1\x09', ('127.0.0.1', 1234))
+    protocol.datagram_received(b'{"command": "SHUTDOWN"}', ('127.0.0.1', 1234))
+    await asyncio.sleep(0)
+
+    assert controller.commands == [HeartbeatCommand(command='HEARTBEAT', version='1.0'), ShutdownCommand(command='SHUTDOWN')]
+    protocol.connection_lost(None)
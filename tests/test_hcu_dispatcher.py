@@ -0,0 +1,95 @@
+import asyncio
+
+import pytest
+
+from msu_manager.config import OverflowPolicy
+from msu_manager.hcu.dispatcher import CommandDispatcher
+from msu_manager.hcu.messages import (HeartbeatCommand, LogCommand,
+                                      ResumeCommand, ShutdownCommand)
+
+SHUTDOWN = ShutdownCommand(command='SHUTDOWN')
+RESUME = ResumeCommand(command='RESUME')
+HEARTBEAT = HeartbeatCommand(command='HEARTBEAT')
+
+
+def log(i):
+    return LogCommand(command='LOG', key='k', value=str(i))
+
+
+def queued(dispatcher):
+    return [command for command, _ in dispatcher._queue]
+
+
+class SlowController:
+    def __init__(self):
+        self.commands = []
+
+    async def process_command(self, command, addr=None):
+        # Yield like a real handler would, so later commands could overtake without ordering
+        await asyncio.sleep(0)
+        self.commands.append(command)
+
+
+async def drain(dispatcher):
+    while dispatcher.stats().depth > 0:
+        await asyncio.sleep(0)
+    await asyncio.sleep(0)
+
+
+@pytest.mark.asyncio
+async def test_commands_dispatched_in_order():
+    controller = SlowController()
+    dispatcher = CommandDispatcher(controller, max_size=100, batch_size=3)
+    dispatcher.start()
+
+    commands = [SHUTDOWN, RESUME, *[log(i) for i in range(10)], SHUTDOWN]
+    for c in commands:
+        dispatcher.put(c)
+    await drain(dispatcher)
+    dispatcher.close()
+
+    assert controller.commands == commands
+    assert dispatcher.stats().dispatched == len(commands)
+
+
+def test_drop_newest():
+    dispatcher = CommandDispatcher(SlowController(), max_size=2, overflow_policy=OverflowPolicy.DROP_NEWEST)
+    assert dispatcher.put(log(0))
+    assert dispatcher.put(log(1))
+    assert not dispatcher.put(log(2))
+    assert queued(dispatcher) == [log(0), log(1)]
+    assert dispatcher.stats().dropped == 1
+
+
+def test_drop_oldest():
+    dispatcher = CommandDispatcher(SlowController(), max_size=2, overflow_policy=OverflowPolicy.DROP_OLDEST)
+    for i in range(3):
+        assert dispatcher.put(log(i))
+    assert queued(dispatcher) == [log(1), log(2)]
+    stats = dispatcher.stats()
+    assert stats.dropped == 1
+    assert stats.max_depth == 2
+
+
+def test_coalesce_keeps_latest_power_command():
+    dispatcher = CommandDispatcher(SlowController(), max_size=3, overflow_policy=OverflowPolicy.COALESCE)
+    dispatcher.put(SHUTDOWN)
+    dispatcher.put(HEARTBEAT)
+    dispatcher.put(RESUME)
+    dispatcher.put(SHUTDOWN)
+    assert queued(dispatcher) == [HEARTBEAT, SHUTDOWN]
+    assert dispatcher.stats().coalesced == 2
+
+    # Telemetry makes room by evicting older telemetry, never the power command
+    dispatcher.put(log(0))
+    dispatcher.put(log(1))
+    assert queued(dispatcher) == [SHUTDOWN, log(0), log(1)]
+    assert dispatcher.stats().dropped == 1
+
+
+def test_coalesce_is_per_sender():
+    dispatcher = CommandDispatcher(SlowController(), max_size=2, overflow_policy=OverflowPolicy.COALESCE)
+    dispatcher.put(SHUTDOWN, ('10.0.0.1', 1000))
+    dispatcher.put(SHUTDOWN, ('10.0.0.2', 1000))
+    dispatcher.put(RESUME, ('10.0.0.1', 2000))
+    assert list(dispatcher._queue) == [(SHUTDOWN, ('10.0.0.2', 1000)), (RESUME, ('10.0.0.1', 2000))]
@@ -0,0 +1,201 @@
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+from pydantic import ValidationError
+
+from msu_manager.hcu.gateway import GatewayController
+from msu_manager.hcu.messages import (HeartbeatCommand, LogCommand,
+                                      ResumeCommand, ShutdownCommand)
+from msu_manager.hcu.timing_wheel import TimingWheel
+from msu_manager.telemetry import TelemetryStore
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = SimpleNamespace(now=100.0)
+    monkeypatch.setattr('msu_manager.hcu.timing_wheel.time.monotonic', lambda: clock.now)
+    return clock
+
+
+def tick(wheel, clock):
+    # What run() does once a tick is due
+    clock.now += 1
+    wheel._tick_at = clock.now
+    wheel.advance()
+
+
+def test_timing_wheel_fires_after_delay(clock):
+    wheel = TimingWheel(tick_s=1, size=4)
+    wheel._tick_at = clock.now
+    fired = []
+    wheel.schedule(2, fired.append, 'a')
+    # Longer than one revolution of the wheel
+    wheel.schedule(10, fired.append, 'b')
+    cancelled = wheel.schedule(3, fired.append, 'c')
+    wheel.cancel(cancelled)
+    assert len(wheel) == 2
+
+    for n in range(1, 11):
+        tick(wheel, clock)
+        if n == 2:
+            assert fired == ['a']
+    assert fired == ['a', 'b']
+    assert len(wheel) == 0
+
+
+def test_timing_wheel_never_fires_early(clock):
+    wheel = TimingWheel(tick_s=1, size=8)
+    wheel._tick_at = clock.now
+    # Most of the current tick has passed already
+    clock.now += 0.75
+    fired = []
+    wheel.schedule(0.25, fired.append, 'a')
+    wheel.schedule(0.5, fired.append, 'b')
+    tick(wheel, clock)
+    assert fired == ['a']
+    tick(wheel, clock)
+    assert fired == ['a', 'b']
+
+    # Before run() the time within the tick is unknown, so a whole tick is assumed to have passed
+    wheel = TimingWheel(tick_s=1, size=8)
+    wheel.schedule(1, fired.append, 'c')
+    wheel.advance()
+    assert fired == ['a', 'b']
+    wheel.advance()
+    assert fired == ['a', 'b', 'c']
+
+
+@pytest.fixture
+def gateway():
+    return GatewayController(['echo', '{unit}', '{address}'], shutdown_delay_s=5, heartbeat_timeout_s=3,
+                             telemetry=TelemetryStore(max_partitions=8, max_keys_per_partition=4))
+
+
+@pytest.mark.asyncio
+async def test_units_keyed_by_address_or_unit_id(gateway):
+    await gateway.process_command(HeartbeatCommand(command='HEARTBEAT', version='1.0'), ('10.0.0.1', 5000))
+    await gateway.process_command(HeartbeatCommand(command='HEARTBEAT', version='2.0', unit_id='hcu-7'), ('10.0.0.2', 5000))
+    await gateway.process_command(LogCommand(command='LOG', key='temp', value='40'), ('10.0.0.1', 6000))
+
+    units = {u.unit: u for u in gateway.units()}
+    assert units.keys() == {'10.0.0.1', 'hcu-7'}
+    assert units['10.0.0.1'].version == '1.0'
+    assert units['hcu-7'].address == '10.0.0.2'
+    assert units['hcu-7'].online
+    assert gateway._telemetry.keys() == ['10.0.0.1/temp']
+
+
+@pytest.mark.asyncio
+async def test_heartbeat_timeout_marks_unit_offline(gateway):
+    await gateway.process_command(HeartbeatCommand(command='HEARTBEAT'), ('10.0.0.1', 5000))
+    for _ in range(2):
+        gateway._wheel.advance()
+    # A heartbeat re-arms the watchdog
+    await gateway.process_command(HeartbeatCommand(command='HEARTBEAT'), ('10.0.0.1', 5000))
+    for _ in range(3):
+        gateway._wheel.advance()
+    assert gateway.unit('10.0.0.1').online
+
+    gateway._wheel.advance()
+    assert not gateway.unit('10.0.0.1').online
+
+
+@pytest.mark.asyncio
+async def test_delayed_shutdown_per_unit(gateway, monkeypatch):
+    executed = []
+    async def fake_execute(unit, address):
+        executed.append((unit, address))
+    monkeypatch.setattr(gateway, '_execute_shutdown', fake_execute)
+
+    await gateway.process_command(ShutdownCommand(command='SHUTDOWN'), ('10.0.0.1', 5000))
+    await gateway.process_command(ShutdownCommand(command='SHUTDOWN'), ('10.0.0.2', 5000))
+    await gateway.process_command(ResumeCommand(command='RESUME'), ('10.0.0.2', 5000))
+    assert gateway.unit('10.0.0.1').shutdown_at is not None
+    assert gateway.unit('10.0.0.2').shutdown_at is None
+
+    for _ in range(6):
+        gateway._wheel.advance()
+    for task in list(gateway._shutdown_tasks):
+        await task
+    assert executed == [('10.0.0.1', '10.0.0.1')]
+    assert gateway.unit('10.0.0.1').shutdown_at is None
+
+
+
+@pytest.mark.asyncio
+async def test_close_waits_for_running_shutdowns(gateway, monkeypatch):
+    executed = []
+    async def slow_execute(unit, address):
+        await asyncio.sleep(0.05)
+        executed.append(unit)
+    monkeypatch.setattr(gateway, '_execute_shutdown', slow_execute)
+
+    gateway.start()
+    await gateway.process_command(ShutdownCommand(command='SHUTDOWN'), ('10.0.0.1', 5000))
+    for _ in range(6):
+        gateway._wheel.advance()
+    assert gateway._shutdown_tasks
+
+    await gateway.close()
+    assert executed == ['10.0.0.1']
+    assert not gateway._shutdown_tasks
+
+
+@pytest.mark.parametrize('unit_id', ['-oProxyCommand=touch /tmp/pwn', 'a b', '{address}', '', 'x' * 65])
+def test_unsafe_unit_ids_are_rejected(unit_id):
+    with pytest.raises(ValidationError):
+        HeartbeatCommand(command='HEARTBEAT', unit_id=unit_id)
+
+
+@pytest.mark.asyncio
+async def test_shutdown_command_placeholders(monkeypatch):
+    gateway = GatewayController(['sh', '-c', 'echo ${HOME} {unit}', '{address}'], shutdown_delay_s=5)
+    commands = []
+    async def fake_run(command, timeout_s=None):
+        commands.append(command)
+        return SimpleNamespace(returncode=0)
+    monkeypatch.setattr(gateway._runner, 'run', fake_run)
+
+    await gateway._execute_shutdown('hcu-7', '10.0.0.2')
+    assert commands == [['sh', '-c', 'echo ${HOME} hcu-7', '10.0.0.2']]
+
+
+@pytest.mark.asyncio
+async def test_units_are_bounded():
+    gateway = GatewayController(['true'], shutdown_delay_s=5, heartbeat_timeout_s=1, max_units=2, unit_retention_s=3)
+    await gateway.process_command(HeartbeatCommand(command='HEARTBEAT', unit_id='a'))
+    await gateway.process_command(ShutdownCommand(command='SHUTDOWN', unit_id='b'))
+    await gateway.process_command(HeartbeatCommand(command='HEARTBEAT', unit_id='c'))
+    assert {u.unit for u in gateway.units()} == {'a', 'b'}
+
+    # Once offline, the longest offline unit without a pending shutdown makes room
+    for _ in range(2):
+        gateway._wheel.advance()
+    await gateway.process_command(HeartbeatCommand(command='HEARTBEAT', unit_id='c'))
+    assert {u.unit for u in gateway.units()} == {'b', 'c'}
+
+    # Offline units are forgotten after the retention period, unless a shutdown is pending
+    await gateway.process_command(ResumeCommand(command='RESUME', unit_id='b'))
+    for _ in range(6):
+        gateway._wheel.advance()
+    assert gateway.units() == []
+    assert len(gateway._wheel) == 0
+
+
+@pytest.mark.asyncio
+async def test_telemetry_budget_per_unit():
+    telemetry = TelemetryStore(max_keys=0, max_partitions=2, max_keys_per_partition=2)
+    gateway = GatewayController(['true'], shutdown_delay_s=5, heartbeat_timeout_s=1, telemetry=telemetry, max_units=2, unit_retention_s=1)
+    for unit in ('a', 'b'):
+        for key in ('k1', 'k2', 'k3'):
+            await gateway.process_command(LogCommand(command='LOG', key=key, value=1, unit_id=unit))
+    assert telemetry.keys() == ['a/k1', 'a/k2', 'b/k1', 'b/k2']
+
+    # A forgotten unit's telemetry goes with it
+    for _ in range(2):
+        gateway._wheel.advance()
+    await gateway.process_command(LogCommand(command='LOG', key='k1', value=1, unit_id='c'))
+    (kept,) = {u.unit for u in gateway.units()} - {'c'}
+    assert telemetry.keys() == [f'{kept}/k1', f'{kept}/k2', 'c/k1']
+
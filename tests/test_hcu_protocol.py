@@ -0,0 +1,31 @@
+import asyncio
+
+import pytest
+
+from msu_manager.hcu.messages import ShutdownCommand
+from msu_manager.hcu.protocol import HcuProtocol
+
+
+@pytest.mark.asyncio
+async def test_datagram_dispatched_to_controller(controller):
+    protocol = HcuProtocol(controller=controller)
+    protocol.connection_made(None)
+
+    protocol.datagram_received(b'{"command": "SHUTDOWN"}\n', ('127.0.0.1', 1234))
+    await asyncio.sleep(0)
+
+    assert controller.commands == [ShutdownCommand(command='SHUTDOWN')]
+    protocol.connection_lost(None)
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize('data', [b'not json', b'\xff\xfe', b'{"command": "REBOOT"}', b'{"command": "LOG"}'])
+async def test_invalid_datagram_is_dropped(data, controller):
+    protocol = HcuProtocol(controller=controller)
+    protocol.connection_made(None)
+
+    protocol.datagram_received(data, ('127.0.0.1', 1234))
+    await asyncio.sleep(0)
+
+    assert controller.commands == []
+    protocol.connection_lost(None)
@@ -0,0 +1,66 @@
+import asyncio
+import pickle
+
+import pytest
+
+from msu_manager.hcu.protocol import HcuProtocol
+from msu_manager.hcu.ratelimit import DUPLICATE, RATE, SourceLimiter
+
+
+def test_token_bucket_per_source():
+    limiter = SourceLimiter(rate_per_s=10, burst=3, dedup_window_s=0)
+    results = [limiter.check(f'{i}'.encode(), '10.0.0.1', 0.0) for i in range(5)]
+    assert results == [None, None, None, RATE, RATE]
+    # Other sources have their own bucket
+    assert limiter.check(b'x', '10.0.0.2', 0.0) is None
+    # 10/s refills one token every 100ms
+    assert limiter.check(b'y', '10.0.0.1', 0.1) is None
+    assert limiter.check(b'z', '10.0.0.1', 0.1) == RATE
+    assert limiter.dropped == {RATE: 3, DUPLICATE: 0}
+
+
+def test_duplicates_suppressed_within_window():
+    limiter = SourceLimiter(rate_per_s=10, burst=2, dedup_window_s=1.0)
+    assert limiter.check(b'SHUTDOWN', '10.0.0.1', 0.0) is None
+    for i in range(10):
+        assert limiter.check(b'SHUTDOWN', '10.0.0.1', 0.01 * i) == DUPLICATE
+    # Duplicates do not use up tokens
+    assert limiter.check(b'RESUME', '10.0.0.1', 0.1) is None
+    assert limiter.check(b'SHUTDOWN', '10.0.0.1', 0.2) is None
+    # Once per window, a repeated payload passes again
+    assert limiter.check(b'SHUTDOWN', '10.0.0.1', 1.5) is None
+
+
+def test_disabled_checks():
+    limiter = SourceLimiter(rate_per_s=0, dedup_window_s=0)
+    assert all(limiter.check(b'SHUTDOWN', '10.0.0.1', 0.0) is None for _ in range(1000))
+
+
+def test_sources_bounded():
+    limiter = SourceLimiter(max_sources=2)
+    for host in ('a', 'b', 'c'):
+        limiter.check(b'x', host, 0.0)
+    assert list(limiter._sources) == ['b', 'c']
+
+
+def test_pickles_settings_only():
+    limiter = SourceLimiter(rate_per_s=5, burst=7, dedup_window_s=2)
+    limiter.check(b'x', 'a', 0.0)
+    copy = pickle.loads(pickle.dumps(limiter))
+    assert (copy.rate_per_s, copy.burst, copy.dedup_window_s) == (5, 7, 2)
+    assert not copy._sources
+
+
+@pytest.mark.asyncio
+async def test_flood_dropped_before_decode(controller):
+    protocol = HcuProtocol(controller=controller, limiter=SourceLimiter(rate_per_s=50, burst=5))
+    protocol.connection_made(None)
+
+    for _ in range(1000):
+        protocol.datagram_received(b'{"command": "SHUTDOWN"}', ('127.0.0.1', 1234))
+    for i in range(10):
+        protocol.datagram_received(f'{{"command": "LOG", "key": "k", "value": "{i}"}}'.encode(), ('127.0.0.1', 1234))
+    await asyncio.sleep(0)
+
+    assert len(controller.commands) == 1 + 4
+    protocol.connection_lost(None)
@@ -0,0 +1,92 @@
+import asyncio
+import socket
+
+import pytest
+
+from msu_manager.hcu.messages import (CommandType, HeartbeatCommand,
+                                      LogCommand, ShutdownCommand)
+from msu_manager.hcu.workers import (WORKER_RESTARTS, IngestWorkerPool,
+                                     decode_frame, encode_frame,
+                                     reuse_port_socket)
+
+
+def _free_port():
+    sock = reuse_port_socket('127.0.0.1', 0)
+    port = sock.getsockname()[1]
+    sock.close()
+    return port
+
+
+@pytest.mark.parametrize('command', [
+    ShutdownCommand(command='SHUTDOWN'),
+    HeartbeatCommand(command='HEARTBEAT', version='1.2.3', unit_id='hcu-1'),
+    LogCommand(command='LOG', key='temp', value='42.0'),
+])
+def test_frame_round_trip(command):
+    frame = encode_frame(command, ('10.0.0.1', 5151))
+    decoded, addr = decode_frame(frame[4:])
+    assert decoded == command
+    assert decoded.command is CommandType(command.command)
+    assert addr == ('10.0.0.1', 5151)
+
+
+def test_frame_larger_than_64k():
+    command = LogCommand(command='LOG', key='temp', value='\\' * 40000)
+    frame = encode_frame(command, ('10.0.0.1', 5151))
+    assert len(frame) > 65535
+    decoded, _ = decode_frame(frame[4:])
+    assert decoded == command
+
+
+@pytest.mark.asyncio
+async def test_pool_forwards_from_all_workers(controller):
+    port = _free_port()
+    pool = IngestWorkerPool(controller, 2, '127.0.0.1', port, log_level='ERROR')
+    await pool.start()
+    try:
+        senders = [socket.socket(socket.AF_INET, socket.SOCK_DGRAM) for _ in range(8)]
+        for sender in senders:
+            sender.sendto(b'{"command": "HEARTBEAT"}', ('127.0.0.1', port))
+        sender.sendto(b'not json', ('127.0.0.1', port))
+
+        for _ in range(100):
+            if len(controller.commands) == len(senders):
+                break
+            await asyncio.sleep(0.05)
+        assert {addr[1] for addr in controller.addrs} == {s.getsockname()[1] for s in senders}
+        assert all(command == HeartbeatCommand(command='HEARTBEAT') for command in controller.commands)
+        for sender in senders:
+            sender.close()
+    finally:
+        await pool.close()
+    assert not any(process.is_alive() for process in pool._processes)
+
+
+@pytest.mark.asyncio
+async def test_pool_restarts_dead_workers(controller, monkeypatch):
+    monkeypatch.setattr('msu_manager.hcu.workers._RESTART_DELAY_S', 0)
+    port = _free_port()
+    pool = IngestWorkerPool(controller, 1, '127.0.0.1', port, log_level='ERROR')
+    await pool.start()
+    try:
+        restarts = WORKER_RESTARTS.value
+        dead = pool._processes[0]
+        dead.kill()
+        for _ in range(200):
+            if pool._processes[0] is not dead and pool._connections:
+                break
+            await asyncio.sleep(0.05)
+        assert WORKER_RESTARTS.value == restarts + 1
+        assert pool._processes[0].is_alive()
+
+        sender = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        for _ in range(100):
+            sender.sendto(b'{"command": "HEARTBEAT"}', ('127.0.0.1', port))
+            await asyncio.sleep(0.05)
+            if controller.commands:
+                break
+        sender.close()
+        assert controller.commands
+    finally:
+        await pool.close()
+    assert not any(process.is_alive() for process in pool._processes)
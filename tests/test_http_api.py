@@ -0,0 +1,100 @@
+from types import SimpleNamespace
+from unittest.mock import Mock
+
+import httpx
+import pytest
+
+from msu_manager.config import DiagnosticsConfig, HcuControllerConfig
+from msu_manager.events import EventBus, EventType
+from msu_manager.hcu.controller import HcuController
+from msu_manager.main import app
+from msu_manager.profiling import StackSampler
+from msu_manager.telemetry import TelemetryStore
+
+
+@pytest.fixture
+def client():
+    bus = EventBus()
+    app.state.CONFIG = SimpleNamespace(hcu_controller=HcuControllerConfig(enabled=True, shutdown_command=['true'], http_batch_max_commands=5),
+                                       diagnostics=DiagnosticsConfig(profiler_enabled=True, profiler_max_duration_s=1))
+    app.state.stack_sampler = StackSampler()
+    app.state.hcu_controller = HcuController(['true'], 3600, events=bus)
+    app.state.event_bus = bus
+    app.state.telemetry_store = TelemetryStore(partitions={'thermal': 8})
+    # The lifespan (and with it the UDP listener) is not started by ASGITransport
+    return httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url='http://test')
+
+
+@pytest.mark.asyncio
+async def test_batch_commands_in_order(client):
+    subscription = app.state.event_bus.subscribe([EventType.SHUTDOWN_SCHEDULED, EventType.SHUTDOWN_CANCELLED])
+    body = b'{"command": "SHUTDOWN"}\n{"command": "REBOOT"}\n{"command": "RESUME"}\n'
+    response = await client.post('/hcu-controller/commands', content=body, headers={'Content-Type': 'application/x-ndjson'})
+
+    assert response.status_code == 200
+    result = response.json()
+    assert (result['processed'], result['invalid'], result['failed']) == (2, 1, 0)
+    assert [r['status'] for r in result['results']] == ['ok', 'invalid', 'ok']
+    assert [(await subscription.get()).type for _ in range(2)] == [EventType.SHUTDOWN_SCHEDULED, EventType.SHUTDOWN_CANCELLED]
+
+
+@pytest.mark.asyncio
+async def test_batch_rejected_as_a_whole(client):
+    response = await client.post('/hcu-controller/commands', content=b'{"command": "SHUTDOWN"}')
+    assert response.status_code == 422
+    response = await client.post('/hcu-controller/commands', json=[{'command': 'RESUME'}] * 6)
+    assert response.status_code == 413
+
+
+@pytest.mark.asyncio
+async def test_oversized_batch_rejected_before_validation(client, monkeypatch):
+    monkeypatch.setattr('msu_manager.main.validate_json_batch', Mock(side_effect=AssertionError('validated')))
+    app.state.CONFIG.hcu_controller.http_batch_max_bytes = 1000
+
+    response = await client.post('/hcu-controller/commands', content=b'{"command": "RESUME"}\n' * 6,
+                                 headers={'Content-Type': 'application/x-ndjson'})
+    assert response.status_code == 413
+    response = await client.post('/hcu-controller/commands', content=b'[' + b','.join([b'{"command": "RESUME"}'] * 6) + b']')
+    assert response.status_code == 413
+    response = await client.post('/hcu-controller/commands', content=b' ' * 1001)
+    assert response.status_code == 413
+
+    # Without Content-Length
+    async def chunks():
+        for _ in range(11):
+            yield b' ' * 100
+    response = await client.post('/hcu-controller/commands', content=chunks())
+    assert response.status_code == 413
+
+
+@pytest.mark.asyncio
+async def test_telemetry_keys_with_slashes(client):
+    app.state.telemetry_store.add('hcu-7/temp', 40, ts=1000)
+    response = await client.get('/hcu-controller/telemetry/hcu-7/temp')
+    assert response.status_code == 200
+    assert response.json()['avg'] == [40]
+    response = await client.get('/hcu-controller/telemetry/hcu-7/other')
+    assert response.status_code == 404
+
+    app.state.telemetry_store.add('thermal/coretemp/Core 0', 52.5, ts=1000, partition='thermal')
+    response = await client.get('/hcu-controller/telemetry/thermal/coretemp/Core 0')
+    assert response.status_code == 200
+    assert response.json()['avg'] == [52.5]
+
+
+@pytest.mark.asyncio
+async def test_profile_returns_collapsed_stacks(client):
+    response = await client.get('/admin/profile', params={'duration_s': 0.1})
+    assert response.status_code == 200
+    assert all(line.rsplit(' ', 1)[1].isdigit() for line in response.text.splitlines())
+    assert 'run_forever' in response.text
+
+    response = await client.get('/admin/profile', params={'duration_s': 2})
+    assert response.status_code == 422
+
+
+@pytest.mark.asyncio
+async def test_profile_is_disabled_by_default(client):
+    app.state.CONFIG.diagnostics = DiagnosticsConfig()
+    response = await client.get('/admin/profile', params={'duration_s': 0.1})
+    assert response.status_code == 404
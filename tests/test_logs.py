@@ -0,0 +1,41 @@
+import logging
+
+from msu_manager.logs import RateLimitFilter
+
+
+def make_record(msg, *args, level=logging.ERROR, rate_limit_key=None):
+    record = logging.LogRecord('test', level, __file__, 1, msg, args, None)
+    if rate_limit_key is not None:
+        record.rate_limit_key = rate_limit_key
+    return record
+
+
+def test_repeated_errors_are_collapsed(monkeypatch):
+    now = 1000.0
+    monkeypatch.setattr('time.monotonic', lambda: now)
+    f = RateLimitFilter(window_s=60)
+
+    assert f.filter(make_record('Connection check to %s failed: %s', 'a', 'timed out'))
+    assert not f.filter(make_record('Connection check to %s failed: %s', 'a', 'timed out'))
+    # Changing details do not make it a different message
+    assert not f.filter(make_record('Connection check to %s failed: %s', 'b', 'unreachable'))
+    assert f.filter(make_record('Connection is down, next restore attempt in %.0f seconds', 30.0))
+    assert not f.filter(make_record('Connection is down, next restore attempt in %.0f seconds', 29.5))
+
+    now += 61
+    record = make_record('Connection check to %s failed: %s', 'a', 'timed out')
+    assert f.filter(record)
+    assert record.getMessage() == 'Connection check to a failed: timed out (repeated 2 more times in the last 61s)'
+
+
+def test_rate_limit_key_separates_subjects(monkeypatch):
+    monkeypatch.setattr('time.monotonic', lambda: 1000.0)
+    f = RateLimitFilter(window_s=60)
+
+    assert f.filter(make_record('Unit %s missed heartbeats', 'a', rate_limit_key='a'))
+    assert f.filter(make_record('Unit %s missed heartbeats', 'b', rate_limit_key='b'))
+    assert not f.filter(make_record('Unit %s missed heartbeats', 'a', rate_limit_key='a'))
+
+def test_lower_levels_are_not_limited():
+    f = RateLimitFilter(window_s=60)
+    assert all(f.filter(make_record('hello', level=logging.INFO)) for _ in range(3))
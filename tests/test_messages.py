@@ -2,7 +2,10 @@ import pytest
 from pydantic_core import ValidationError
 
 from msu_manager.hcu.messages import (HeartbeatCommand, LogCommand,
-                                             ResumeCommand, ShutdownCommand,
+                                             MessageDecoder, ResumeCommand,
+                                             ShutdownCommand,
+                                             exceeds_batch_size,
+                                             validate_json_batch,
                                              validate_json_message,
                                              validate_python_message)
 
@@ -54,4 +57,55 @@ def test_json_parsing():
     }
     ''')
     assert isinstance(m, ShutdownCommand)
-    assert m.command == 'SHUTDOWN'
\ No newline at end of file
+    assert m.command == 'SHUTDOWN'
+
+def test_decoder_accepts_raw_bytes_with_whitespace():
+    m = MessageDecoder().decode(b'  {"command": "HEARTBEAT", "version": "0.0.3"}\n')
+    assert isinstance(m, HeartbeatCommand)
+    assert m.version == '0.0.3'
+
+def test_decoder_caches_repeated_payloads():
+    decoder = MessageDecoder(cache_size=2)
+    first = decoder.decode(b'{"command": "RESUME"}')
+    assert decoder.decode(b'{"command": "RESUME"}') is first
+
+    # Evicts the least recently used entry
+    decoder.decode(b'{"command": "SHUTDOWN"}')
+    decoder.decode(b'{"command": "HEARTBEAT"}')
+    assert decoder.decode(b'{"command": "RESUME"}') is not first
+
+def test_decoder_rejects_invalid_json():
+    with pytest.raises(ValidationError):
+        MessageDecoder().decode(b'{"command": ')
+
+def test_batch_parsing():
+    messages = validate_json_batch(b'[{"command": "SHUTDOWN"}, {"command": "LOG", "key": "temp", "value": 41.5}]')
+    assert [type(m) for m in messages] == [ShutdownCommand, LogCommand]
+
+    messages = validate_json_batch(b'{"command": "RESUME"}\n\n{"command": "HEARTBEAT", "version": "1.0"}\n', ndjson=True)
+    assert [type(m) for m in messages] == [ResumeCommand, HeartbeatCommand]
+
+def test_batch_parsing_reports_invalid_items():
+    messages = validate_json_batch(b'[{"command": "RESUME"}, {"command": "REBOOT"}, {"command": "SHUTDOWN"}]')
+    assert isinstance(messages[0], ResumeCommand)
+    assert isinstance(messages[1], ValidationError)
+    assert isinstance(messages[2], ShutdownCommand)
+
+    # Items are told apart by line, even if a line holds more than one message
+    messages = validate_json_batch(b'{"command": "RESUME"}\n{"command": "LOG", \n{"command": "RESUME"}, {"command": "RESUME"}', ndjson=True)
+    assert [type(m) for m in messages] == [ResumeCommand, ValidationError, ValidationError]
+
+def test_batch_parsing_rejects_non_arrays():
+    with pytest.raises(ValidationError):
+        validate_json_batch(b'{"command": "RESUME"}')
+    with pytest.raises(ValidationError):
+        validate_json_batch(b'[{"command": "RESUME"}')
+
+def test_batch_size_without_validation():
+    log = b'{"command": "LOG", "key": "a,b", "value": 1}'
+    assert not exceeds_batch_size(b'[' + b','.join([log] * 3) + b']', 3)
+    assert exceeds_batch_size(b'[' + b','.join([log] * 4) + b']', 3)
+    assert not exceeds_batch_size(b'\n\n'.join([log] * 3) + b'\n', 3, ndjson=True)
+    assert exceeds_batch_size(b'\r\n'.join([log] * 4), 3, ndjson=True)
+    # Left to validate_json_batch to reject
+    assert not exceeds_batch_size(b'{"a": 1, "b": 2, "c": 3, "d": 4}', 3)
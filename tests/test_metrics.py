@@ -0,0 +1,48 @@
+from msu_manager.metrics import Registry
+
+
+def test_counter_and_gauge_rendering():
+    registry = Registry()
+    counter = registry.counter('test_total', 'A counter', ['kind'])
+    gauge = registry.gauge('test_gauge', 'A gauge')
+    counter.labels('a').inc()
+    counter.labels('a').inc(2)
+    counter.labels('b').inc()
+    gauge.set(0.5)
+
+    assert registry.render().splitlines() == [
+        '# HELP test_total A counter',
+        '# TYPE test_total counter',
+        'test_total{kind="a"} 3',
+        'test_total{kind="b"} 1',
+        '# HELP test_gauge A gauge',
+        '# TYPE test_gauge gauge',
+        'test_gauge 0.5',
+    ]
+
+def test_histogram_buckets_are_cumulative():
+    registry = Registry()
+    histogram = registry.histogram('test_seconds', 'A histogram', buckets=(0.1, 1))
+    for value in (0.05, 0.1, 0.5, 5):
+        histogram.observe(value)
+
+    assert registry.render().splitlines()[2:] == [
+        'test_seconds_bucket{le="0.1"} 2',
+        'test_seconds_bucket{le="1"} 3',
+        'test_seconds_bucket{le="+Inf"} 4',
+        'test_seconds_sum 5.65',
+        'test_seconds_count 4',
+    ]
+
+def test_labelled_histogram_children_share_buckets():
+    registry = Registry()
+    histogram = registry.histogram('test_seconds', 'A histogram', ['target'], buckets=(1,))
+    histogram.labels('x').observe(2)
+    assert 'test_seconds_bucket{target="x",le="+Inf"} 1' in registry.render()
+
+
+def test_label_values_are_escaped():
+    registry = Registry()
+    gauge = registry.gauge('test_gauge', 'A gauge', ['sensor'])
+    gauge.labels('ina219/"in0"\\\n').set(1)
+    assert registry.render().splitlines()[-1] == r'test_gauge{sensor="ina219/\"in0\"\\\n"} 1'
@@ -0,0 +1,78 @@
+import asyncio
+import threading
+import time
+
+import pytest
+
+from msu_manager.profiling import LoopMonitor, StackSampler, format_collapsed
+
+
+def block_loop(duration_s):
+    time.sleep(duration_s)
+
+
+def busy_work(duration_s):
+    deadline = time.monotonic() + duration_s
+    while time.monotonic() < deadline:
+        sum(range(100))
+
+
+@pytest.mark.asyncio
+async def test_stall_records_blocking_handle():
+    monitor = LoopMonitor(interval_s=0.02, slow_callback_s=0.05)
+    task = asyncio.create_task(monitor.run())
+    await asyncio.sleep(0.05)
+    assert not monitor.stalls
+
+    asyncio.get_running_loop().call_soon(block_loop, 0.3)
+    await asyncio.sleep(0.1)
+    task.cancel()
+    with pytest.raises(asyncio.CancelledError):
+        await task
+
+    assert len(monitor.stalls) == 1
+    stall = monitor.stalls[0]
+    assert 'block_loop' in stall.handle
+    assert 'block_loop' in stall.stack[-1]
+    # Completed by the first lag sample after the stall
+    assert 0.2 < stall.duration_s < 0.4
+
+
+@pytest.mark.asyncio
+async def test_stall_names_blocking_task():
+    monitor = LoopMonitor(interval_s=0.02, slow_callback_s=0.05)
+    task = asyncio.create_task(monitor.run())
+
+    async def blocking_coroutine():
+        block_loop(0.2)
+    await asyncio.create_task(blocking_coroutine(), name='blocker')
+    await asyncio.sleep(0.05)
+    task.cancel()
+    with pytest.raises(asyncio.CancelledError):
+        await task
+
+    assert monitor.stalls[0].task.startswith('blocker')
+
+
+@pytest.mark.asyncio
+async def test_sampler_collapses_loop_stacks():
+    sampler = StackSampler()
+    profile = asyncio.create_task(asyncio.to_thread(sampler.sample, 0.2, 0.002))
+    await asyncio.sleep(0.01)
+    busy_work(0.15)
+
+    with pytest.raises(RuntimeError):
+        sampler.sample(0.01)
+    stacks = await profile
+    assert sum(count for stack, count in stacks.items() if stack.endswith('test_profiling.py:busy_work')) > 10
+
+    line = format_collapsed(stacks).splitlines()[0]
+    stack, count = line.rsplit(' ', 1)
+    assert stack.split(';')[0] and int(count) == stacks.most_common(1)[0][1]
+
+
+def test_sampler_stops_when_thread_is_gone():
+    thread = threading.Thread(target=lambda: None)
+    thread.start()
+    thread.join()
+    assert StackSampler(thread.ident).sample(1) == {}
@@ -0,0 +1,166 @@
+import asyncio
+import os
+import threading
+
+import pytest
+
+from msu_manager.telemetry import SegmentStore
+
+
+def segment_files(directory, prefix):
+    return sorted(n for n in os.listdir(directory) if n.startswith(prefix) and n.endswith('.seg'))
+
+
+@pytest.mark.asyncio
+async def test_append_and_range_query(tmp_path):
+    store = SegmentStore(str(tmp_path))
+    for i in range(10):
+        store.append('temperature', 20 + i, ts=1000 + i)
+        store.append('power', i, ts=1000 + i)
+
+    # Unflushed records are visible too
+    snapshot = await store.snapshot('temperature', 1002, 1005)
+    assert snapshot.aggregate().avg == [22, 23, 24, 25]
+
+    store.flush()
+    snapshot = await store.snapshot('temperature', 1002, 1005)
+    assert snapshot.aggregate().t == [1002, 1003, 1004, 1005]
+    assert await store.snapshot('unknown') is None
+    store.close()
+
+
+@pytest.mark.asyncio
+async def test_restart_resumes_active_segment(tmp_path):
+    store = SegmentStore(str(tmp_path))
+    for i in range(5):
+        store.append('temperature', i, ts=1000 + i)
+    store.flush()
+    # Simulate a crash: no close()
+
+    store = SegmentStore(str(tmp_path))
+    store.append('temperature', 5, ts=1005)
+    store.flush()
+    snapshot = await store.snapshot('temperature')
+    assert snapshot.aggregate().avg == [0, 1, 2, 3, 4, 5]
+    assert len(segment_files(tmp_path, 'raw-')) == 1
+    store.close()
+
+
+@pytest.mark.asyncio
+async def test_torn_record_is_discarded(tmp_path):
+    store = SegmentStore(str(tmp_path))
+    for i in range(3):
+        store.append('temperature', i, ts=1000 + i)
+    store.close()
+
+    # Corrupt the value of the last record, leaving its timestamp intact
+    path = tmp_path / segment_files(tmp_path, 'raw-')[0]
+    with open(path, 'r+b') as f:
+        f.seek(32 + 2 * 16 + 8)
+        f.write(b'\xff\xff')
+
+    store = SegmentStore(str(tmp_path))
+    snapshot = await store.snapshot('temperature')
+    assert snapshot.aggregate().avg == [0, 1]
+    store.close()
+
+
+@pytest.mark.asyncio
+async def test_roll_and_compaction(tmp_path):
+    # 1 KiB segments hold 62 records each
+    store = SegmentStore(str(tmp_path), segment_size_kb=1, compact_after_s=100, compact_step_s=60)
+    for i in range(200):
+        store.append('power', i, ts=i)
+    store.flush()
+    assert len(segment_files(tmp_path, 'raw-')) == 4
+
+    await store.maintain(now=1000)
+    assert len(segment_files(tmp_path, 'raw-')) == 1
+    assert len(segment_files(tmp_path, 'compacted-')) == 3
+
+    series = (await store.snapshot('power')).aggregate(step_s=60)
+    assert series.t == [0, 60, 120, 180]
+    assert series.count == [60, 60, 60, 20]
+    assert series.min == [0, 60, 120, 180]
+    assert series.max == [59, 119, 179, 199]
+
+    # Compacted segments are found again after a restart
+    store.close()
+    store = SegmentStore(str(tmp_path), segment_size_kb=1)
+    series = (await store.snapshot('power')).aggregate(step_s=60)
+    assert sum(series.count) == 200
+    store.close()
+
+
+@pytest.mark.asyncio
+async def test_retention_removes_oldest_segments(tmp_path):
+    store = SegmentStore(str(tmp_path), segment_size_kb=1, max_disk_mb=0)
+    for i in range(200):
+        store.append('power', i, ts=i)
+    store.flush()
+    await store.maintain(now=0)
+    assert segment_files(tmp_path, 'raw-') == segment_files(tmp_path, 'raw-')[-1:]
+    store.close()
+
+
+@pytest.mark.asyncio
+async def test_append_does_not_wait_for_the_disk(tmp_path, monkeypatch):
+    store = SegmentStore(str(tmp_path), segment_size_kb=1, flush_interval_s=0.01, flush_max_records=10)
+    store.append('power', 0, ts=0)
+    store.flush()
+    task = asyncio.create_task(store.run())
+    while store._spare is None:
+        await asyncio.sleep(0.01)
+
+    loop_thread = threading.get_ident()
+    blocking = []
+    for name in ('fsync', 'fdatasync', 'ftruncate', 'posix_fallocate'):
+        def wrapper(*args, _original=getattr(os, name), _name=name):
+            if threading.get_ident() == loop_thread:
+                blocking.append(_name)
+            return _original(*args)
+        monkeypatch.setattr(os, name, wrapper)
+
+    # Rolls over into the segment created ahead of time, and adds a key
+    for i in range(1, 100):
+        store.append('power' if i < 90 else 'voltage', i, ts=i)
+    assert blocking == []
+    assert len(segment_files(tmp_path, 'raw-')) == 2
+
+    # The full segment is trimmed in the background
+    first = tmp_path / segment_files(tmp_path, 'raw-')[0]
+    while os.path.getsize(first) != 32 + 62 * 16:
+        await asyncio.sleep(0.01)
+    task.cancel()
+    with pytest.raises(asyncio.CancelledError):
+        await task
+
+    store = SegmentStore(str(tmp_path))
+    assert sum((await store.snapshot('power')).aggregate().count) == 90
+    assert sum((await store.snapshot('voltage')).aggregate().count) == 10
+    store.close()
+
+
+@pytest.mark.asyncio
+async def test_restart_after_crash_with_spare_and_untrimmed_segments(tmp_path):
+    store = SegmentStore(str(tmp_path), segment_size_kb=1)
+    store.append('power', 0, ts=0)
+    store.flush()
+    await store._prepare_segments()
+    # Fills the first segment, rolls over into the spare and creates the next spare
+    for i in range(1, 80):
+        store.append('power', i, ts=i)
+    store.flush()
+    await store._prepare_segments()
+    full, active, spare = segment_files(tmp_path, 'raw-')
+    # Simulate a crash before the full segment was trimmed: no close()
+    os.truncate(tmp_path / full, 1024)
+
+    store = SegmentStore(str(tmp_path), segment_size_kb=1)
+    assert segment_files(tmp_path, 'raw-') == [full, active]
+    assert store._active.path == str(tmp_path / active)
+    assert os.path.getsize(tmp_path / full) == 32 + 62 * 16
+    store.append('power', 80, ts=80)
+    store.flush()
+    assert sum((await store.snapshot('power')).aggregate().count) == 81
+    store.close()
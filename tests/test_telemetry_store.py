@@ -0,0 +1,83 @@
+from msu_manager.telemetry import TelemetryStore
+from msu_manager.telemetry.store import REJECTED_SAMPLES
+
+
+def test_raw_query():
+    store = TelemetryStore()
+    for i in range(5):
+        assert store.add('temperature', str(20 + i), ts=100 + i)
+
+    series = store.snapshot('temperature').aggregate()
+    assert series.t == [100, 101, 102, 103, 104]
+    assert series.avg == [20, 21, 22, 23, 24]
+    assert series.count == [1] * 5
+
+    series = store.snapshot('temperature').aggregate(start=101, end=103)
+    assert series.t == [101, 102, 103]
+
+def test_step_aggregation():
+    store = TelemetryStore()
+    for i in range(20):
+        store.add('power', i, ts=i)
+
+    series = store.snapshot('power').aggregate(step_s=10)
+    assert series.t == [0, 10]
+    assert series.min == [0, 10]
+    assert series.max == [9, 19]
+    assert series.avg == [4.5, 14.5]
+    assert series.count == [10, 10]
+
+def test_evicted_samples_are_downsampled():
+    # 1 KiB for a single key: 32 raw samples, 12 buckets
+    store = TelemetryStore(memory_budget_kb=1, max_keys=1, bucket_s=10)
+    for i in range(100):
+        store.add('power', i, ts=i)
+
+    series = store.snapshot('power').aggregate()
+    # Oldest data survives at bucket resolution
+    assert series.t[0] == 0
+    assert series.count[0] == 10
+    assert series.min[0] == 0
+    assert series.max[0] == 9
+    # Newest data at full resolution
+    assert series.t[-1] == 99
+    assert series.count[-1] == 1
+    assert sum(series.count) == 100
+
+    # Memory stays fixed no matter how much is added
+    for i in range(100, 10000):
+        store.add('power', i, ts=i)
+    series = store.snapshot('power').aggregate()
+    assert len(series.t) <= 32 + 12
+    assert series.t[-1] == 9999
+
+def test_rejects_non_numeric_and_excess_keys():
+    store = TelemetryStore(max_keys=1)
+    assert not store.add('state', 'on')
+    assert store.add('a', '1')
+    assert not store.add('b', '1')
+    assert store.keys() == ['a']
+    assert store.snapshot('b') is None
+    # Rejected keys are counted, not remembered
+    rejected = REJECTED_SAMPLES.value
+    assert not any(store.add(f'c{i}', i) for i in range(1000))
+    assert REJECTED_SAMPLES.value == rejected + 1000
+
+
+def test_partitions_have_their_own_key_budget():
+    store = TelemetryStore(max_keys=1, partitions={'thermal': 2}, max_partitions=2, max_keys_per_partition=1)
+    assert store.add('a', 1)
+    assert not store.add('b', 1)
+    assert store.add('thermal/cpu', 1, partition='thermal')
+    assert store.add('thermal/gpu', 1, partition='thermal')
+    assert not store.add('thermal/board', 1, partition='thermal')
+    assert store.add('u1/a', 1, partition='u1')
+    assert not store.add('u1/b', 1, partition='u1')
+    assert store.add('u2/a', 1, partition='u2')
+    # No room for a third unit until one is dropped
+    assert not store.add('u3/a', 1, partition='u3')
+    store.drop_partition('u1')
+    assert store.snapshot('u1/a') is None
+    assert store.add('u3/a', 1, partition='u3')
+    assert store.keys() == ['a', 'thermal/cpu', 'thermal/gpu', 'u2/a', 'u3/a']
+
@@ -0,0 +1,159 @@
+import asyncio
+import gzip
+import json
+import os
+
+import pytest
+import pytest_asyncio
+
+from msu_manager.telemetry import TelemetryStore, TelemetryUploader
+from msu_manager.telemetry.upload import HttpConnection, SpoolQueue
+
+
+class IngestServer:
+    """Local stand-in for the upload endpoint. Answers with `statuses` in turn, then 204."""
+
+    def __init__(self):
+        self.requests = []
+        self.connections = 0
+        self.statuses = []
+        self.close_after_response = False
+        # Number of upcoming requests answered with only the start of a response before closing
+        self.partial_responses = 0
+
+    async def handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        self.connections += 1
+        try:
+            while True:
+                head = await reader.readuntil(b'\r\n\r\n')
+                headers = dict(line.split(': ', 1) for line in head.decode().split('\r\n')[1:] if line)
+                body = await reader.readexactly(int(headers['Content-Length']))
+                self.requests.append((headers, body))
+                if self.partial_responses:
+                    self.partial_responses -= 1
+                    writer.write(b'HTTP/1.1 2')
+                    await writer.drain()
+                    break
+                status = self.statuses.pop(0) if self.statuses else 204
+                writer.write(f'HTTP/1.1 {status} Status\r\nContent-Length: 2\r\n\r\nok'.encode())
+                await writer.drain()
+                if self.close_after_response:
+                    break
+        except asyncio.IncompleteReadError:
+            pass
+        finally:
+            writer.close()
+
+    def records(self):
+        return [json.loads(line) for _, body in self.requests for line in gzip.decompress(body).splitlines()]
+
+
+@pytest_asyncio.fixture
+async def ingest_server():
+    ingest = IngestServer()
+    server = await asyncio.start_server(ingest.handle, '127.0.0.1', 0)
+    ingest.url = f'http://127.0.0.1:{server.sockets[0].getsockname()[1]}/ingest'
+    yield ingest
+    server.close()
+
+
+async def wait_until(condition, timeout_s=5):
+    async with asyncio.timeout(timeout_s):
+        while not condition():
+            await asyncio.sleep(0.01)
+
+
+@pytest.mark.asyncio
+async def test_batches_share_one_connection(ingest_server, tmp_path):
+    uploader = TelemetryUploader(ingest_server.url, str(tmp_path), batch_max_records=10, headers={'Authorization': 'Bearer x'})
+    store = TelemetryStore(uploader=uploader)
+    task = asyncio.create_task(uploader.run())
+    for i in range(30):
+        store.add('temp', i, ts=1000 + i)
+    store.add('state', 'idle', ts=2000)
+    await wait_until(lambda: len(ingest_server.requests) == 3)
+
+    assert ingest_server.connections == 1
+    headers = ingest_server.requests[0][0]
+    assert headers['Content-Encoding'] == 'gzip'
+    assert headers['Authorization'] == 'Bearer x'
+    assert [r['value'] for r in ingest_server.records()] == list(range(30))
+
+    # The last record is only sealed by age or on shutdown, and kept on disk
+    task.cancel()
+    with pytest.raises(asyncio.CancelledError):
+        await task
+    spool = SpoolQueue(str(tmp_path))
+    assert len(spool) == 1
+    with open(spool.peek(), 'rb') as f:
+        assert json.loads(gzip.decompress(f.read())) == {'ts': 2000, 'key': 'state', 'value': 'idle'}
+
+
+@pytest.mark.asyncio
+async def test_spools_while_uplink_down(ingest_server, tmp_path):
+    link_up = asyncio.Event()
+    uploader = TelemetryUploader(ingest_server.url, str(tmp_path), batch_max_records=5, link_up=link_up)
+    task = asyncio.create_task(uploader.run())
+    for i in range(20):
+        uploader.add('temp', i, ts=i)
+    await wait_until(lambda: len(os.listdir(tmp_path)) == 4)
+    await asyncio.sleep(0.05)
+    assert ingest_server.requests == []
+
+    link_up.set()
+    await wait_until(lambda: len(ingest_server.requests) == 4)
+    assert [r['value'] for r in ingest_server.records()] == list(range(20))
+    assert os.listdir(tmp_path) == []
+    task.cancel()
+    with pytest.raises(asyncio.CancelledError):
+        await task
+
+
+@pytest.mark.asyncio
+async def test_failed_and_rejected_batches(ingest_server, tmp_path):
+    uploader = TelemetryUploader(ingest_server.url, str(tmp_path), batch_max_records=1)
+    for i in range(3):
+        uploader.add('temp', i, ts=i)
+        await uploader.seal()
+
+    ingest_server.statuses = [503]
+    assert not await uploader.drain()
+    ingest_server.statuses = [400]
+    assert await uploader.drain()
+    # The first batch was retried, the second one dropped after the 400
+    assert [r['value'] for r in ingest_server.records()] == [0, 0, 1, 2]
+
+
+@pytest.mark.asyncio
+async def test_reconnects_after_server_closed_connection(ingest_server):
+    ingest_server.close_after_response = True
+    connection = HttpConnection(ingest_server.url)
+    assert await connection.post(b'a', {}) == 204
+    assert await connection.post(b'b', {}) == 204
+    assert connection.connects == 2
+    connection.close()
+
+    with pytest.raises(OSError):
+        await HttpConnection('http://127.0.0.1:1/').post(b'a', {})
+
+
+@pytest.mark.asyncio
+async def test_no_retry_after_partial_response(ingest_server):
+    connection = HttpConnection(ingest_server.url)
+    assert await connection.post(b'a', {}) == 204
+    ingest_server.partial_responses = 1
+    with pytest.raises(OSError):
+        await connection.post(b'b', {})
+    # The server got the request, sending it again could store it twice
+    assert [body for _, body in ingest_server.requests] == [b'a', b'b']
+    assert connection.connects == 1
+    connection.close()
+
+
+def test_spool_disk_budget(tmp_path):
+    spool = SpoolQueue(str(tmp_path), max_disk_mb=2.5 / 1024)
+    for i in range(5):
+        spool.put(bytes([i]) * 1024)
+    assert len(spool) == 2
+    with open(spool.peek(), 'rb') as f:
+        assert f.read(1) == b'\x03'
@@ -0,0 +1,146 @@
+import asyncio
+import os
+import threading
+from unittest.mock import AsyncMock, Mock
+
+import pytest
+
+from msu_manager.config import SensorConfig, ThermalMonitorConfig, ThermalRuleConfig
+from msu_manager.events import EventBus, EventType
+from msu_manager.telemetry import TelemetryStore
+from msu_manager.thermal.monitor import ThermalMonitor, discover_sensors
+
+
+def write(path, content):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    # Rewrite in place (like a sysfs attribute), so open descriptors stay valid
+    with open(path, 'r+' if os.path.exists(path) else 'w') as f:
+        f.write(f'{content}\n')
+        f.truncate()
+
+
+@pytest.fixture
+def sysfs(tmp_path):
+    write(tmp_path / 'class/thermal/thermal_zone0/type', 'cpu-thermal')
+    write(tmp_path / 'class/thermal/thermal_zone0/temp', 45000)
+    write(tmp_path / 'class/hwmon/hwmon0/name', 'ina219')
+    write(tmp_path / 'class/hwmon/hwmon0/in0_input', 12050)
+    write(tmp_path / 'class/hwmon/hwmon0/power1_input', 6500000)
+    write(tmp_path / 'class/hwmon/hwmon0/update_interval', 1000)
+    write(tmp_path / 'class/hwmon/hwmon1/name', 'ina219')
+    write(tmp_path / 'class/hwmon/hwmon1/temp1_input', 38500)
+    write(tmp_path / 'class/hwmon/hwmon1/temp1_label', 'board')
+    return tmp_path
+
+
+def test_discover_sensors(sysfs):
+    sensors = {sensor.name: sensor for sensor in discover_sensors(str(sysfs))}
+    assert list(sensors) == ['cpu-thermal', 'ina219/in0', 'ina219/power1', 'ina219/board']
+    assert sensors['ina219/power1'].scale == 1e-6
+    assert sensors['cpu-thermal'].path == str(sysfs / 'class/thermal/thermal_zone0/temp')
+
+
+@pytest.mark.asyncio
+async def test_sample_keeps_files_open(sysfs):
+    telemetry = TelemetryStore(max_keys=0, partitions={'thermal': 4})
+    monitor = ThermalMonitor(ThermalMonitorConfig(enabled=True, sysfs_root=str(sysfs)), telemetry=telemetry)
+
+    await monitor.sample()
+    values = {r.name: r.value for r in monitor.readings()}
+    assert values == {'cpu-thermal': 45.0, 'ina219/in0': 12.05, 'ina219/power1': 6.5, 'ina219/board': 38.5}
+    fds = [sensor.fd for sensor in monitor._sensors]
+
+    write(sysfs / 'class/thermal/thermal_zone0/temp', 51250)
+    await monitor.sample()
+    assert monitor.readings()[0].value == 51.25
+    assert [sensor.fd for sensor in monitor._sensors] == fds
+    assert telemetry.snapshot('thermal/cpu-thermal').aggregate().avg == [45.0, 51.25]
+
+
+@pytest.mark.asyncio
+async def test_sensor_recovers_after_read_error(sysfs):
+    path = sysfs / 'extra/temp'
+    write(path, 'garbage')
+    monitor = ThermalMonitor(ThermalMonitorConfig(enabled=True, discover=False, sensors=[SensorConfig(name='extra', path=str(path))]))
+
+    await monitor.sample()
+    assert monitor.readings()[0].value is None
+    assert monitor._sensors[0].fd is None
+
+    os.remove(path)
+    await monitor.sample()
+    assert monitor.readings()[0].value is None
+
+    write(path, 30000)
+    await monitor.sample()
+    assert monitor.readings()[0].value == 30.0
+
+
+@pytest.mark.asyncio
+async def test_rule_triggers_shutdown_once(sysfs, monkeypatch):
+    controller = Mock(handle_shutdown=AsyncMock())
+    bus = EventBus()
+    alerts = bus.subscribe([EventType.THERMAL_ALERT])
+    monitor = ThermalMonitor(ThermalMonitorConfig(
+        enabled=True,
+        sysfs_root=str(sysfs),
+        rules=[ThermalRuleConfig(sensor='cpu-*', above=80, for_s=30), ThermalRuleConfig(sensor='ina219/in0', below=11, action='log')],
+    ), controller=controller, events=bus)
+    now = [1000.0]
+    monkeypatch.setattr('msu_manager.thermal.monitor.time.monotonic', lambda: now[0])
+
+    write(sysfs / 'class/thermal/thermal_zone0/temp', 85000)
+    for _ in range(3):
+        await monitor.sample()
+        now[0] += 20
+    controller.handle_shutdown.assert_awaited_once()
+    event = await alerts.get()
+    assert event.data == {'sensor': 'cpu-thermal', 'value': 85.0, 'above': 80, 'below': None, 'action': 'shutdown'}
+
+    # A log rule does not shut down; the shutdown rule re-arms once the temperature is back in range
+    write(sysfs / 'class/thermal/thermal_zone0/temp', 60000)
+    write(sysfs / 'class/hwmon/hwmon0/in0_input', 10500)
+    await monitor.sample()
+    assert (await alerts.get()).data['sensor'] == 'ina219/in0'
+    write(sysfs / 'class/thermal/thermal_zone0/temp', 85000)
+    await monitor.sample()
+    now[0] += 30
+    await monitor.sample()
+    assert controller.handle_shutdown.await_count == 2
+
+
+@pytest.mark.asyncio
+async def test_run_closes_files(sysfs):
+    monitor = ThermalMonitor(ThermalMonitorConfig(enabled=True, sysfs_root=str(sysfs), sample_interval_s=0.01))
+    task = asyncio.create_task(monitor.run())
+    await asyncio.sleep(0.05)
+    assert all(sensor.fd is not None for sensor in monitor._sensors)
+    task.cancel()
+    with pytest.raises(asyncio.CancelledError):
+        await task
+    assert all(sensor.fd is None for sensor in monitor._sensors)
+
+
+@pytest.mark.asyncio
+async def test_run_waits_for_read_before_closing_files(sysfs, monkeypatch):
+    started, release = threading.Event(), threading.Event()
+    fds = []
+    def slow_read_all(sensors):
+        started.set()
+        release.wait(5)
+        fds.extend(sensor.fd for sensor in sensors)
+    monitor = ThermalMonitor(ThermalMonitorConfig(enabled=True, sysfs_root=str(sysfs)))
+    await monitor.sample()
+    monkeypatch.setattr('msu_manager.thermal.monitor._read_all', slow_read_all)
+
+    task = asyncio.create_task(monitor.run())
+    await asyncio.to_thread(started.wait, 5)
+    task.cancel()
+    await asyncio.sleep(0.05)
+    # Still reading, so the files stay open
+    assert not task.done()
+    release.set()
+    with pytest.raises(asyncio.CancelledError):
+        await task
+    assert None not in fds
+    assert all(sensor.fd is None for sensor in monitor._sensors)
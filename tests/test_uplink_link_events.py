@@ -0,0 +1,73 @@
+import asyncio
+import struct
+
+import pytest
+
+from msu_manager.config import UplinkMonitorConfig
+from msu_manager.uplink.link_events import (IFF_LOWER_UP, IFF_UP, IFLA_IFNAME,
+                                            RTM_DELADDR, RTM_NEWLINK,
+                                            FakeLinkEventSource,
+                                            NetlinkEventSource, parse_messages)
+from msu_manager.uplink.monitor import UplinkMonitor
+
+
+def _message(msg_type: int, body: bytes) -> bytes:
+    return struct.pack('=IHHII', 16 + len(body), msg_type, 0, 0, 0) + body
+
+
+def test_parse_link_and_address_messages():
+    name = b'wwan0\0'
+    attr = struct.pack('=HH', 4 + len(name), IFLA_IFNAME) + name + b'\0\0'
+    link_up = _message(RTM_NEWLINK, struct.pack('=BxHiII', 0, 0, 7, IFF_UP | IFF_LOWER_UP, 0) + attr)
+    link_no_carrier = _message(RTM_NEWLINK, struct.pack('=BxHiII', 0, 0, 7, IFF_UP, 0))
+    address_removed = _message(RTM_DELADDR, struct.pack('=BBBBi', 2, 24, 0, 0, 7))
+
+    assert list(parse_messages(link_up + link_no_carrier + address_removed)) == [
+        ('link', 7, 'wwan0', True),
+        ('link', 7, None, False),
+        ('address', 7, None, False),
+    ]
+
+
+@pytest.mark.asyncio
+async def test_netlink_source_subscribes():
+    source = NetlinkEventSource('lo')
+    try:
+        await source.start(lambda event: None)
+    except OSError as e:
+        pytest.skip(f'netlink not available: {e}')
+    source.close()
+
+
+@pytest.mark.asyncio
+async def test_link_event_triggers_immediate_check():
+    source = FakeLinkEventSource('wwan0')
+    monitor = UplinkMonitor(UplinkMonitorConfig(
+        enabled=True,
+        restore_connection_cmd=['./restore'],
+        wwan_device='wwan0',
+        wwan_usb_id='1234:5678',
+        wwan_apn='test_apn',
+        check_connection_target='8.8.8.8',
+        check_interval_s=3600,
+        stable_check_interval_s=3600,
+    ), link_events=source)
+
+    checks = []
+    async def check_connection():
+        checks.append(asyncio.get_running_loop().time())
+        return True
+    monitor.check_connection = check_connection
+
+    task = asyncio.create_task(monitor.run())
+    await asyncio.sleep(0.05)
+    assert len(checks) == 1
+
+    source.emit('link', up=False)
+    await asyncio.sleep(0.05)
+    assert len(checks) == 2
+
+    task.cancel()
+    with pytest.raises(asyncio.CancelledError):
+        await task
+    assert source._callback is None
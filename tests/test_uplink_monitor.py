@@ -4,6 +4,7 @@ import asyncio
 from unittest.mock import AsyncMock
 from msu_manager.config import UplinkMonitorConfig
 from msu_manager.uplink.monitor import UplinkMonitor
+from msu_manager.uplink.probe import Probe, ProbeResult
 
 @pytest.fixture
 def uplink_monitor():
@@ -16,15 +17,25 @@ def uplink_monitor():
             wwan_usb_id='1234:5678',
             wwan_apn='test_apn',
             check_connection_target='8.8.8.8',
+            check_connection_method='ping',
             check_interval_s=5
         )
     )
 
+def create_stream(data):
+    stream = asyncio.StreamReader()
+    stream.feed_data(data)
+    stream.feed_eof()
+    return stream
+
+
 def create_mock_process(returncode, stdout=b'', stderr=b''):
     """Helper function to create a mock subprocess."""
     mock_process = AsyncMock()
     mock_process.returncode = returncode
-    mock_process.communicate = AsyncMock(return_value=(stdout, stderr))
+    mock_process.stdout = create_stream(stdout)
+    mock_process.stderr = create_stream(stderr)
+    mock_process.wait = AsyncMock(return_value=returncode)
     return mock_process
 
 
@@ -100,3 +111,61 @@ async def test_run_connection_down_restore_success(uplink_monitor, monkeypatch):
 
     # Verify that restore command was called with correct env (>= means "is superset of")
     assert mock_subprocess.mock_calls[1].kwargs['env'].items() >= {'WWAN_IFACE': 'test_wwan', 'DEVICE_ID': '1234:5678', 'APN': 'test_apn'}.items()
+
+
+@pytest.mark.asyncio
+async def test_run_connection_down_restore_backoff(uplink_monitor, monkeypatch):
+    """Test run() does not restore again on every failed check."""
+    mock_subprocess = create_mock_subprocess_sequence({
+        'ping': [1, 1, 1],
+        './restore': [1]
+    })
+    monkeypatch.setattr(asyncio, 'create_subprocess_exec', mock_subprocess)
+
+    monkeypatch.setattr(asyncio, 'sleep', create_mock_sleep(3))
+
+    with pytest.raises(asyncio.CancelledError):
+        await uplink_monitor.run()
+
+    assert [
+        'ping',
+        './restore',
+        'ping',
+        'ping'
+    ] == [call.args[0] for call in mock_subprocess.mock_calls]
+
+    status = uplink_monitor.status()
+    assert status.state == 'backoff'
+    assert status.restore_attempts == 1
+    assert status.next_restore_at > status.next_check_at
+
+
+@pytest.mark.asyncio
+async def test_stats_cover_targets_not_needed_for_the_verdict():
+    monitor = UplinkMonitor(UplinkMonitorConfig(
+        enabled=True,
+        restore_connection_cmd=['./restore'],
+        wwan_device='wwan0',
+        wwan_usb_id='1234:5678',
+        wwan_apn='test_apn',
+        check_connection_target=['1.1.1.1', '8.8.8.8', '9.9.9.9'],
+        check_connection_quorum='any',
+        link_events='none',
+    ))
+
+    class FakeProbe(Probe):
+        method = 'fake'
+        bytes_per_probe = 100
+        async def probe(self, target):
+            await asyncio.sleep({'1.1.1.1': 0, '8.8.8.8': 0.01, '9.9.9.9': 0.02}[target])
+            return ProbeResult(target=target, method=self.method, sent=3, received=3, rtts_ms=[10, 11, 12])
+    monitor._probe = FakeProbe()
+
+    for _ in range(20):
+        assert await monitor.check_connection()
+    await asyncio.gather(*monitor._background_probes)
+
+    stats = monitor.stats()
+    assert {target: s['1h'].probes_sent for target, s in stats.items()} == {'1.1.1.1': 60, '8.8.8.8': 60, '9.9.9.9': 60}
+    # So does the probe budget
+    assert monitor._scheduler.probe_bytes_total == 180 * 100
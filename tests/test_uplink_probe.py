@@ -0,0 +1,171 @@
+import asyncio
+
+import pytest
+import pytest_asyncio
+
+from msu_manager.uplink.probe import (AutoProbe, IcmpProbe, Probe,
+                                      ProbeResult, SubprocessPingProbe,
+                                      TcpConnectProbe, UdpEchoProbe,
+                                      probe_quorum)
+
+
+class EchoServerProtocol(asyncio.DatagramProtocol):
+    """Local stand-in for an RFC 862 echo service."""
+    def connection_made(self, transport):
+        self.transport = transport
+
+    def datagram_received(self, data, addr):
+        self.transport.sendto(data, addr)
+
+
+@pytest_asyncio.fixture
+async def udp_echo_port():
+    loop = asyncio.get_running_loop()
+    transport, _ = await loop.create_datagram_endpoint(EchoServerProtocol, local_addr=('127.0.0.1', 0))
+    yield transport.get_extra_info('sockname')[1]
+    transport.close()
+
+
+@pytest_asyncio.fixture
+async def tcp_port():
+    server = await asyncio.start_server(lambda r, w: w.close(), '127.0.0.1', 0)
+    yield server.sockets[0].getsockname()[1]
+    server.close()
+    await server.wait_closed()
+
+
+def test_probe_result_loss():
+    result = ProbeResult(target='t', method='icmp', sent=4, received=3, rtts_ms=[1, 2, 3])
+    assert result.loss == 0.25
+    assert result.is_up
+    assert not ProbeResult(target='t', method='icmp', sent=0, received=0).is_up
+
+
+@pytest.mark.asyncio
+async def test_udp_echo_probe(udp_echo_port):
+    probe = UdpEchoProbe(port=udp_echo_port, count=3, interval_s=0.01, timeout_s=1)
+    result = await probe.probe('127.0.0.1')
+    assert result.sent == 3
+    assert result.received == 3
+    assert result.loss == 0
+    assert len(result.rtts_ms) == 3
+
+
+@pytest.mark.asyncio
+async def test_udp_echo_probe_no_answer():
+    # Nothing listens on the discard port on loopback
+    probe = UdpEchoProbe(port=9, count=2, interval_s=0.01, timeout_s=0.1)
+    result = await probe.probe('127.0.0.1')
+    assert result.sent == 2
+    assert result.received == 0
+    assert result.loss == 1.0
+    assert not result.is_up
+
+
+@pytest.mark.asyncio
+async def test_tcp_connect_probe(tcp_port):
+    probe = TcpConnectProbe(port=tcp_port, count=2, interval_s=0.01, timeout_s=1)
+    result = await probe.probe('127.0.0.1')
+    assert result.received == 2
+    assert all(rtt >= 0 for rtt in result.rtts_ms)
+
+
+@pytest.mark.asyncio
+async def test_tcp_connect_probe_refused_counts_as_up(unused_tcp_port):
+    probe = TcpConnectProbe(port=unused_tcp_port, count=1, timeout_s=1)
+    result = await probe.probe('127.0.0.1')
+    assert result.is_up
+
+
+@pytest.mark.asyncio
+async def test_icmp_probe_loopback():
+    probe = IcmpProbe(count=2, interval_s=0.01, timeout_s=1)
+    try:
+        result = await probe.probe('127.0.0.1')
+    except PermissionError:
+        pytest.skip('ICMP ping sockets not permitted (net.ipv4.ping_group_range)')
+    assert result.received == 2
+
+
+@pytest.mark.asyncio
+async def test_auto_probe_falls_back_to_tcp(tcp_port, monkeypatch):
+    def deny(self):
+        raise PermissionError(13, 'Permission denied')
+    monkeypatch.setattr(IcmpProbe, '_open_socket', deny)
+
+    probe = AutoProbe(port=tcp_port, count=1, timeout_s=1)
+    result = await probe.probe('127.0.0.1')
+    assert result.method == 'tcp'
+    assert result.is_up
+
+
+def test_subprocess_ping_command():
+    probe = SubprocessPingProbe(None, device='wwan0')
+    assert probe.command('1.1.1.1') == ['ping', '-c', '3', '-w', '1', '-i', '0.2', '-I', 'wwan0', '1.1.1.1']
+
+
+class FakeProbe(Probe):
+    """Answers per target after a configured delay with a configured verdict."""
+    method = 'fake'
+
+    def __init__(self, outcomes):
+        super().__init__()
+        self.outcomes = outcomes
+        self.cancelled = []
+
+    async def probe(self, target):
+        delay, is_up = self.outcomes[target]
+        try:
+            await asyncio.sleep(delay)
+        except asyncio.CancelledError:
+            self.cancelled.append(target)
+            raise
+        if isinstance(is_up, Exception):
+            raise is_up
+        return ProbeResult(target=target, method=self.method, sent=1, received=1 if is_up else 0)
+
+
+@pytest.mark.asyncio
+async def test_quorum_any_exits_on_first_success():
+    probe = FakeProbe({'fast': (0, True), 'slow': (10, False)})
+    is_up, results = await asyncio.wait_for(probe_quorum(probe, ['fast', 'slow'], 'any'), 1)
+    assert is_up
+    assert [r.target for r in results] == ['fast']
+    assert probe.cancelled == ['slow']
+
+
+@pytest.mark.asyncio
+async def test_quorum_majority():
+    probe = FakeProbe({'a': (0, False), 'b': (0.01, True), 'c': (0.02, True)})
+    is_up, results = await probe_quorum(probe, ['a', 'b', 'c'], 'majority')
+    assert is_up
+    assert len(results) == 3
+
+    probe = FakeProbe({'a': (0, False), 'b': (0, False), 'c': (10, True)})
+    is_up, _ = await asyncio.wait_for(probe_quorum(probe, ['a', 'b', 'c'], 'majority'), 1)
+    assert not is_up
+    assert probe.cancelled == ['c']
+
+
+@pytest.mark.asyncio
+async def test_quorum_all_exits_on_first_failure():
+    probe = FakeProbe({'a': (0, OSError(19, 'No such device')), 'b': (10, True)})
+    is_up, results = await asyncio.wait_for(probe_quorum(probe, ['a', 'b'], 'all'), 1)
+    assert not is_up
+    assert results[0].loss == 1.0
+
+
+@pytest.mark.asyncio
+async def test_quorum_finishes_remaining_probes_in_background():
+    probe = FakeProbe({'fast': (0, True), 'slow': (0.05, False)})
+    background = set()
+    reported = []
+    is_up, results = await asyncio.wait_for(probe_quorum(probe, ['fast', 'slow'], 'any', on_result=reported.append, background=background), 1)
+    assert is_up
+    assert [r.target for r in results] == ['fast']
+    assert len(background) == 1
+
+    await asyncio.gather(*background)
+    assert probe.cancelled == []
+    assert [r.target for r in reported] == ['fast', 'slow']
+    assert not background
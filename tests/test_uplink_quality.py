@@ -0,0 +1,95 @@
+import random
+
+import pytest
+
+from msu_manager.uplink.probe import ProbeResult
+from msu_manager.uplink.quality import DDSketch, LinkQuality, SlidingWindow
+
+
+def exact_quantile(values, q):
+    values = sorted(values)
+    return values[int(q * (len(values) - 1))]
+
+
+@pytest.mark.parametrize('q', [0.0, 0.5, 0.95, 0.99, 1.0])
+def test_sketch_relative_accuracy(q):
+    rng = random.Random(1)
+    values = [rng.lognormvariate(4, 1) for _ in range(20000)]
+    sketch = DDSketch(relative_accuracy=0.01)
+    for value in values:
+        sketch.add(value)
+    assert sketch.quantile(q) == pytest.approx(exact_quantile(values, q), rel=0.0101)
+    assert sketch.count == len(values)
+    assert len(sketch.bins) < 600
+
+
+def test_sketch_merge_equals_combined():
+    rng = random.Random(2)
+    a, b, combined = DDSketch(), DDSketch(), DDSketch()
+    for i in range(5000):
+        value = rng.expovariate(0.01)
+        (a if i % 3 else b).add(value)
+        combined.add(value)
+    a.merge(b)
+    assert a.bins == combined.bins
+    assert a.count == combined.count
+    assert a.quantile(0.95) == combined.quantile(0.95)
+
+
+def test_sketch_zeros_and_empty():
+    sketch = DDSketch()
+    assert sketch.quantile(0.5) is None
+    for _ in range(90):
+        sketch.add(0.0)
+    for _ in range(10):
+        sketch.add(1.0)
+    assert sketch.quantile(0.5) == 0.0
+    assert sketch.quantile(0.99) == pytest.approx(1.0, rel=0.01)
+
+
+def test_sketch_bins_are_bounded():
+    sketch = DDSketch(relative_accuracy=0.01, max_bins=64)
+    for exponent in range(-300, 300):
+        sketch.add(1.1 ** exponent)
+    assert len(sketch.bins) == 64
+    # The high end stays accurate
+    assert sketch.quantile(1.0) == pytest.approx(1.1 ** 299, rel=0.01)
+
+    with pytest.raises(ValueError):
+        sketch.merge(DDSketch(relative_accuracy=0.02))
+
+
+def test_sliding_window_expires_slots():
+    window = SlidingWindow(window_s=60, slots=6)
+    window.add(ProbeResult(target='t', method='icmp', sent=3, received=3, rtts_ms=[10, 20, 30]), now=0)
+    window.add(ProbeResult(target='t', method='icmp', sent=3, received=0), now=35)
+
+    stats = window.summary(now=40)
+    assert stats.probes_sent == 6
+    assert stats.loss == pytest.approx(0.5)
+    assert stats.rtt_ms.count == 3
+    assert stats.rtt_ms.p50 == pytest.approx(20, rel=0.01)
+    assert stats.check_loss.max == 1.0
+
+    # The first slot [0, 10) falls out of the window at 60
+    stats = window.summary(now=60)
+    assert stats.probes_sent == 3
+    assert stats.rtt_ms.count == 0
+    assert stats.rtt_ms.p50 is None
+
+    assert window.summary(now=100).loss is None
+
+
+def test_link_quality_per_target_and_window():
+    quality = LinkQuality(['1.1.1.1', '8.8.8.8'])
+    for i in range(100):
+        quality.add(ProbeResult(target='1.1.1.1', method='icmp', sent=1, received=1, rtts_ms=[i + 1]), now=i * 60)
+    quality.add(ProbeResult(target='9.9.9.9', method='icmp', sent=1, received=1, rtts_ms=[1]), now=0)
+
+    stats = quality.stats(now=100 * 60)
+    assert set(stats) == {'1.1.1.1', '8.8.8.8'}
+    assert set(stats['1.1.1.1']) == {'1h', '1d', '7d'}
+    assert stats['1.1.1.1']['1d'].rtt_ms.count == 100
+    assert stats['1.1.1.1']['1h'].rtt_ms.count < 60
+    assert stats['1.1.1.1']['1d'].rtt_ms.p99 == pytest.approx(99, rel=0.02)
+    assert stats['8.8.8.8']['7d'].probes_sent == 0
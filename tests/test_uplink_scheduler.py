@@ -0,0 +1,144 @@
+import random
+
+import pytest
+
+from msu_manager.uplink.scheduler import CheckScheduler, UplinkState
+
+
+def create_scheduler(**kwargs):
+    args = dict(check_interval_s=10, min_check_interval_s=2, stable_check_interval_s=60, growth=2,
+                restore_backoff_s=30, restore_backoff_max_s=900, circuit_threshold=3, circuit_open_s=1800,
+                rng=random.Random(1))
+    args.update(kwargs)
+    return CheckScheduler(**args)
+
+
+def test_interval_grows_while_up_and_tightens_on_failure():
+    scheduler = create_scheduler()
+    intervals = []
+    for now in range(5):
+        scheduler.record_check(True, now)
+        intervals.append(scheduler.next_check_delay(now))
+    assert intervals == [10, 20, 40, 60, 60]
+    assert scheduler.state == UplinkState.UP
+
+    scheduler.record_check(False, 10)
+    assert scheduler.next_check_delay(10) == 2
+    assert scheduler.state == UplinkState.DOWN
+
+    scheduler.record_check(False, 12)
+    scheduler.record_check(False, 16)
+    scheduler.record_check(False, 24)
+    assert scheduler.next_check_delay(24) == 10
+
+
+def test_restore_backoff_with_jitter():
+    scheduler = create_scheduler(circuit_threshold=10)
+    scheduler.record_check(False, 0)
+    delays = []
+    now = 0
+    for attempt in range(1, 7):
+        assert scheduler.start_restore(now)
+        assert scheduler.state == UplinkState.RESTORING
+        scheduler.record_restore(False, now)
+        assert scheduler.state == UplinkState.BACKOFF
+        delay = scheduler.next_restore_delay(now)
+        base = min(900, 30 * 2 ** (attempt - 1))
+        assert base / 2 <= delay <= base
+        assert not scheduler.start_restore(now + delay - 0.1)
+        delays.append(delay)
+        now += delay
+    assert delays == sorted(delays)
+
+    # A successful check resets the backoff
+    scheduler.record_check(True, now)
+    assert scheduler.restore_attempts == 0
+    scheduler.record_check(False, now + 1)
+    assert scheduler.start_restore(now + 1)
+
+
+def test_restore_success_still_counts_until_check_succeeds():
+    scheduler = create_scheduler()
+    scheduler.record_check(False, 0)
+    assert scheduler.start_restore(0)
+    scheduler.record_restore(True, 0)
+    assert scheduler.restore_attempts == 1
+    assert not scheduler.start_restore(1)
+
+
+def test_circuit_breaker():
+    scheduler = create_scheduler()
+    scheduler.record_check(False, 0)
+    now = 0
+    for _ in range(3):
+        now += scheduler.next_restore_delay(now)
+        assert scheduler.start_restore(now)
+        scheduler.record_restore(False, now)
+    assert scheduler.state == UplinkState.CIRCUIT_OPEN
+
+    scheduler.record_check(False, now)
+    assert scheduler.state == UplinkState.CIRCUIT_OPEN
+    assert scheduler.circuit_open(now)
+    assert not scheduler.start_restore(now)
+
+    # Half-open: one attempt after the circuit timeout, then it opens again
+    now += scheduler.next_restore_delay(now)
+    assert not scheduler.circuit_open(now)
+    assert scheduler.start_restore(now)
+    scheduler.record_restore(False, now)
+    assert scheduler.circuit_open(now + 1)
+    assert scheduler.next_restore_delay(now) == 1800
+
+    status = scheduler.status(now)
+    assert status.state == UplinkState.CIRCUIT_OPEN
+    assert status.restore_attempts == 4
+    assert status.circuit_open_until == pytest.approx(status.next_restore_at)
+    assert [t.state for t in status.transitions][-2:] == [UplinkState.RESTORING, UplinkState.CIRCUIT_OPEN]
+
+    scheduler.record_check(True, now + 10)
+    assert not scheduler.circuit_open(now + 10)
+    assert scheduler.status(now + 10).circuit_open_until is None
+
+
+def test_probe_budget_postpones_checks():
+    # 86.4 kB/day = 1 byte/s, an hour's worth (3600 bytes) can be saved up
+    scheduler = create_scheduler(budget_bytes_per_day=86400)
+    scheduler.record_probe_bytes(1000, 0)
+    scheduler.record_check(True, 0)
+    assert scheduler.next_check_delay(0) == 10
+    scheduler.record_probe_bytes(1000, 10)
+    scheduler.record_check(True, 10)
+    scheduler.record_probe_bytes(1000, 30)
+    scheduler.record_check(True, 30)
+    # 3600 + 30 - 3000 = 630 left, the next check has to wait for 370 more bytes
+    assert scheduler.next_check_delay(30) == pytest.approx(370)
+    assert scheduler.status(30).probe_budget_remaining_bytes == pytest.approx(630)
+    assert scheduler.status(30).probe_bytes_total == 3000
+
+
+def test_probe_budget_charges_probes_finishing_after_the_verdict():
+    scheduler = create_scheduler(budget_bytes_per_day=86400)
+    scheduler.record_probe_bytes(1000, 0)
+    scheduler.record_check(True, 0)
+    # Probes the quorum did not wait for
+    scheduler.record_probe_bytes(1000, 1)
+    scheduler.record_probe_bytes(1000, 2)
+    assert scheduler.status(2).probe_budget_remaining_bytes == pytest.approx(3600 + 2 - 3000)
+    scheduler.record_probe_bytes(1000, 10)
+    scheduler.record_check(True, 10)
+    # 3600 + 10 - 4000 = -390 left and the last check cost 3000 bytes
+    assert scheduler.next_check_delay(10) == pytest.approx(3390)
+    assert scheduler.status(10).probe_bytes_total == 4000
+
+
+def test_status_reports_wall_clock_times():
+    scheduler = create_scheduler()
+    status = scheduler.status(100)
+    assert status.state == UplinkState.UNKNOWN
+    assert status.next_check_at is None
+    assert status.probe_budget_remaining_bytes is None
+
+    scheduler.record_check(True, 100)
+    status = scheduler.status(100)
+    assert status.next_check_at - status.last_check_at == pytest.approx(10)
+    assert status.transitions[0].state == UplinkState.UP